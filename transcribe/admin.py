@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Transcription, Screenshot, IPUploadCount, UUIDUploadCount
+from .models import Transcription, Screenshot, IPUploadCount, UUIDUploadCount, TranscriptionJob, TranscriptionWorker, Segment, ChunkedUpload
 
 
 class ScreenshotInline(admin.TabularInline):
@@ -16,7 +16,7 @@ class ScreenshotInline(admin.TabularInline):
     def preview_image(self, obj):
         if obj and obj.image_path:
             from django.conf import settings
-            url = f"{settings.MEDIA_URL}{obj.image_path}"
+            url = f"{settings.MEDIA_URL}{obj.preview_path}"
             return format_html('<img src="{}" style="max-width: 200px; max-height: 150px;" />', url)
         return "-"
     preview_image.short_description = "Превью"
@@ -229,10 +229,10 @@ class ScreenshotAdmin(admin.ModelAdmin):
     )
     list_filter = ('transcription', 'order', 'timestamp')
     search_fields = ('transcription__filename', 'image_path', 'transcription__upload_session')
-    readonly_fields = ('timestamp', 'order', 'image_path', 'preview_image', 'full_image', 'transcription_link')
+    readonly_fields = ('timestamp', 'order', 'image_path', 'image_hash', 'preview_image', 'full_image', 'transcription_link')
     fieldsets = (
         ('Основная информация', {
-            'fields': ('transcription_link', 'timestamp', 'order', 'image_path')
+            'fields': ('transcription_link', 'timestamp', 'order', 'image_path', 'image_hash')
         }),
         ('Изображение', {
             'fields': ('preview_image', 'full_image')
@@ -252,7 +252,7 @@ class ScreenshotAdmin(admin.ModelAdmin):
         """Превью изображения"""
         if obj and obj.image_path:
             from django.conf import settings
-            url = f"{settings.MEDIA_URL}{obj.image_path}"
+            url = f"{settings.MEDIA_URL}{obj.preview_path}"
             return format_html('<img src="{}" style="max-width: 200px; max-height: 150px; border: 1px solid #ddd; border-radius: 3px;" />', url)
         return "-"
     preview_image.short_description = "Превью"
@@ -265,3 +265,65 @@ class ScreenshotAdmin(admin.ModelAdmin):
             return format_html('<img src="{}" style="max-width: 800px; border: 1px solid #ddd; border-radius: 3px;" />', url)
         return "-"
     full_image.short_description = "Полное изображение"
+
+
+@admin.register(TranscriptionJob)
+class TranscriptionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'transcription_link', 'state', 'attempts', 'worker_id',
+        'created_at', 'started_at', 'finished_at', 'lease_expires_at'
+    )
+    list_filter = ('state', 'created_at')
+    search_fields = ('transcription__filename', 'worker_id', 'file_path')
+    readonly_fields = (
+        'transcription', 'file_path', 'attempts', 'worker_id', 'lease_expires_at',
+        'created_at', 'started_at', 'finished_at', 'last_error'
+    )
+    actions = ['requeue_jobs']
+
+    def transcription_link(self, obj):
+        """Ссылка на транскрипцию"""
+        url = reverse('admin:transcribe_transcription_change', args=[obj.transcription_id])
+        return format_html('<a href="{}">{}</a>', url, obj.transcription.filename)
+    transcription_link.short_description = "Транскрипция"
+
+    def requeue_jobs(self, request, queryset):
+        """Вернуть задачи в очередь"""
+        count = queryset.exclude(state='queued').update(
+            state='queued', attempts=0, worker_id=None, lease_expires_at=None, last_error=None
+        )
+        self.message_user(request, f'Возвращено в очередь: {count}')
+    requeue_jobs.short_description = "Вернуть в очередь"
+
+
+@admin.register(TranscriptionWorker)
+class TranscriptionWorkerAdmin(admin.ModelAdmin):
+    list_display = ('worker_id', 'ready', 'models_list', 'max_workers', 'started_at', 'last_seen')
+    list_filter = ('ready',)
+    readonly_fields = ('worker_id', 'ready', 'hot_models', 'max_workers', 'started_at', 'last_seen')
+
+    def models_list(self, obj):
+        """Загруженные модели"""
+        return ', '.join(model['name'] for model in obj.hot_models or []) or '-'
+    models_list.short_description = "Модели"
+
+
+@admin.register(Segment)
+class SegmentAdmin(admin.ModelAdmin):
+    list_display = ('transcription', 'start', 'end', 'text', 'avg_logprob')
+    search_fields = ('text',)
+    raw_id_fields = ('transcription',)
+    readonly_fields = ('transcription', 'start', 'end', 'text', 'avg_logprob', 'words')
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('upload_id', 'filename', 'progress', 'ip_address', 'transcription', 'created_at', 'updated_at')
+    search_fields = ('upload_id', 'filename', 'user_uuid', 'ip_address')
+    raw_id_fields = ('transcription',)
+    readonly_fields = ('upload_id', 'received', 'created_at', 'updated_at')
+
+    def progress(self, obj):
+        """Доля принятых байт"""
+        return f"{obj.received * 100 // obj.file_size if obj.file_size else 0}%"
+    progress.short_description = "Принято"
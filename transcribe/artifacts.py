@@ -0,0 +1,222 @@
+"""
+Готовые файлы для скачивания
+
+Архив скриншотов транскрипции и общий текст сессии загрузки собираются один
+раз - когда транскрипция (для сессии - последняя из ее транскрипций)
+завершается - и отдаются с диска с ETag и поддержкой Range. Если задан
+ARTIFACTS_ACCEL_REDIRECT, файл отдает nginx (X-Accel-Redirect), а Django только
+проверяет доступ. Перетранскрибация удаляет устаревшие файлы.
+
+Имена файлов - HMAC от ключа на SECRET_KEY: каталог может лежать внутри
+MEDIA_ROOT, но файл нельзя получить напрямую, не зная имени.
+"""
+import logging
+import os
+import re
+import tempfile
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import salted_hmac
+from .zip_stream import iter_zip
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = getattr(settings, 'ARTIFACTS_DIR', os.path.join(settings.MEDIA_ROOT, 'artifacts'))
+# Внутренний (internal) location nginx, указывающий на ARTIFACTS_DIR; None - файлы отдает Django
+ARTIFACTS_ACCEL_REDIRECT = getattr(settings, 'ARTIFACTS_ACCEL_REDIRECT', None)
+ARTIFACT_CHUNK_SIZE = 256 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def artifact_path(kind, key, ext):
+    """Путь к готовому файлу вида kind для ключа key"""
+    name = salted_hmac('transcribe.artifacts', f"{kind}:{key}").hexdigest()
+    return os.path.join(ARTIFACTS_DIR, kind, f"{name}{ext}")
+
+
+def screenshots_archive_path(transcription):
+    return artifact_path('screenshots', transcription.id, '.zip')
+
+
+def session_text_path(upload_session):
+    return artifact_path('sessions', upload_session, '.txt')
+
+
+def screenshot_file_path(screenshot):
+    """Путь к файлу скриншота на диске (None, если файл не найден)"""
+    # Пробуем разные варианты путей
+    possible_paths = [
+        os.path.join(settings.MEDIA_ROOT, screenshot.image_path),
+        screenshot.image_path,  # Если путь уже абсолютный
+        os.path.join(settings.MEDIA_ROOT, screenshot.image_path.lstrip('/')),
+    ]
+    for path in possible_paths:
+        if os.path.exists(path) and os.path.isfile(path):
+            return path
+    return None
+
+
+def screenshot_archive_entries(transcription):
+    """Пары (файл, имя в архиве) для скриншотов транскрипции; отсутствующие файлы пропускаются"""
+    entries = []
+    for screenshot in transcription.screenshots.all().order_by('order', 'timestamp'):
+        image_path = screenshot_file_path(screenshot)
+        if image_path:
+            entries.append((image_path, f"screenshot_{screenshot.order:04d}_{screenshot.timestamp:.0f}s.jpg"))
+    return entries
+
+
+def session_text(transcriptions):
+    """Общий текст транскрипций сессии"""
+    all_texts = []
+    for transcription in transcriptions:
+        if transcription.transcribed_text:
+            all_texts.append(f"=== {transcription.filename} ===\n{transcription.transcribed_text}\n\n")
+    return "\n".join(all_texts)
+
+
+def write_artifact(path, chunks):
+    """Записать файл атомарно: читатели видят либо старую, либо новую версию целиком"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(path, settings.FILE_UPLOAD_PERMISSIONS)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def build_completion_artifacts(transcription):
+    """
+    Собрать готовые файлы после завершения транскрипции
+
+    Архив скриншотов собирается, если скриншоты есть; общий текст сессии - если
+    в сессии не осталось транскрипций в очереди или в обработке. Ошибка сборки
+    не влияет на результат транскрипции: файл тогда собирается при скачивании.
+    """
+    from .models import Transcription
+
+    try:
+        entries = screenshot_archive_entries(transcription)
+        if entries:
+            write_artifact(screenshots_archive_path(transcription), iter_zip(entries))
+
+        session = transcription.upload_session
+        if session:
+            transcriptions = Transcription.objects.filter(upload_session=session).order_by('uploaded_at')
+            if not transcriptions.filter(status__in=['pending', 'processing']).exists():
+                text = session_text(transcriptions)
+                write_artifact(session_text_path(session), [text.encode('utf-8')])
+    except Exception as e:
+        logger.error(f"Не удалось собрать файлы для скачивания транскрипции {transcription.id}: {e}", exc_info=True)
+
+
+def invalidate_artifacts(transcription):
+    """Удалить готовые файлы транскрипции и ее сессии"""
+    paths = [screenshots_archive_path(transcription)]
+    if transcription.upload_session:
+        paths.append(session_text_path(transcription.upload_session))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def serve_artifact(request, path, filename, content_type):
+    """
+    Отдать готовый файл с ETag и поддержкой Range
+
+    Returns:
+        HttpResponse или None, если файла нет
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    disposition = f'attachment; filename="{filename}"'
+
+    if ARTIFACTS_ACCEL_REDIRECT:
+        # nginx сам отдает файл, обрабатывает Range и If-None-Match
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = ARTIFACTS_ACCEL_REDIRECT.rstrip('/') + '/' + os.path.relpath(path, ARTIFACTS_DIR)
+        response['Content-Disposition'] = disposition
+        response['ETag'] = etag
+        return response
+
+    conditional = get_conditional_response(request, etag=etag)
+    if conditional is not None:
+        return conditional
+
+    size = stat.st_size
+    byte_range = _requested_range(request, etag, size)
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    response['Content-Disposition'] = disposition
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _requested_range(request, etag, size):
+    """
+    Запрошенный диапазон байт
+
+    Returns:
+        tuple: (начало, конец включительно); None - отдать файл целиком;
+        'invalid' - диапазон вне файла
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    # If-Range с другим ETag: файл изменился, отдаем целиком
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Несколько диапазонов и другие единицы не поддерживаются
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)  # Последние N байт
+        end = size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(ARTIFACT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
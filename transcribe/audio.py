@@ -0,0 +1,426 @@
+"""
+Работа с аудио: поиск ffmpeg и быстрое декодирование фрагментов для Whisper
+"""
+import logging
+import os
+import shutil
+import subprocess
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000  # Частота дискретизации, которую ожидает Whisper
+
+# Время на извлечение аудио через ffmpeg: не меньше минимума и пропорционально длине записи
+EXTRACT_AUDIO_MIN_TIMEOUT = getattr(settings, 'EXTRACT_AUDIO_MIN_TIMEOUT', 300)
+EXTRACT_AUDIO_TIMEOUT_RATIO = getattr(settings, 'EXTRACT_AUDIO_TIMEOUT_RATIO', 0.5)  # Секунд на секунду записи
+EXTRACT_AUDIO_STALL_TIMEOUT = getattr(settings, 'EXTRACT_AUDIO_STALL_TIMEOUT', 120)  # Без прогресса - ffmpeg завис
+
+# Длительность начала записи для определения языка (сек)
+LANGUAGE_DETECTION_SECONDS = getattr(settings, 'LANGUAGE_DETECTION_SECONDS', 30)
+# Модель для определения языка (None - модель, выбранная для транскрипции)
+LANGUAGE_DETECTION_MODEL = getattr(settings, 'LANGUAGE_DETECTION_MODEL', None)
+
+
+def find_ffmpeg():
+    """Найти исполняемый файл ffmpeg"""
+    ffmpeg_path = shutil.which('ffmpeg')
+    if not ffmpeg_path:
+        # Пробуем стандартные пути
+        possible_paths = ['/usr/bin/ffmpeg', '/usr/local/bin/ffmpeg', '/bin/ffmpeg']
+        for path in possible_paths:
+            if os.path.exists(path):
+                ffmpeg_path = path
+                break
+
+    if not ffmpeg_path:
+        raise Exception("ffmpeg не найден. Убедитесь, что ffmpeg установлен.")
+    return ffmpeg_path
+
+
+def decode_audio_prefix(input_path, seconds=LANGUAGE_DETECTION_SECONDS, timeout=60):
+    """
+    Декодировать первые seconds секунд аудио в массив float32 16 кГц моно
+
+    Декодирование останавливается, как только набрано нужное количество
+    отсчетов, поэтому время не зависит от длины записи. Если PyAV не
+    справился с файлом, используется ffmpeg.
+    """
+    import numpy as np
+
+    limit = int(seconds * SAMPLING_RATE)
+    try:
+        parts = []
+        size = 0
+        for samples, _ in iter_audio_chunks(input_path):
+            parts.append(samples)
+            size += len(samples)
+            if size >= limit:
+                break
+        return np.concatenate(parts)[:limit] if parts else np.array([], dtype=np.float32)
+    except Exception as e:
+        logger.warning(f"PyAV не смог декодировать начало {input_path}: {e}, используем ffmpeg")
+        return _decode_audio_prefix_ffmpeg(input_path, seconds, timeout)
+
+
+def _decode_audio_prefix_ffmpeg(input_path, seconds, timeout):
+    """Декодировать начало записи через ffmpeg (отдает PCM в pipe, без промежуточного WAV)"""
+    import numpy as np
+
+    cmd = [
+        find_ffmpeg(),
+        '-t', str(seconds),  # Только начало записи (до декодирования)
+        '-i', input_path,
+        '-vn',  # Без видео
+        '-ac', '1',  # Моно
+        '-ar', str(SAMPLING_RATE),
+        '-f', 'f32le',  # Сырые float32 в stdout
+        '-loglevel', 'error',
+        'pipe:1'
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise Exception("Превышено время ожидания при декодировании начала аудио")
+
+    if result.returncode != 0:
+        error_msg = result.stderr.decode('utf-8', errors='ignore')
+        raise Exception(f"Ошибка при декодировании начала аудио: {error_msg[:200]}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def extraction_deadline(duration):
+    """Предельное время извлечения аудио для записи длительностью duration секунд"""
+    if not duration:
+        return None  # Длительность неизвестна - ограничиваемся контролем зависания
+    return max(EXTRACT_AUDIO_MIN_TIMEOUT, duration * EXTRACT_AUDIO_TIMEOUT_RATIO)
+
+
+def run_ffmpeg_with_progress(cmd, progress_callback=None, deadline=None, stall_timeout=EXTRACT_AUDIO_STALL_TIMEOUT):
+    """
+    Запустить ffmpeg с -progress и следить за ходом выполнения
+
+    ffmpeg останавливается, если превышено время deadline или если он
+    stall_timeout секунд не сообщает о прогрессе.
+
+    Args:
+        cmd: Команда ffmpeg (без -progress, он добавляется здесь)
+        progress_callback: Вызывается с позицией обработки в секундах
+
+    Returns:
+        tuple: (код возврата, stderr)
+
+    Raises:
+        subprocess.TimeoutExpired: если ffmpeg остановлен по времени
+    """
+    import tempfile
+    import threading
+
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+    started = time.monotonic()
+    state = {'last_progress': started, 'killed': None}
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        finished = threading.Event()
+
+        def watchdog():
+            while not finished.wait(1):
+                now = time.monotonic()
+                if deadline and now - started > deadline:
+                    state['killed'] = f"превышено время {deadline:.0f} с"
+                elif stall_timeout and now - state['last_progress'] > stall_timeout:
+                    state['killed'] = f"нет прогресса {stall_timeout} с"
+                else:
+                    continue
+                process.kill()
+                return
+
+        watcher = threading.Thread(target=watchdog, name="ffmpeg-watchdog", daemon=True)
+        watcher.start()
+        try:
+            for raw_line in process.stdout:
+                key, _, value = raw_line.decode('utf-8', errors='ignore').strip().partition('=')
+                # out_time_ms в ffmpeg тоже в микросекундах
+                if key in ('out_time_us', 'out_time_ms') and value.lstrip('-').isdigit():
+                    state['last_progress'] = time.monotonic()
+                    if progress_callback is not None:
+                        progress_callback(max(0, int(value)) / 1_000_000)
+            returncode = process.wait()
+        finally:
+            finished.set()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if state['killed']:
+            raise subprocess.TimeoutExpired(cmd, deadline or stall_timeout, output=state['killed'])
+        stderr_file.seek(0)
+        return returncode, stderr_file.read()
+
+
+def detect_language(model, audio):
+    """
+    Определить язык по фрагменту аудио без полной транскрибации
+
+    Returns:
+        tuple: (язык, вероятность)
+    """
+    language, probability, _ = model.detect_language(audio=audio)
+    return language, probability
+
+
+# Параметры VAD (Silero): мягкие пороги, чтобы не отрезать тихую речь
+TRANSCRIBE_VAD_PARAMETERS = getattr(settings, 'TRANSCRIBE_VAD_PARAMETERS', {
+    'threshold': 0.3,
+    'min_silence_duration_ms': 100,
+    'speech_pad_ms': 400,
+})
+# Если речь занимает большую часть записи, декодируем запись целиком без склейки
+TRANSCRIBE_VAD_FULL_DECODE_RATIO = getattr(settings, 'TRANSCRIBE_VAD_FULL_DECODE_RATIO', 0.9)
+
+# Параллельная транскрибация длинных записей: запись делится по паузам на части,
+# части декодируются одновременно копиями модели (WhisperModel num_workers)
+TRANSCRIBE_PARALLEL_CHUNKS = getattr(settings, 'TRANSCRIBE_PARALLEL_CHUNKS', 1)
+TRANSCRIBE_CHUNK_SECONDS = getattr(settings, 'TRANSCRIBE_CHUNK_SECONDS', 300)
+TRANSCRIBE_PARALLEL_MIN_SECONDS = getattr(settings, 'TRANSCRIBE_PARALLEL_MIN_SECONDS', 600)
+
+
+class ProgressReporter:
+    """
+    Пересчитывает позицию в записи в проценты и передает их не чаще interval секунд
+
+    Используется, чтобы не писать прогресс в БД на каждый аудио кадр.
+    """
+
+    def __init__(self, duration, callback, interval=1.0):
+        self.duration = duration
+        self.callback = callback
+        self.interval = interval
+        self._last_time = 0.0
+        self._last_percent = None
+
+    def __call__(self, position):
+        if not self.duration:
+            return
+        percent = max(0, min(99, int(position * 100 / self.duration)))
+        now = time.monotonic()
+        if percent != self._last_percent and now - self._last_time >= self.interval:
+            self._last_time = now
+            self._last_percent = percent
+            self.callback(percent)
+
+
+def iter_audio_chunks(input_path):
+    """
+    Потоково декодировать аудио дорожку файла (PyAV)
+
+    Берется только первая аудио дорожка (видео и субтитры игнорируются),
+    кадры сразу пересэмплируются в 16 кГц моно float32 (через s16, как
+    faster_whisper.decode_audio, чтобы уровень сигнала совпадал).
+
+    Yields:
+        tuple: (массив float32, позиция в исходном файле в секундах или None)
+    """
+    import av
+    import numpy as np
+
+    with av.open(input_path, metadata_errors='ignore') as container:
+        if not container.streams.audio:
+            raise Exception("В файле нет аудио дорожки")
+        stream = container.streams.audio[0]
+        resampler = av.audio.resampler.AudioResampler(format='s16', layout='mono', rate=SAMPLING_RATE)
+        for frame in container.decode(stream):
+            position = float(frame.pts * frame.time_base) if frame.pts is not None and frame.time_base else None
+            for resampled in resampler.resample(frame):
+                yield resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0, position
+        # Остаток из буфера пересэмплера
+        for resampled in resampler.resample(None):
+            yield resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0, None
+
+
+def probe_duration(input_path):
+    """Длительность медиафайла в секундах (None если неизвестна)"""
+    import av
+
+    try:
+        with av.open(input_path, metadata_errors='ignore') as container:
+            if container.duration:
+                return container.duration / av.time_base
+            if container.streams.audio:
+                stream = container.streams.audio[0]
+                if stream.duration and stream.time_base:
+                    return float(stream.duration * stream.time_base)
+    except Exception as e:
+        logger.warning(f"Не удалось определить длительность {input_path}: {e}")
+    return None
+
+
+def decode_media_audio(input_path, duration=None, progress_callback=None):
+    """
+    Декодировать аудио дорожку файла прямо в память (без временного WAV и ffmpeg)
+
+    Буфер выделяется сразу под ожидаемую длительность и растет при необходимости,
+    поэтому пиковая память - одна копия аудио (~230 МБ на час записи).
+
+    Args:
+        duration: Длительность записи, если уже известна (иначе определяется)
+        progress_callback: Вызывается с числом декодированных секунд записи
+
+    Returns:
+        numpy.ndarray: float32 16 кГц моно
+    """
+    import numpy as np
+
+    if duration is None:
+        duration = probe_duration(input_path)
+    capacity = int((duration or 60) * SAMPLING_RATE) + SAMPLING_RATE
+    buffer = np.empty(capacity, dtype=np.float32)
+    size = 0
+    for samples, position in iter_audio_chunks(input_path):
+        if progress_callback is not None and position is not None:
+            progress_callback(position)
+        if size + len(samples) > len(buffer):
+            grown = np.empty(max(len(buffer) * 2, size + len(samples)), dtype=np.float32)
+            grown[:size] = buffer[:size]
+            buffer = grown
+        buffer[size:size + len(samples)] = samples
+        size += len(samples)
+    return buffer[:size]
+
+
+def load_audio(audio_path):
+    """Загрузить аудио файл в массив float32 16 кГц моно"""
+    from faster_whisper import decode_audio
+
+    return decode_audio(audio_path, sampling_rate=SAMPLING_RATE)
+
+
+def analyze_speech(audio, vad_parameters=None, parallel_chunks=None):
+    """
+    Найти участки речи в записи (один проход Silero VAD)
+
+    Returns:
+        dict: speech_chunks (участки в отсчетах), speech_seconds, total_seconds,
+              windows (части для параллельной транскрибации),
+              strategy - 'silence' (речи нет), 'parallel' (длинная запись,
+              части декодируются одновременно), 'full' (почти вся запись - речь)
+              или 'speech_only' (декодировать только участки речи)
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    if parallel_chunks is None:
+        parallel_chunks = TRANSCRIBE_PARALLEL_CHUNKS
+    options = VadOptions(**(vad_parameters if vad_parameters is not None else TRANSCRIBE_VAD_PARAMETERS))
+    speech_chunks = get_speech_timestamps(audio, options, sampling_rate=SAMPLING_RATE)
+    total_seconds = len(audio) / SAMPLING_RATE
+    speech_seconds = sum(chunk['end'] - chunk['start'] for chunk in speech_chunks) / SAMPLING_RATE
+
+    windows = []
+    if parallel_chunks > 1 and speech_seconds >= TRANSCRIBE_PARALLEL_MIN_SECONDS:
+        windows = plan_chunks(speech_chunks)
+
+    if not speech_chunks:
+        strategy = 'silence'
+    elif len(windows) > 1:
+        strategy = 'parallel'
+    elif total_seconds and speech_seconds / total_seconds >= TRANSCRIBE_VAD_FULL_DECODE_RATIO:
+        strategy = 'full'
+    else:
+        strategy = 'speech_only'
+    return {
+        'speech_chunks': speech_chunks,
+        'speech_seconds': speech_seconds,
+        'total_seconds': total_seconds,
+        'windows': windows,
+        'strategy': strategy,
+    }
+
+
+def transcribe_speech(model, audio, speech_chunks, **kwargs):
+    """
+    Транскрибировать только участки речи одним проходом декодера
+
+    Участки склеиваются в один массив, а время сегментов возвращается
+    к исходной шкале записи.
+
+    Returns:
+        tuple: (итератор сегментов, info)
+    """
+    import numpy as np
+    from faster_whisper.transcribe import restore_speech_timestamps
+    from faster_whisper.vad import collect_chunks
+
+    audio_chunks, _ = collect_chunks(audio, speech_chunks, sampling_rate=SAMPLING_RATE)
+    speech_audio = np.concatenate(audio_chunks)
+    segments, info = model.transcribe(speech_audio, vad_filter=False, **kwargs)
+    return restore_speech_timestamps(segments, speech_chunks, SAMPLING_RATE), info
+
+
+def plan_chunks(speech_chunks, chunk_seconds=TRANSCRIBE_CHUNK_SECONDS):
+    """
+    Сгруппировать участки речи в части примерно по chunk_seconds секунд речи
+
+    Границы частей проходят только по паузам между участками речи,
+    поэтому слова не разрезаются.
+
+    Returns:
+        list: Списки участков речи для каждой части
+    """
+    limit = chunk_seconds * SAMPLING_RATE
+    windows = []
+    current = []
+    current_length = 0
+    for chunk in speech_chunks:
+        length = chunk['end'] - chunk['start']
+        if current and current_length + length > limit:
+            windows.append(current)
+            current = []
+            current_length = 0
+        current.append(chunk)
+        current_length += length
+    if current:
+        windows.append(current)
+    return windows
+
+
+def transcribe_chunks_parallel(model, audio, windows, workers=TRANSCRIBE_PARALLEL_CHUNKS, **kwargs):
+    """
+    Транскрибировать части записи одновременно и склеить сегменты
+
+    Время сегментов каждой части восстанавливается по абсолютным позициям
+    участков речи, поэтому склейка сохраняет глобальную шкалу времени.
+    Сегменты части отдаются, как только декодированы она и все части до нее,
+    поэтому контрольные точки пишутся по ходу декодирования, а не в конце.
+
+    Returns:
+        tuple: (итератор сегментов по порядку, info первой части)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # info первой части нужен сразу (язык); декодирование ленивое и идет в пуле
+    first_segments, info = transcribe_speech(model, audio, windows[0], **kwargs)
+
+    def run(window):
+        segments, _ = transcribe_speech(model, audio, window, **kwargs)
+        return list(segments)
+
+    def generate():
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='transcribe-chunk')
+        try:
+            futures = [pool.submit(list, first_segments)]
+            futures += [pool.submit(run, window) for window in windows[1:]]
+            segment_id = 0
+            while futures:
+                # Отданные части не держим в памяти
+                window_segments = futures.pop(0).result()
+                for segment in window_segments:
+                    segment_id += 1
+                    segment.id = segment_id
+                    yield segment
+        finally:
+            # Чтение прервано (ошибка, пауза для подтверждения языка) - оставшиеся части не декодируем
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return generate(), info
@@ -0,0 +1,216 @@
+"""
+Пакетная транскрибация коротких записей
+
+Короткие записи (голосовые сообщения и т.п.) по отдельности плохо загружают
+CPU: каждая платит накладные расходы отдельного вызова декодера. Пакетировщик
+собирает участки речи одновременно обрабатываемых задач с одной моделью,
+языком и параметрами декодирования и декодирует их одним вызовом
+BatchedInferencePipeline.
+
+Первая задача в пакете становится ведущей: ждет попутчиков не дольше
+TRANSCRIBE_BATCH_MAX_WAIT секунд (или пока пакет не заполнится), выполняет
+пакет и раздает сегменты остальным задачам.
+"""
+import dataclasses
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_BATCHING = getattr(settings, 'TRANSCRIBE_BATCHING', True)
+# Записи с большим объемом речи декодируются обычным способом
+TRANSCRIBE_BATCH_MAX_SECONDS = getattr(settings, 'TRANSCRIBE_BATCH_MAX_SECONDS', 120)
+# Максимум участков (до 30 с) в одном пакете
+TRANSCRIBE_BATCH_MAX_SIZE = getattr(settings, 'TRANSCRIBE_BATCH_MAX_SIZE', 16)
+# Сколько ведущая задача ждет попутчиков (сек)
+TRANSCRIBE_BATCH_MAX_WAIT = getattr(settings, 'TRANSCRIBE_BATCH_MAX_WAIT', 0.5)
+
+SAMPLING_RATE = 16000
+CLIP_MAX_SAMPLES = 30 * SAMPLING_RATE  # Whisper декодирует окна не длиннее 30 секунд
+
+
+def split_clips(speech_chunks, max_samples=CLIP_MAX_SAMPLES):
+    """Разбить участки речи на клипы не длиннее окна Whisper"""
+    clips = []
+    for chunk in speech_chunks:
+        start = chunk['start']
+        while start < chunk['end']:
+            end = min(chunk['end'], start + max_samples)
+            clips.append({'start': start, 'end': end})
+            start = end
+    return clips
+
+
+class _BatchRequest:
+    def __init__(self, model, audio, clips, options):
+        self.model = model
+        self.audio = audio
+        self.clips = clips
+        self.options = options
+        self.segments = []
+        self.info = None
+        self.error = None
+        self.batch_jobs = 0
+        self.done = threading.Event()
+
+
+def options_key(options):
+    """Хешируемый ключ параметров декодирования (значения могут быть списками)"""
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+class InferenceBatcher:
+    """Собирает участки речи разных задач в пакеты по (модель, язык, параметры декодирования)"""
+
+    def __init__(self, max_batch_size=TRANSCRIBE_BATCH_MAX_SIZE, max_wait=TRANSCRIBE_BATCH_MAX_WAIT,
+                 pipeline_factory=None):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait
+        self.pipeline_factory = pipeline_factory or _make_pipeline
+        self._pending = {}  # (модель, язык, параметры) -> список запросов
+        self._condition = threading.Condition()
+        self.batches = 0
+        self.batched_jobs = 0
+
+    def transcribe(self, model_name, model, audio, speech_chunks, language, **options):
+        """
+        Транскрибировать участки речи записи в составе пакета
+
+        Returns:
+            tuple: (список сегментов со временем исходной записи, info, число задач в пакете)
+        """
+        request = _BatchRequest(model, audio, split_clips(speech_chunks), options)
+        # Пакет декодируется с параметрами ведущей задачи - в него попадают только
+        # задачи с теми же параметрами
+        key = (model_name, language, options_key(options))
+
+        with self._condition:
+            queue = self._pending.setdefault(key, [])
+            queue.append(request)
+            leader = len(queue) == 1
+            self._condition.notify_all()
+
+        if leader:
+            self._run(self._collect(key), language)
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+        return request.segments, request.info, request.batch_jobs
+
+    def _collect(self, key):
+        """Дождаться попутчиков и забрать пакет из очереди"""
+        deadline = time.monotonic() + self.max_wait
+        with self._condition:
+            while True:
+                queue = self._pending[key]
+                if sum(len(request.clips) for request in queue) >= self.max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # Берем запросы целиком, пока пакет не заполнится (первый берется всегда)
+            batch = []
+            clips = 0
+            while queue and (not batch or clips + len(queue[0].clips) <= self.max_batch_size):
+                request = queue.pop(0)
+                batch.append(request)
+                clips += len(request.clips)
+            if not queue:
+                del self._pending[key]
+            else:
+                # Оставшиеся ждут следующего пакета - ведущим становится первый из них
+                threading.Thread(target=self._lead_next, args=(key,), daemon=True).start()
+            return batch
+
+    def _lead_next(self, key):
+        self._run(self._collect(key), key[1])
+
+    def _run(self, batch, language):
+        """Декодировать пакет и раздать сегменты задачам"""
+        import numpy as np
+
+        # Склеиваем клипы всех задач в одну запись: (задача, начало в склейке, начало в исходной записи)
+        parts = []
+        placement = []
+        position = 0
+        for request in batch:
+            for clip in request.clips:
+                length = clip['end'] - clip['start']
+                parts.append(request.audio[clip['start']:clip['end']])
+                placement.append((request, position, position + length, clip['start']))
+                position += length
+
+        try:
+            pipeline = self.pipeline_factory(batch[0].model)
+            segments, info = pipeline.transcribe(
+                np.concatenate(parts),
+                language=language,
+                clip_timestamps=[
+                    {'start': start / SAMPLING_RATE, 'end': end / SAMPLING_RATE}
+                    for _, start, end, _ in placement
+                ],
+                batch_size=self.max_batch_size,
+                vad_filter=False,
+                **batch[0].options
+            )
+            for segment in segments:
+                start_sample = int(round(segment.start * SAMPLING_RATE))
+                request, clip_start, clip_end, original_start = next(
+                    (item for item in placement if item[1] <= start_sample < item[2]),
+                    placement[-1]
+                )
+                offset = (original_start - clip_start) / SAMPLING_RATE
+                segment.start += offset
+                segment.end += offset
+                segment.id = len(request.segments) + 1
+                request.segments.append(segment)
+
+            for request in batch:
+                request.info = dataclasses.replace(info, duration=len(request.audio) / SAMPLING_RATE) \
+                    if dataclasses.is_dataclass(info) else info
+                request.batch_jobs = len(batch)
+            with self._condition:
+                self.batches += 1
+                self.batched_jobs += len(batch)
+            logger.info(f"Пакет декодирован: задач {len(batch)}, клипов {len(placement)}, {position / SAMPLING_RATE:.1f} с речи")
+        except Exception as e:
+            logger.error(f"Ошибка пакетной транскрибации: {e}", exc_info=True)
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'batches': self.batches,
+                'batched_jobs': self.batched_jobs,
+                'waiting': sum(len(queue) for queue in self._pending.values()),
+            }
+
+
+def _make_pipeline(model):
+    from faster_whisper import BatchedInferencePipeline
+
+    return BatchedInferencePipeline(model=model)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Общий пакетировщик процесса"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = InferenceBatcher()
+    return _batcher
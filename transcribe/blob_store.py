@@ -0,0 +1,181 @@
+"""
+Хранилище загруженных файлов по содержимому
+
+Файл хешируется (SHA-256) прямо во время записи на диск и сохраняется как
+BLOB_STORE_DIR/<2 первых символа хеша>/<хеш><расширение>. Одна и та же запись,
+загруженная разными пользователями, хранится на диске один раз - транскрипции
+ссылаются на общий файл через original_file_path.
+
+Большие загрузки BlobUploadHandler пишет сразу во временный файл внутри
+хранилища и хеширует по мере приема, поэтому после запроса файл не
+перечитывается и не копируется, а только переименовывается (os.replace в
+пределах одной файловой системы).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIR = getattr(settings, 'BLOB_STORE_DIR', os.path.join(settings.MEDIA_ROOT, 'blobs'))
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(digest, ext=''):
+    """Путь к файлу с заданным хешем содержимого"""
+    return os.path.join(BLOB_STORE_DIR, digest[:2], f"{digest}{ext.lower()}")
+
+
+def is_blob(path):
+    """Лежит ли файл в хранилище (может быть общим для нескольких транскрипций)"""
+    return bool(path) and os.path.abspath(path).startswith(os.path.abspath(BLOB_STORE_DIR) + os.sep)
+
+
+def store_chunks(chunks, ext=''):
+    """
+    Записать поток в хранилище, вычисляя хеш по ходу записи
+
+    Данные пишутся во временный файл внутри хранилища и затем переименовываются
+    в путь по хешу; если такой файл уже есть, копия удаляется.
+
+    Returns:
+        tuple: (путь, sha256 hex, размер в байтах, создан ли новый файл)
+    """
+    os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=BLOB_STORE_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        digest = hasher.hexdigest()
+        path, created = _publish(temp_path, digest, size, ext)
+        if not created:
+            os.remove(temp_path)
+        return path, digest, size, created
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def store_file(source_path, ext=None):
+    """Скопировать файл в хранилище (см. store_chunks)"""
+    if ext is None:
+        ext = os.path.splitext(source_path)[1]
+
+    def read_chunks():
+        with open(source_path, 'rb') as f:
+            while True:
+                chunk = f.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    return store_chunks(read_chunks(), ext)
+
+
+def file_digest(path):
+    """SHA-256 файла (hex) одним проходом"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(BLOB_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def store_part_file(path, digest, ext=''):
+    """
+    Перенести собранный на диске файл (загрузка по частям) в хранилище
+
+    Хеш посчитан заранее (file_digest), сам файл не копируется, а
+    переименовывается; если такой файл уже есть, собранная копия удаляется.
+
+    Returns:
+        tuple: (путь, создан ли новый файл)
+    """
+    stored_path, created = _publish(path, digest, os.path.getsize(path), ext)
+    if not created:
+        os.remove(path)
+    return stored_path, created
+
+
+def store_uploaded_file(uploaded_file, ext=''):
+    """
+    Переместить принятый BlobUploadHandler файл в хранилище без копирования
+
+    Returns:
+        tuple: (путь, sha256 hex, размер в байтах, создан ли новый файл)
+    """
+    uploaded_file.file.flush()
+    path, created = _publish(uploaded_file.temporary_file_path(), uploaded_file.content_hash, uploaded_file.size, ext)
+    # Если файл уже был в хранилище, временная копия удалится при закрытии загрузки
+    return path, uploaded_file.content_hash, uploaded_file.size, created
+
+
+def _publish(temp_path, digest, size, ext):
+    """Переименовать временный файл в путь по хешу, если такого файла еще нет"""
+    path = blob_path(digest, ext)
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        logger.info(f"Файл уже есть в хранилище: {path}, повторно не сохраняется")
+        return path, False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(path, settings.FILE_UPLOAD_PERMISSIONS)
+    return path, True
+
+
+class BlobUploadedFile(TemporaryUploadedFile):
+    """Загрузка во временном файле внутри хранилища с хешем содержимого"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=BLOB_STORE_DIR)
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.content_hash = None
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки: пишет файл в хранилище и считает SHA-256 по мере приема
+
+    Ставится после MemoryFileUploadHandler - маленькие файлы остаются в памяти.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = BlobUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            temp_location = self.file.temporary_file_path()
+            try:
+                self.file.close()
+                os.remove(temp_location)
+            except FileNotFoundError:
+                pass
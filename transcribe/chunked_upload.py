@@ -0,0 +1,137 @@
+"""
+Возобновляемая загрузка больших файлов по частям
+
+Протокол:
+    1. POST /upload/chunked/ - начать загрузку (имя, размер, параметры транскрибации)
+    2. PUT /upload/chunked/<id>/?offset=N - часть файла с позиции N (тело запроса -
+       байты части, заголовок X-Chunk-SHA256 - необязательная контрольная сумма)
+    3. GET /upload/chunked/<id>/ - сколько байт уже принято (для продолжения после обрыва)
+    4. POST /upload/chunked/<id>/complete/ - проверить файл, перенести в хранилище и
+       поставить транскрибацию в очередь
+
+Принятые байты пишутся в файл части внутри хранилища загрузок, поэтому
+завершение - это один проход для хеша и переименование без копирования.
+Каждая часть - отдельный короткий запрос: веб-обработчик не занят на все
+время загрузки, а оборванная загрузка продолжается с последней принятой части.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .blob_store import BLOB_STORE_DIR, blob_path, file_digest, store_part_file
+from .models import ChunkedUpload
+
+logger = logging.getLogger(__name__)
+
+# Рекомендуемый и максимальный размер одной части (байт)
+CHUNKED_UPLOAD_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024)
+# Файлы больше этого размера интерфейс загружает по частям
+CHUNKED_UPLOAD_THRESHOLD = getattr(settings, 'CHUNKED_UPLOAD_THRESHOLD', 100 * 1024 * 1024)
+# Незавершенные загрузки без новых частей дольше этого срока удаляются (часы)
+CHUNKED_UPLOAD_EXPIRE_HOURS = getattr(settings, 'CHUNKED_UPLOAD_EXPIRE_HOURS', 24)
+
+PARTS_DIR = os.path.join(BLOB_STORE_DIR, 'parts')
+
+
+class ChunkError(Exception):
+    """Часть отклонена; status - HTTP-код ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload):
+    return os.path.join(PARTS_DIR, f"{upload.upload_id}.part")
+
+
+def upload_ext(upload):
+    return os.path.splitext(upload.filename)[1]
+
+
+def write_chunk(upload, offset, data, checksum=None):
+    """
+    Записать часть файла с позиции offset
+
+    Позиция не может быть дальше уже принятых байт (иначе в файле будет дыра);
+    повторная отправка уже принятой части допустима.
+
+    Returns:
+        int: Сколько байт файла принято
+    """
+    if upload.transcription_id:
+        raise ChunkError("Загрузка уже завершена", status=409)
+    if offset < 0 or offset > upload.received:
+        raise ChunkError(f"Неверная позиция части: {offset}, принято {upload.received}", status=409)
+    if offset + len(data) > upload.file_size:
+        raise ChunkError("Часть выходит за размер файла")
+    if checksum and hashlib.sha256(data).hexdigest() != checksum.lower():
+        raise ChunkError("Контрольная сумма части не совпадает")
+
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    path = part_path(upload)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(offset)
+        f.write(data)
+
+    ChunkedUpload.objects.filter(pk=upload.pk).update(
+        received=Greatest(F('received'), offset + len(data)), updated_at=timezone.now()
+    )
+    upload.refresh_from_db(fields=['received'])
+    return upload.received
+
+
+def verify_upload(upload, checksum=None):
+    """
+    Проверить принятый файл, не перенося его в хранилище
+
+    Returns:
+        tuple: (путь файла в хранилище, sha256 hex, размер в байтах)
+    """
+    if upload.received != upload.file_size:
+        raise ChunkError(f"Файл принят не полностью: {upload.received} из {upload.file_size} байт", status=409)
+    path = part_path(upload)
+    if not os.path.exists(path) or os.path.getsize(path) != upload.file_size:
+        raise ChunkError("Файл части не найден или поврежден", status=409)
+
+    digest = file_digest(path)
+    if checksum and digest != checksum.lower():
+        raise ChunkError(f"Контрольная сумма файла не совпадает: {digest}")
+    return blob_path(digest, upload_ext(upload)), digest, upload.file_size
+
+
+def finish_upload(upload, digest):
+    """
+    Перенести проверенный verify_upload файл в хранилище
+
+    Вызывается после фиксации транзакции с транскрипцией: при откате файл
+    части остается на месте, и загрузку можно завершить повторно.
+
+    Returns:
+        tuple: (путь, создан ли новый файл)
+    """
+    return store_part_file(part_path(upload), digest, upload_ext(upload))
+
+
+def purge_expired_uploads():
+    """Удалить незавершенные загрузки, по которым давно не было частей"""
+    expired = ChunkedUpload.objects.filter(
+        transcription__isnull=True,
+        updated_at__lt=timezone.now() - timedelta(hours=CHUNKED_UPLOAD_EXPIRE_HOURS),
+    )
+    count = 0
+    for upload in expired:
+        try:
+            os.remove(part_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
+        count += 1
+    if count:
+        logger.info(f"Удалено незавершенных загрузок по частям: {count}")
+    return count
@@ -0,0 +1,561 @@
+"""
+Очередь задач транскрибации
+
+Задачи хранятся в БД (TranscriptionJob) и переживают перезапуск процессов.
+Обработчик захватывает задачу с арендой (lease) и периодически её продлевает;
+если процесс умер, аренда истекает и задачу подхватывает другой обработчик.
+
+Режимы выполнения (TRANSCRIBE_EXECUTION_MODE):
+    thread   - пул потоков внутри веб-процесса (запускается из wsgi.py, только
+               в одном веб-процессе хоста - см. start_inprocess_workers)
+    process  - веб-процесс запускает отдельные процессы-обработчики
+               (см. worker_processes.py), модели живут только в них
+    external - веб-процесс только ставит задачи, обрабатывает их
+               отдельная команда `manage.py transcribe_worker`
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+from .model_cache import WHISPER_PRELOAD_MODELS, WHISPER_WARMUP, get_model_cache
+from .models import Transcription, TranscriptionJob, TranscriptionWorker
+
+logger = logging.getLogger(__name__)
+
+# Настройки очереди из settings
+TRANSCRIBE_MAX_WORKERS = getattr(settings, 'TRANSCRIBE_MAX_WORKERS', 2)
+SCREENSHOT_MAX_WORKERS = getattr(settings, 'SCREENSHOT_MAX_WORKERS', 1)
+TRANSCRIBE_EXECUTION_MODE = getattr(settings, 'TRANSCRIBE_EXECUTION_MODE', 'thread')
+TRANSCRIBE_JOB_LEASE_SECONDS = getattr(settings, 'TRANSCRIBE_JOB_LEASE_SECONDS', 300)
+TRANSCRIBE_JOB_MAX_ATTEMPTS = getattr(settings, 'TRANSCRIBE_JOB_MAX_ATTEMPTS', 3)
+TRANSCRIBE_POLL_INTERVAL = getattr(settings, 'TRANSCRIBE_POLL_INTERVAL', 5)
+# Сколько ждать завершения текущих задач при штатной остановке обработчика (сек)
+TRANSCRIBE_STOP_TIMEOUT = getattr(settings, 'TRANSCRIBE_STOP_TIMEOUT', 30)
+TRANSCRIBE_WORKER_PROCESSES = getattr(settings, 'TRANSCRIBE_WORKER_PROCESSES', 2)
+TRANSCRIBE_CPUS_PER_PROCESS = getattr(settings, 'TRANSCRIBE_CPUS_PER_PROCESS', 0)
+# Запускать ли обработчики из веб-процесса (режимы thread и process). Из нескольких веб-процессов
+# сервера (gunicorn --workers N) обработчики запускает только один - захвативший файл блокировки,
+# поэтому TRANSCRIBE_MAX_WORKERS и бюджет памяти моделей действуют на хост, а не на веб-процесс
+TRANSCRIBE_WEB_WORKERS = getattr(settings, 'TRANSCRIBE_WEB_WORKERS', True)
+TRANSCRIBE_WEB_WORKERS_LOCK = getattr(
+    settings, 'TRANSCRIBE_WEB_WORKERS_LOCK', os.path.join(tempfile.gettempdir(), 'transcribe-web-workers.lock')
+)
+
+
+def make_worker_id():
+    """Идентификатор обработчика: хост и PID процесса"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_job(transcription_id, file_path):
+    """
+    Создать задачу в очереди
+
+    Если для транскрипции уже есть ожидающая задача, она переиспользуется
+    (с сохранением позиции в очереди).
+    """
+    job = TranscriptionJob.objects.filter(transcription_id=transcription_id, state='queued').first()
+    if job:
+        if job.file_path != file_path:
+            job.file_path = file_path
+            job.save(update_fields=['file_path'])
+        return job
+    return TranscriptionJob.objects.create(transcription_id=transcription_id, file_path=file_path)
+
+
+def claim_next_job(worker_id, lease_seconds=TRANSCRIBE_JOB_LEASE_SECONDS, max_attempts=TRANSCRIBE_JOB_MAX_ATTEMPTS):
+    """
+    Захватить следующую задачу из очереди (FIFO)
+
+    Подхватывает как новые задачи, так и задачи с истекшей арендой (обработчик умер).
+    Захват атомарный: UPDATE с проверкой номера попытки, поэтому задачу
+    получает только один обработчик даже без SELECT FOR UPDATE (SQLite).
+
+    Returns:
+        TranscriptionJob или None если очередь пуста
+    """
+    while True:
+        now = timezone.now()
+        candidate = TranscriptionJob.objects.filter(
+            Q(state='queued') | Q(state='running', lease_expires_at__lt=now)
+        ).order_by('created_at', 'id').first()
+        if candidate is None:
+            return None
+
+        if candidate.state == 'running' and candidate.attempts >= max_attempts:
+            # Задача уже несколько раз роняла обработчик - больше не пытаемся
+            _fail_orphaned_job(candidate)
+            continue
+
+        claimed = TranscriptionJob.objects.filter(
+            id=candidate.id,
+            state=candidate.state,
+            attempts=candidate.attempts,
+        ).update(
+            state='running',
+            worker_id=worker_id,
+            attempts=F('attempts') + 1,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            started_at=now,
+        )
+        if claimed:
+            if candidate.state == 'running':
+                logger.warning(f"Задача {candidate.id} подхвачена после сбоя обработчика {candidate.worker_id}")
+            return TranscriptionJob.objects.get(id=candidate.id)
+        # Задачу захватил другой обработчик - пробуем следующую
+
+
+def _fail_orphaned_job(job):
+    """Пометить как ошибочную задачу, исчерпавшую число попыток"""
+    error_msg = f"Обработка прерывалась {job.attempts} раз(а), задача остановлена"
+    updated = TranscriptionJob.objects.filter(
+        id=job.id, state='running', attempts=job.attempts
+    ).update(state='failed', finished_at=timezone.now(), last_error=error_msg, lease_expires_at=None)
+    if updated:
+        Transcription.objects.filter(id=job.transcription_id).update(status='error', error_message=error_msg)
+        logger.error(f"Задача {job.id}: {error_msg}")
+    return updated
+
+
+def renew_leases(worker_id, job_ids, lease_seconds=TRANSCRIBE_JOB_LEASE_SECONDS):
+    """Продлить аренду выполняющихся задач обработчика"""
+    if not job_ids:
+        return 0
+    return TranscriptionJob.objects.filter(
+        id__in=list(job_ids), worker_id=worker_id, state='running'
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds))
+
+
+def finish_job(job, state, error=None):
+    """Завершить задачу (state: done или failed)"""
+    TranscriptionJob.objects.filter(id=job.id, worker_id=job.worker_id).update(
+        state=state,
+        finished_at=timezone.now(),
+        lease_expires_at=None,
+        last_error=error,
+    )
+
+
+def release_jobs(worker_id, exclude=()):
+    """
+    Вернуть в очередь задачи обработчика (при штатной остановке)
+
+    Args:
+        exclude: id задач, которые еще выполняются - их нельзя отдать другому
+                 обработчику, они вернутся в очередь по истечении аренды
+    """
+    return TranscriptionJob.objects.filter(worker_id=worker_id, state='running').exclude(
+        id__in=list(exclude)
+    ).update(state='queued', worker_id=None, lease_expires_at=None)
+
+
+def recover_orphaned_jobs():
+    """
+    Вернуть в очередь задачи, чьи обработчики умерли (аренда истекла)
+
+    Вызывается при старте обработчиков, чтобы задачи, прерванные
+    перезапуском, продолжились сразу, а не остались в processing навсегда.
+    """
+    count = TranscriptionJob.objects.filter(
+        state='running', lease_expires_at__lt=timezone.now(), attempts__lt=TRANSCRIBE_JOB_MAX_ATTEMPTS
+    ).update(state='queued', worker_id=None, lease_expires_at=None)
+    if count:
+        logger.warning(f"Возвращено в очередь прерванных задач: {count}")
+    return count
+
+
+def run_job(job, target=None):
+    """Выполнить задачу и записать её итоговое состояние"""
+    if target is None:
+        from .views import process_file
+        target = process_file
+
+    try:
+        target(job.transcription_id, job.file_path)
+    except Exception as e:
+        logger.error(f"Необработанная ошибка в задаче {job.id} (транскрипция {job.transcription_id}): {e}", exc_info=True)
+        finish_job(job, 'failed', error=f"{type(e).__name__}: {e}")
+        return
+
+    # process_file сам перехватывает ошибки и пишет их в Transcription
+    status, error_message = Transcription.objects.filter(id=job.transcription_id).values_list(
+        'status', 'error_message'
+    ).first() or ('error', 'Транскрипция удалена')
+    if status == 'error':
+        finish_job(job, 'failed', error=error_message)
+    else:
+        # completed или pending (ожидает подтверждения языка - будет новая задача)
+        finish_job(job, 'done')
+
+
+def report_worker(worker_id, ready=None, hot_models=None, max_workers=None):
+    """Записать пульс обработчика (создает запись при первом вызове)"""
+    defaults = {'last_seen': timezone.now()}
+    if ready is not None:
+        defaults['ready'] = ready
+    if hot_models is not None:
+        defaults['hot_models'] = hot_models
+    if max_workers is not None:
+        defaults['max_workers'] = max_workers
+    TranscriptionWorker.objects.update_or_create(worker_id=worker_id, defaults=defaults)
+
+
+def unregister_worker(worker_id):
+    """Удалить запись обработчика (при штатной остановке)"""
+    TranscriptionWorker.objects.filter(worker_id=worker_id).delete()
+
+
+def get_readiness(stale_seconds=TRANSCRIBE_JOB_LEASE_SECONDS):
+    """
+    Готовность обработчиков очереди
+
+    Учитываются обработчики, присылавшие пульс не дольше stale_seconds назад.
+
+    Returns:
+        dict: ready (есть хотя бы один обработчик с предзагруженными моделями),
+              models (модель -> число обработчиков, где она загружена), workers
+    """
+    alive_since = timezone.now() - timedelta(seconds=stale_seconds)
+    workers = list(TranscriptionWorker.objects.filter(last_seen__gte=alive_since))
+    models = {}
+    for worker in workers:
+        for model in worker.hot_models or []:
+            models[model['name']] = models.get(model['name'], 0) + 1
+    return {
+        'ready': any(worker.ready for worker in workers),
+        'models': models,
+        'workers': [
+            {
+                'worker_id': worker.worker_id,
+                'ready': worker.ready,
+                'hot_models': [model['name'] for model in worker.hot_models or []],
+                'max_workers': worker.max_workers,
+                'last_seen': worker.last_seen.isoformat(),
+            }
+            for worker in workers
+        ],
+    }
+
+
+def get_queue_position(transcription_id):
+    """
+    Позиция транскрипции в очереди
+
+    Returns:
+        int: 0 - выполняется, N - номер в очереди, None - задачи нет
+    """
+    job = TranscriptionJob.objects.filter(
+        transcription_id=transcription_id, state__in=['queued', 'running']
+    ).order_by('-created_at', '-id').first()
+    if job is None:
+        return None
+    if job.state == 'running':
+        return 0
+    ahead = TranscriptionJob.objects.filter(state='queued').filter(
+        Q(created_at__lt=job.created_at) | Q(created_at=job.created_at, id__lt=job.id)
+    ).count()
+    return ahead + 1
+
+
+class TranscriptionExecutor:
+    """
+    Пул потоков, выполняющих задачи из очереди в БД
+
+    Одновременно выполняется не более max_workers транскрибаций,
+    остальные задачи ждут в очереди в порядке поступления.
+    Извлечение слайдов дополнительно ограничено screenshot_workers.
+    """
+
+    def __init__(self, max_workers=TRANSCRIBE_MAX_WORKERS, screenshot_workers=SCREENSHOT_MAX_WORKERS,
+                 target=None, worker_id=None, poll_interval=TRANSCRIBE_POLL_INTERVAL,
+                 lease_seconds=TRANSCRIBE_JOB_LEASE_SECONDS, preload_models=None):
+        self.max_workers = max(1, int(max_workers))
+        self.preload_models = list(WHISPER_PRELOAD_MODELS if preload_models is None else preload_models)
+        self.ready = False
+        self.target = target
+        self.worker_id = worker_id or make_worker_id()
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._running = {}  # job_id -> transcription_id
+        self._worker_threads = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._screenshot_semaphore = threading.BoundedSemaphore(max(1, int(screenshot_workers)))
+
+    def start(self):
+        """Запустить потоки обработчиков и продления аренды"""
+        with self._condition:
+            if self._threads:
+                return
+            recover_orphaned_jobs()
+            self._report()
+            # Модели грузятся параллельно с приемом задач: задача для еще не
+            # загруженной модели дождется ее загрузки, а не начнет вторую
+            preload = threading.Thread(target=self._preload, name="transcribe-preload", daemon=True)
+            self._threads.append(preload)
+            preload.start()
+            self._worker_threads = self.max_workers
+            for index in range(self.max_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"transcribe-worker-{index + 1}",
+                    daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._start_heartbeat_locked()
+        logger.info(f"Обработчик {self.worker_id} запущен: потоков транскрибации {self.max_workers}")
+
+    def start_heartbeat(self):
+        """
+        Запустить только пульс и продление аренды
+
+        Для выполнения задач в текущем потоке через run_once (transcribe_worker --once):
+        без продления аренда долгой задачи истечет, и ее подхватит другой обработчик.
+        """
+        with self._condition:
+            self._start_heartbeat_locked()
+
+    def _start_heartbeat_locked(self):
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="transcribe-heartbeat", daemon=True)
+        self._threads.append(heartbeat)
+        heartbeat.start()
+
+    def stop(self, release=True, timeout=TRANSCRIBE_STOP_TIMEOUT):
+        """
+        Остановить прием задач; незавершенные задачи вернуть в очередь
+
+        Потоки дожидаются не дольше timeout секунд. В очередь сразу
+        возвращаются только задачи остановившихся потоков: задачу, поток
+        которой еще работает, другой обработчик подхватит по истечении аренды
+        (пульс уже остановлен), иначе ее выполняли бы двое одновременно.
+        """
+        self._stop_event.set()
+        self.wake()
+        deadline = time.monotonic() + max(0, timeout)
+        current = threading.current_thread()
+        for thread in self._threads:
+            if thread is not current:
+                thread.join(max(0, deadline - time.monotonic()))
+        with self._condition:
+            still_running = list(self._running)
+        if still_running:
+            logger.warning(
+                f"Обработчик {self.worker_id}: задачи {still_running} не завершились за {timeout} с, "
+                f"они вернутся в очередь по истечении аренды"
+            )
+        if release:
+            released = release_jobs(self.worker_id, exclude=still_running)
+            if released:
+                logger.info(f"Обработчик {self.worker_id} вернул в очередь задач: {released}")
+        if self.started:
+            unregister_worker(self.worker_id)
+
+    def wait(self):
+        """Блокировать текущий поток до остановки"""
+        while not self._stop_event.wait(1):
+            pass
+
+    def wake(self):
+        """Разбудить потоки (появилась новая задача)"""
+        with self._condition:
+            self._condition.notify_all()
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    @property
+    def concurrent_jobs(self):
+        """
+        Сколько задач процесс выполняет одновременно
+
+        1 - если потоки обработчиков не запущены (run_once, --once) или поток один
+        (процесс-обработчик в режиме process): попутчиков для пакета тогда не бывает.
+        """
+        return max(1, self._worker_threads)
+
+    def stats(self):
+        """Текущее состояние пула"""
+        with self._condition:
+            return {
+                'worker_id': self.worker_id,
+                'max_workers': self.max_workers,
+                'running': len(self._running),
+                'ready': self.ready,
+            }
+
+    @contextmanager
+    def screenshot_slot(self):
+        """Ограничивает число одновременных извлечений слайдов"""
+        with self._screenshot_semaphore:
+            yield
+
+    def run_once(self):
+        """Захватить и выполнить одну задачу. Возвращает False если очередь пуста"""
+        close_old_connections()
+        job = claim_next_job(self.worker_id, lease_seconds=self.lease_seconds)
+        if job is None:
+            return False
+        with self._condition:
+            self._running[job.id] = job.transcription_id
+        try:
+            logger.info(f"Обработчик {self.worker_id} взял задачу {job.id} (транскрипция {job.transcription_id}, попытка {job.attempts})")
+            run_job(job, target=self.target)
+        finally:
+            with self._condition:
+                self._running.pop(job.id, None)
+        return True
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Ошибка в цикле обработчика {self.worker_id}: {e}", exc_info=True)
+            with self._condition:
+                self._condition.wait(self.poll_interval)
+        # Закрываем соединение с БД, открытое в этом потоке
+        connection.close()
+
+    def _preload(self):
+        try:
+            if self.preload_models:
+                logger.info(f"Обработчик {self.worker_id}: предзагрузка моделей {', '.join(self.preload_models)}")
+                get_model_cache().preload(self.preload_models, warm_up=WHISPER_WARMUP)
+            self.ready = True
+            self._report()
+        except Exception as e:
+            logger.error(f"Ошибка предзагрузки моделей: {e}", exc_info=True)
+        finally:
+            connection.close()
+
+    def _report(self):
+        """Записать пульс обработчика с текущим набором загруженных моделей"""
+        try:
+            report_worker(
+                self.worker_id,
+                ready=self.ready,
+                hot_models=get_model_cache().hot_models(),
+                max_workers=self.max_workers,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка записи пульса обработчика: {e}", exc_info=True)
+
+    def _heartbeat_loop(self):
+        interval = max(1, self.lease_seconds / 3)
+        while not self._stop_event.wait(interval):
+            try:
+                with self._condition:
+                    job_ids = list(self._running)
+                renew_leases(self.worker_id, job_ids, lease_seconds=self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Ошибка продления аренды задач: {e}", exc_info=True)
+            self._report()
+        connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Получить общий пул обработчиков процесса"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = TranscriptionExecutor()
+    return _executor
+
+
+def configure_executor(**kwargs):
+    """Создать общий пул процесса с заданными параметрами (для transcribe_worker)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor.started:
+            raise RuntimeError("Пул обработчиков уже запущен")
+        _executor = TranscriptionExecutor(**kwargs)
+    return _executor
+
+
+_process_pool = None
+
+
+_web_workers_lock = None
+
+
+def acquire_web_workers_lock(path=None):
+    """
+    Захватить блокировку обработчиков веб-сервера (одна на хост)
+
+    Блокировка держится, пока жив процесс: после его завершения ее захватит
+    следующий запущенный веб-процесс.
+
+    Returns:
+        bool: True, если этот процесс должен запускать обработчики
+    """
+    global _web_workers_lock
+    if _web_workers_lock is not None:
+        return True
+    try:
+        import fcntl
+    except ImportError:
+        return True  # Нет fcntl (Windows) - один веб-процесс в разработке
+    lock_file = open(path or TRANSCRIBE_WEB_WORKERS_LOCK, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _web_workers_lock = lock_file
+    return True
+
+
+def start_inprocess_workers():
+    """
+    Запустить обработчики из веб-процесса (режимы thread и process)
+
+    Обработчики запускает только один веб-процесс на хосте (см. acquire_web_workers_lock),
+    остальные лишь ставят задачи в очередь в БД.
+    """
+    global _process_pool
+    if not TRANSCRIBE_WEB_WORKERS or TRANSCRIBE_EXECUTION_MODE not in ('thread', 'process'):
+        return None
+    if not acquire_web_workers_lock():
+        logger.info("Обработчики очереди уже запущены другим веб-процессом этого хоста")
+        return None
+    if TRANSCRIBE_EXECUTION_MODE == 'thread':
+        executor = get_executor()
+        executor.start()
+        return executor
+    if TRANSCRIBE_EXECUTION_MODE == 'process':
+        from .worker_processes import WorkerProcessPool
+        with _executor_lock:
+            if _process_pool is None:
+                _process_pool = WorkerProcessPool(
+                    TRANSCRIBE_WORKER_PROCESSES,
+                    screenshot_threads=SCREENSHOT_MAX_WORKERS,
+                    cpus_per_process=TRANSCRIBE_CPUS_PER_PROCESS,
+                )
+                _process_pool.start_background()
+        return _process_pool
+    return None
+
+
+def enqueue_transcription(transcription_id, file_path):
+    """Поставить транскрипцию в очередь на обработку. Возвращает позицию в очереди"""
+    create_job(transcription_id, file_path)
+    if _executor is not None and _executor.started:
+        _executor.wake()
+    return get_queue_position(transcription_id)
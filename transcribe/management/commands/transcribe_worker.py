@@ -0,0 +1,114 @@
+"""
+Обработчик очереди транскрибации
+
+Запуск:
+    python manage.py transcribe_worker --threads 2
+    python manage.py transcribe_worker --processes 4 --cpus-per-process 4
+"""
+import logging
+import signal
+from django.core.management.base import BaseCommand
+from transcribe import job_queue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Обработчик очереди транскрибации (задачи из TranscriptionJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=None,
+            help='Количество одновременных транскрибаций (в режиме --processes - на процесс, по умолчанию 1)'
+        )
+        parser.add_argument(
+            '--screenshot-threads', type=int, default=job_queue.SCREENSHOT_MAX_WORKERS,
+            help='Количество одновременных извлечений слайдов'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Запустить N отдельных процессов-обработчиков (у каждого свой кэш моделей)'
+        )
+        parser.add_argument(
+            '--cpus-per-process', type=int, default=job_queue.TRANSCRIBE_CPUS_PER_PROCESS,
+            help='Ядер CPU на процесс (0 - поделить поровну)'
+        )
+        parser.add_argument(
+            '--preload', default=None,
+            help='Модели для загрузки при старте через запятую (по умолчанию WHISPER_PRELOAD_MODELS)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать все задачи из очереди и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        if options['preload'] is not None:
+            options['preload'] = [name.strip() for name in options['preload'].split(',') if name.strip()]
+        if options['processes'] > 0:
+            return self.run_process_pool(options)
+
+        executor = job_queue.configure_executor(
+            max_workers=options['threads'] or job_queue.TRANSCRIBE_MAX_WORKERS,
+            screenshot_workers=options['screenshot_threads'],
+            preload_models=options['preload'],
+        )
+
+        if options['once']:
+            # Прерванные задачи при обычном запуске возвращает в очередь executor.start()
+            recovered = job_queue.recover_orphaned_jobs()
+            if recovered:
+                self.stdout.write(f"Возвращено в очередь прерванных задач: {recovered}")
+            # Аренда задач продлевается, пока они выполняются в этом потоке
+            executor.start_heartbeat()
+            processed = 0
+            try:
+                while executor.run_once():
+                    processed += 1
+            finally:
+                executor.stop()
+            self.stdout.write(self.style.SUCCESS(f"Обработано задач: {processed}"))
+            return
+
+        def shutdown(signum, frame):
+            logger.info(f"Получен сигнал {signum}, останавливаем обработчик {executor.worker_id}")
+            executor.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        executor.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработчик {executor.worker_id} запущен: потоков {executor.max_workers}"
+        ))
+        executor.wait()
+        self.stdout.write("Обработчик остановлен")
+
+    def run_process_pool(self, options):
+        """Запустить отдельные процессы-обработчики и следить за ними"""
+        from transcribe.worker_processes import WorkerProcessPool
+
+        pool = WorkerProcessPool(
+            options['processes'],
+            threads_per_process=options['threads'] or 1,
+            screenshot_threads=options['screenshot_threads'],
+            cpus_per_process=options['cpus_per_process'],
+            preload_models=options['preload'],
+        )
+
+        def shutdown(signum, frame):
+            logger.info(f"Получен сигнал {signum}, останавливаем процессы-обработчики")
+            pool.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Запущено процессов-обработчиков: {pool.processes}, ядра: {pool.cpu_sets}"
+        ))
+        try:
+            pool.supervise()
+        finally:
+            pool.stop()
+        self.stdout.write("Процессы-обработчики остановлены")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0014_transcription_screenshot_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=500, verbose_name='Путь к файлу')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Состояние')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('worker_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='Обработчик')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Аренда до')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата постановки')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата начала')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+                ('transcription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='transcribe.transcription', verbose_name='Транскрипция')),
+            ],
+            options={
+                'verbose_name': 'Задача транскрибации',
+                'verbose_name_plural': 'Задачи транскрибации',
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['state', 'created_at'], name='transcribe__state_41a840_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0015_transcriptionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptionWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker_id', models.CharField(max_length=100, unique=True, verbose_name='Обработчик')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата запуска')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний пульс')),
+                ('ready', models.BooleanField(default=False, verbose_name='Модели предзагружены')),
+                ('hot_models', models.JSONField(blank=True, default=list, verbose_name='Загруженные модели')),
+                ('max_workers', models.IntegerField(default=1, verbose_name='Потоков транскрибации')),
+            ],
+            options={
+                'verbose_name': 'Обработчик очереди',
+                'verbose_name_plural': 'Обработчики очереди',
+                'ordering': ['worker_id'],
+            },
+        ),
+    ]
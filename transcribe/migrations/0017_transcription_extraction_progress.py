@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0016_transcriptionworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcription',
+            name='extraction_progress',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Прогресс извлечения аудио (%)'),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='media_duration',
+            field=models.FloatField(blank=True, null=True, verbose_name='Длительность записи (сек)'),
+        ),
+    ]
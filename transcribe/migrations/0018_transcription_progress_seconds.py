@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0017_transcription_extraction_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcription',
+            name='progress_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='Распознано секунд записи'),
+        ),
+    ]
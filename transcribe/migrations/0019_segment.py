@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0018_transcription_progress_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.FloatField(verbose_name='Начало (секунды)')),
+                ('end', models.FloatField(verbose_name='Конец (секунды)')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('avg_logprob', models.FloatField(blank=True, null=True, verbose_name='Средняя логарифмическая вероятность')),
+                ('words', models.JSONField(blank=True, null=True, verbose_name='Слова с временными метками')),
+                ('transcription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='transcribe.transcription', verbose_name='Транскрипция')),
+            ],
+            options={
+                'verbose_name': 'Сегмент',
+                'verbose_name_plural': 'Сегменты',
+                'ordering': ['start', 'id'],
+                'indexes': [models.Index(fields=['transcription', 'start'], name='segment_transcription_start')],
+            },
+        ),
+    ]
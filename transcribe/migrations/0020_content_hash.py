@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0019_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcription',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='SHA-256 содержимого файла'),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='result_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Ключ результата (файл, модель, язык, VAD)'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0020_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(max_length=36, unique=True, verbose_name='Идентификатор загрузки')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('file_size', models.BigIntegerField(verbose_name='Размер файла (байты)')),
+                ('received', models.BigIntegerField(default=0, verbose_name='Принято байт')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='IP адрес')),
+                ('user_uuid', models.CharField(max_length=36, verbose_name='UUID пользователя')),
+                ('signature', models.CharField(blank=True, max_length=500, null=True, verbose_name='Подпись')),
+                ('password_phrase_hash', models.CharField(blank=True, max_length=64, null=True, verbose_name='Хеш фразы-пароля')),
+                ('extract_screenshots', models.BooleanField(default=False, verbose_name='Извлечь скриншоты')),
+                ('whisper_model', models.CharField(default='base', max_length=20, verbose_name='Модель Whisper')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начало загрузки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последняя часть')),
+                ('transcription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chunked_uploads', to='transcribe.transcription', verbose_name='Транскрипция')),
+            ],
+            options={
+                'verbose_name': 'Загрузка по частям',
+                'verbose_name_plural': 'Загрузки по частям',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
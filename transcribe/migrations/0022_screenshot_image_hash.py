@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0021_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Перцептивный хеш (dHash)'),
+        ),
+    ]
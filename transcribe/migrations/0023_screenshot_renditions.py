@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0022_screenshot_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='thumbnail_path',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='Путь к миниатюре'),
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='webp_path',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='Путь к WebP'),
+        ),
+    ]
@@ -0,0 +1,310 @@
+"""
+Кэш моделей Whisper с ограничением по памяти
+
+Модели загружаются по требованию и вытесняются по принципу LRU, когда
+суммарный объем превышает WHISPER_MODEL_CACHE_MB. Модель, которая сейчас
+используется задачей (счетчик ссылок > 0), никогда не вытесняется.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Импорт логирования в Elasticsearch (с обработкой ошибок импорта)
+try:
+    from .elastic_logger import log_to_elasticsearch
+except ImportError:
+    def log_to_elasticsearch(*args, **kwargs):
+        pass  # Заглушка если модуль не доступен
+
+# Бюджет памяти под модели (МБ)
+WHISPER_MODEL_CACHE_MB = getattr(settings, 'WHISPER_MODEL_CACHE_MB', 4096)
+
+# Примерный объем памяти моделей int8 на CPU (МБ)
+MODEL_MEMORY_ESTIMATES_MB = {
+    'tiny': 100,
+    'base': 180,
+    'small': 500,
+    'medium': 1400,
+    'large-v2': 2900,
+    'large-v3': 2900,
+}
+MODEL_MEMORY_ESTIMATES_MB.update(getattr(settings, 'WHISPER_MODEL_MEMORY_MB', {}))
+
+# Модели, загружаемые и прогреваемые при старте обработчика
+WHISPER_PRELOAD_MODELS = list(getattr(settings, 'WHISPER_PRELOAD_MODELS', []))
+WHISPER_WARMUP = getattr(settings, 'WHISPER_WARMUP', True)
+
+
+def load_whisper_model(model_name):
+    """Загрузить модель Whisper с настройками проекта"""
+    from faster_whisper import WhisperModel
+
+    # Модели загружаются автоматически при первом использовании
+    # Они кэшируются в ~/.cache/huggingface/hub/
+    return WhisperModel(
+        model_name,
+        device="cpu",
+        compute_type="int8",
+        cpu_threads=getattr(settings, 'WHISPER_CPU_THREADS', 0),  # В процессах-обработчиках - по числу ядер
+        num_workers=getattr(settings, 'TRANSCRIBE_PARALLEL_CHUNKS', 1),  # Параллельных декодирований частей записи
+        download_root=None  # Использует стандартный кэш
+    )
+
+
+def warm_up_model(model):
+    """
+    Прогреть модель коротким синтетическим декодированием
+
+    Первый вызов CTranslate2 выделяет буферы и инициализирует ядра вычислений;
+    прогрев переносит эту задержку со старта первой задачи на старт обработчика.
+    """
+    import numpy as np
+
+    silence = np.zeros(16000, dtype=np.float32)  # 1 секунда тишины, 16 кГц
+    segments, _ = model.transcribe(silence, beam_size=1, language='en', without_timestamps=True)
+    list(segments)
+
+
+class _CacheEntry:
+    def __init__(self, name, model, size_mb, load_seconds):
+        self.name = name
+        self.model = model
+        self.size_mb = size_mb
+        self.load_seconds = load_seconds
+        self.refcount = 0
+        self.uses = 0
+        self.warmed = False
+        self.last_used = time.monotonic()
+
+
+class ModelHandle:
+    """Захваченная модель; пока handle не освобожден, модель не вытесняется"""
+
+    def __init__(self, cache, entry):
+        self._cache = cache
+        self._entry = entry
+        self.model = entry.model
+        self.name = entry.name
+
+    def release(self):
+        if self._entry is not None:
+            self._cache._release(self._entry)
+            self._entry = None
+
+    def __enter__(self):
+        return self.model
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class WhisperModelCache:
+    """LRU кэш моделей с бюджетом памяти и подсчетом ссылок"""
+
+    def __init__(self, budget_mb=WHISPER_MODEL_CACHE_MB, loader=None, size_estimates=None):
+        self.budget_mb = budget_mb
+        self.loader = loader or load_whisper_model
+        self.size_estimates = size_estimates if size_estimates is not None else MODEL_MEMORY_ESTIMATES_MB
+        self._entries = OrderedDict()  # LRU порядок: первый - давно не использовался
+        self._lock = threading.RLock()
+        self._load_locks = {}  # model_name -> Lock первой загрузки
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_errors = 0
+        self.load_seconds_total = 0.0
+
+    def acquire(self, model_name):
+        """Получить модель и увеличить счетчик ссылок (освободить через release())"""
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is not None:
+                self.hits += 1
+                return self._checkout_locked(entry)
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Загрузка под отдельной блокировкой модели: первая загрузка одной модели
+        # не задерживает запросы к уже загруженным и загрузку других моделей
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(model_name)
+                if entry is not None:
+                    # Модель загрузил соседний поток, пока мы ждали
+                    self.hits += 1
+                    return self._checkout_locked(entry)
+                self.misses += 1
+                size_mb = self._estimate_mb(model_name)
+                self._evict_locked(size_mb)
+            model, load_seconds = self._load(model_name)
+            with self._lock:
+                entry = _CacheEntry(model_name, model, size_mb, load_seconds)
+                self._entries[model_name] = entry
+                self._log_load(entry)
+                return self._checkout_locked(entry)
+
+    def used_mb(self):
+        with self._lock:
+            return sum(entry.size_mb for entry in self._entries.values())
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._entries)
+
+    def evict(self, model_name):
+        """Выгрузить модель, если она не используется"""
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None or entry.refcount > 0:
+                return False
+            self._remove_locked(entry)
+            return True
+
+    def preload(self, model_names, warm_up=True):
+        """
+        Загрузить модели заранее (при старте обработчика)
+
+        Ошибка загрузки одной модели не мешает загрузить остальные.
+
+        Returns:
+            list: Имена успешно загруженных моделей
+        """
+        loaded = []
+        for model_name in model_names:
+            try:
+                with self.acquire(model_name) as model:
+                    if warm_up:
+                        self._warm_up(model_name, model)
+                loaded.append(model_name)
+            except Exception as e:
+                logger.error(f"Не удалось предзагрузить модель {model_name}: {e}", exc_info=True)
+        return loaded
+
+    def hot_models(self):
+        """Загруженные модели (готовые к работе без задержки на загрузку)"""
+        with self._lock:
+            return [
+                {'name': entry.name, 'warmed': entry.warmed, 'in_use': entry.refcount}
+                for entry in self._entries.values()
+            ]
+
+    def _warm_up(self, model_name, model):
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None or entry.warmed:
+                return
+        started = time.monotonic()
+        try:
+            warm_up_model(model)
+        except Exception as e:
+            logger.warning(f"Прогрев модели {model_name} не удался: {e}")
+            return
+        entry.warmed = True
+        logger.info(f"Модель Whisper {model_name} прогрета за {time.monotonic() - started:.1f}с")
+
+    def stats(self):
+        """Метрики кэша"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'budget_mb': self.budget_mb,
+                'used_mb': sum(entry.size_mb for entry in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'load_errors': self.load_errors,
+                'load_seconds_total': round(self.load_seconds_total, 2),
+                'models': [
+                    {
+                        'name': entry.name,
+                        'size_mb': entry.size_mb,
+                        'in_use': entry.refcount,
+                        'uses': entry.uses,
+                        'idle_seconds': round(now - entry.last_used, 1) if not entry.refcount else 0,
+                        'load_seconds': round(entry.load_seconds, 2),
+                        'warmed': entry.warmed,
+                    }
+                    for entry in self._entries.values()
+                ],
+            }
+
+    def _estimate_mb(self, model_name):
+        return self.size_estimates.get(model_name, max(self.size_estimates.values(), default=0))
+
+    def _checkout_locked(self, entry):
+        entry.refcount += 1
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(entry.name)
+        return ModelHandle(self, entry)
+
+    def _load(self, model_name):
+        logger.info(f"Загрузка модели Whisper: {model_name}...")
+        started = time.monotonic()
+        try:
+            model = self.loader(model_name)
+        except Exception:
+            with self._lock:
+                self.load_errors += 1
+            raise
+        load_seconds = time.monotonic() - started
+        with self._lock:
+            self.load_seconds_total += load_seconds
+        return model, load_seconds
+
+    def _log_load(self, entry):
+        logger.info(
+            f"Модель Whisper {entry.name} загружена за {entry.load_seconds:.1f}с и кэширована "
+            f"(занято {self.used_mb()} из {self.budget_mb} МБ)"
+        )
+        log_to_elasticsearch('whisper_model_load', {
+            'model': entry.name,
+            'load_seconds': round(entry.load_seconds, 2),
+            'size_mb': entry.size_mb,
+            'cache_used_mb': self.used_mb(),
+            'cache_budget_mb': self.budget_mb,
+        })
+
+    def _evict_locked(self, needed_mb=0):
+        """Вытеснить давно не используемые модели, чтобы освободить needed_mb"""
+        for entry in list(self._entries.values()):
+            if self.used_mb() + needed_mb <= self.budget_mb:
+                return
+            if entry.refcount > 0:
+                continue
+            self._remove_locked(entry)
+        if self.used_mb() + needed_mb > self.budget_mb:
+            logger.warning(
+                f"Бюджет памяти моделей превышен: нужно {needed_mb} МБ, занято {self.used_mb()} МБ "
+                f"из {self.budget_mb} МБ (все модели используются)"
+            )
+
+    def _remove_locked(self, entry):
+        del self._entries[entry.name]
+        self.evictions += 1
+        logger.info(f"Модель Whisper {entry.name} выгружена из кэша (простаивала {time.monotonic() - entry.last_used:.0f}с)")
+
+    def _release(self, entry):
+        with self._lock:
+            entry.refcount -= 1
+            entry.last_used = time.monotonic()
+            if entry.refcount == 0 and self._entries.get(entry.name) is entry:
+                # Модели могли загрузиться сверх бюджета, пока эта была занята
+                self._evict_locked()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_model_cache():
+    """Общий кэш моделей процесса"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = WhisperModelCache()
+    return _cache
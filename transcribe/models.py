@@ -56,6 +56,11 @@ class Transcription(models.Model):
     detected_language = models.CharField(max_length=10, blank=True, null=True, verbose_name="Определенный язык")
     selected_language = models.CharField(max_length=10, blank=True, null=True, verbose_name="Выбранный язык")
     language_confirmed = models.BooleanField(default=False, verbose_name="Язык подтвержден пользователем")
+    media_duration = models.FloatField(blank=True, null=True, verbose_name="Длительность записи (сек)")
+    extraction_progress = models.IntegerField(blank=True, null=True, verbose_name="Прогресс извлечения аудио (%)")
+    progress_seconds = models.FloatField(blank=True, null=True, verbose_name="Распознано секунд записи")
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, verbose_name="SHA-256 содержимого файла")
+    result_key = models.CharField(max_length=64, blank=True, null=True, db_index=True, verbose_name="Ключ результата (файл, модель, язык, VAD)")
 
     class Meta:
         verbose_name = "Транскрипция"
@@ -96,7 +101,11 @@ class Screenshot(models.Model):
     transcription = models.ForeignKey(Transcription, on_delete=models.CASCADE, related_name='screenshots', verbose_name="Транскрипция")
     timestamp = models.FloatField(verbose_name="Временная метка (секунды)")
     image_path = models.CharField(max_length=500, verbose_name="Путь к изображению")
+    # Уменьшенные копии для страниц просмотра (у старых скриншотов пустые)
+    thumbnail_path = models.CharField(max_length=500, blank=True, default='', verbose_name="Путь к миниатюре")
+    webp_path = models.CharField(max_length=500, blank=True, default='', verbose_name="Путь к WebP")
     order = models.IntegerField(default=0, verbose_name="Порядок")
+    image_hash = models.CharField(max_length=16, blank=True, default='', verbose_name="Перцептивный хеш (dHash)")
     
     class Meta:
         verbose_name = "Скриншот"
@@ -105,6 +114,32 @@ class Screenshot(models.Model):
     
     def __str__(self):
         return f"{self.transcription.filename} - {self.timestamp:.0f}s"
+    
+    @property
+    def preview_path(self):
+        """Миниатюра, а для старых скриншотов без нее - оригинал"""
+        return self.thumbnail_path or self.image_path
+
+
+class Segment(models.Model):
+    """Сегмент распознанного текста с временными метками"""
+    transcription = models.ForeignKey(Transcription, on_delete=models.CASCADE, related_name='segments', verbose_name="Транскрипция")
+    start = models.FloatField(verbose_name="Начало (секунды)")
+    end = models.FloatField(verbose_name="Конец (секунды)")
+    text = models.TextField(verbose_name="Текст")
+    avg_logprob = models.FloatField(null=True, blank=True, verbose_name="Средняя логарифмическая вероятность")
+    words = models.JSONField(null=True, blank=True, verbose_name="Слова с временными метками")
+
+    class Meta:
+        verbose_name = "Сегмент"
+        verbose_name_plural = "Сегменты"
+        ordering = ['start', 'id']
+        indexes = [
+            models.Index(fields=['transcription', 'start'], name='segment_transcription_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.transcription_id} - {self.start:.1f}s"
 
 
 class IPUploadCount(models.Model):
@@ -204,3 +239,81 @@ class UUIDUploadCount(models.Model):
         monthly_count = self.get_monthly_count()
         return monthly_count >= 2 and not self.is_paid and self.balance <= 0
 
+
+
+class TranscriptionJob(models.Model):
+    """Задача обработки транскрипции в очереди (хранится в БД и переживает перезапуск)"""
+    STATES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    transcription = models.ForeignKey(Transcription, on_delete=models.CASCADE, related_name='jobs', verbose_name="Транскрипция")
+    file_path = models.CharField(max_length=500, verbose_name="Путь к файлу")
+    state = models.CharField(max_length=20, choices=STATES, default='queued', verbose_name="Состояние")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    worker_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="Обработчик")
+    lease_expires_at = models.DateTimeField(blank=True, null=True, verbose_name="Аренда до")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата постановки")
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата начала")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата завершения")
+    last_error = models.TextField(blank=True, null=True, verbose_name="Последняя ошибка")
+
+    class Meta:
+        verbose_name = "Задача транскрибации"
+        verbose_name_plural = "Задачи транскрибации"
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['state', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Задача #{self.id} ({self.get_state_display()}) - {self.transcription_id}"
+
+
+class TranscriptionWorker(models.Model):
+    """Живой обработчик очереди: пульс и загруженные модели (для проверки готовности)"""
+    worker_id = models.CharField(max_length=100, unique=True, verbose_name="Обработчик")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="Дата запуска")
+    last_seen = models.DateTimeField(default=timezone.now, verbose_name="Последний пульс")
+    ready = models.BooleanField(default=False, verbose_name="Модели предзагружены")
+    hot_models = models.JSONField(default=list, blank=True, verbose_name="Загруженные модели")
+    max_workers = models.IntegerField(default=1, verbose_name="Потоков транскрибации")
+
+    class Meta:
+        verbose_name = "Обработчик очереди"
+        verbose_name_plural = "Обработчики очереди"
+        ordering = ['worker_id']
+
+    def __str__(self):
+        return self.worker_id
+
+
+class ChunkedUpload(models.Model):
+    """Возобновляемая загрузка файла по частям: принятые байты лежат в файле части"""
+    upload_id = models.CharField(max_length=36, unique=True, verbose_name="Идентификатор загрузки")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    file_size = models.BigIntegerField(verbose_name="Размер файла (байты)")
+    received = models.BigIntegerField(default=0, verbose_name="Принято байт")
+    ip_address = models.GenericIPAddressField(verbose_name="IP адрес")
+    user_uuid = models.CharField(max_length=36, verbose_name="UUID пользователя")
+    signature = models.CharField(max_length=500, blank=True, null=True, verbose_name="Подпись")
+    password_phrase_hash = models.CharField(max_length=64, blank=True, null=True, verbose_name="Хеш фразы-пароля")
+    extract_screenshots = models.BooleanField(default=False, verbose_name="Извлечь скриншоты")
+    whisper_model = models.CharField(max_length=20, default='base', verbose_name="Модель Whisper")
+    transcription = models.ForeignKey(
+        Transcription, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='chunked_uploads', verbose_name="Транскрипция"
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Начало загрузки")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Последняя часть")
+
+    class Meta:
+        verbose_name = "Загрузка по частям"
+        verbose_name_plural = "Загрузки по частям"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} - {self.received}/{self.file_size}"
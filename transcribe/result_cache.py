@@ -0,0 +1,49 @@
+"""
+Повторное использование результатов транскрибации одинаковых файлов
+
+Ключ результата - хеш от (хеш содержимого файла, модель Whisper, язык,
+параметры VAD). Завершенная транскрипция сохраняет свой ключ; новая задача с
+тем же ключом не декодирует запись, а копирует готовые сегменты и текст.
+"""
+import hashlib
+import json
+from django.conf import settings
+from .audio import TRANSCRIBE_VAD_PARAMETERS
+from .models import Segment, Transcription
+
+TRANSCRIBE_RESULT_CACHE = getattr(settings, 'TRANSCRIBE_RESULT_CACHE', True)
+
+
+def result_key(content_hash, whisper_model, language):
+    """Ключ результата; language=None - автоопределение языка"""
+    payload = json.dumps(
+        [content_hash, whisper_model, language or 'auto', TRANSCRIBE_VAD_PARAMETERS],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def find_cached_result(key, exclude_id=None):
+    """Последняя завершенная транскрипция с тем же ключом результата"""
+    if not TRANSCRIBE_RESULT_CACHE or not key:
+        return None
+    return (
+        Transcription.objects.filter(result_key=key, status='completed')
+        .exclude(id=exclude_id).order_by('-id').first()
+    )
+
+
+def copy_result(source, target):
+    """Скопировать сегменты, текст и язык готовой транскрипции (без сохранения полей target)"""
+    Segment.objects.filter(transcription=target).delete()
+    Segment.objects.bulk_create([
+        Segment(
+            transcription=target, start=segment.start, end=segment.end, text=segment.text,
+            avg_logprob=segment.avg_logprob, words=segment.words,
+        )
+        for segment in source.segments.order_by('start', 'id')
+    ])
+    target.transcribed_text = source.transcribed_text
+    target.detected_language = source.detected_language
+    target.media_duration = source.media_duration
+    target.progress_seconds = source.progress_seconds
@@ -0,0 +1,155 @@
+"""
+Сохранение результатов транскрибации по мере декодирования
+
+Сегменты приходят из генератора faster-whisper по одному. SegmentWriter
+копит их и пачками записывает в БД: строки таблицы Segment (bulk_create),
+сводный текст и позицию обработки. Поэтому частичный текст виден в статусе,
+а при падении обработчика уже распознанная часть не теряется.
+
+Сохраненные сегменты служат контрольной точкой: если обработчик упал
+посреди длинной записи, повторный запуск продолжает декодирование с конца
+последнего сохраненного сегмента, а не с начала файла.
+
+Таблица сегментов позволяет выбирать текст по диапазону времени (например,
+для сопоставления со слайдами) без разбора сплошного текста регулярками.
+"""
+import time
+from django.conf import settings
+from .models import Segment, Transcription
+
+# Как часто сохранять частичный результат: по числу сегментов или по времени (сек)
+SEGMENT_FLUSH_BATCH = getattr(settings, 'SEGMENT_FLUSH_BATCH', 50)
+SEGMENT_FLUSH_INTERVAL = getattr(settings, 'SEGMENT_FLUSH_INTERVAL', 5)
+
+
+class SegmentWriter:
+    """Пачками сохраняет распознанный текст и позицию обработки транскрипции"""
+
+    def __init__(self, transcription_id, batch_size=SEGMENT_FLUSH_BATCH, interval=SEGMENT_FLUSH_INTERVAL):
+        self.transcription_id = transcription_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.text_parts = []
+        self.count = 0  # Непустых сегментов
+        self.progress_seconds = 0.0
+        self._pending = 0
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self):
+        return " ".join(self.text_parts).strip()
+
+    def add(self, segment):
+        """
+        Добавить сегмент; при накоплении пачки - сохранить
+
+        Returns:
+            str: Текст сегмента без пробелов по краям (пустой для пустых сегментов)
+        """
+        text = segment.text.strip()
+        self.progress_seconds = max(self.progress_seconds, segment.end)
+        if text:  # Пропускаем пустые сегменты
+            self.text_parts.append(text)
+            self.count += 1
+            self._rows.append(Segment(
+                transcription_id=self.transcription_id,
+                start=segment.start,
+                end=segment.end,
+                text=text,
+                avg_logprob=getattr(segment, 'avg_logprob', None),
+                words=_words_to_json(getattr(segment, 'words', None)),
+            ))
+        self._pending += 1
+        if self._pending >= self.batch_size or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+        return text
+
+    def resume(self):
+        """
+        Продолжить с сегментов, сохраненных прерванным запуском
+
+        Returns:
+            float: Контрольная точка - конец последнего сохраненного сегмента
+            (секунды), 0 если сохраненных сегментов нет
+        """
+        rows = list(
+            Segment.objects.filter(transcription_id=self.transcription_id)
+            .order_by('start', 'id').values_list('end', 'text')
+        )
+        self.text_parts = [text for _, text in rows]
+        self.count = len(rows)
+        self.progress_seconds = max((end for end, _ in rows), default=0.0)
+        return self.progress_seconds
+
+    def flush(self):
+        """Сохранить накопленные сегменты, текст и позицию обработки"""
+        if self._rows:
+            Segment.objects.bulk_create(self._rows)
+            self._rows = []
+        Transcription.objects.filter(id=self.transcription_id).update(
+            transcribed_text=self.text,
+            progress_seconds=self.progress_seconds,
+        )
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+
+def _words_to_json(words):
+    """Слова сегмента (faster-whisper Word) в список словарей для JSONField"""
+    if not words:
+        return None
+    return [
+        {'start': word.start, 'end': word.end, 'word': word.word, 'probability': word.probability}
+        for word in words
+    ]
+
+
+def segments_by_slides(transcription, timestamps):
+    """
+    Разложить текст сегментов по слайдам
+
+    Слайду i достается текст сегментов, начинающихся в [timestamps[i],
+    timestamps[i+1]); сегменты до первого слайда относятся к первому.
+
+    Returns:
+        list: Тексты по слайдам (той же длины, что timestamps) или None,
+        если сегментов нет (старые транскрипции)
+    """
+    if not timestamps:
+        return None
+    rows = list(transcription.segments.order_by('start', 'id').values_list('start', 'text'))
+    if not rows:
+        return None
+
+    import bisect
+
+    bounds = list(timestamps[1:])
+    texts = [[] for _ in timestamps]
+    for start, text in rows:
+        texts[bisect.bisect_right(bounds, start)].append(text)
+    return [" ".join(parts) for parts in texts]
+
+
+def format_srt(segments):
+    """Сегменты (start, end, text) в субтитры SRT"""
+    def timestamp(seconds):
+        milliseconds = int(round(seconds * 1000))
+        hours, milliseconds = divmod(milliseconds, 3600000)
+        minutes, milliseconds = divmod(milliseconds, 60000)
+        seconds, milliseconds = divmod(milliseconds, 1000)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+    blocks = [
+        f"{index}\n{timestamp(start)} --> {timestamp(end)}\n{text}\n"
+        for index, (start, end, text) in enumerate(segments, 1)
+    ]
+    return "\n".join(blocks)
+
+
+def offset_segments(segments, offset):
+    """Сдвинуть время сегментов на offset секунд (декодирование с контрольной точки)"""
+    for segment in segments:
+        segment.start += offset
+        segment.end += offset
+        yield segment
@@ -0,0 +1,401 @@
+"""
+Детекция смены слайдов в видео (OpenCV)
+
+Видео просматривается с шагом SLIDE_CHECK_INTERVAL; кадр считается новым
+слайдом, если по сравнению с последним сохраненным слайдом изменилась
+заметная доля экрана и с него прошло не меньше SLIDE_MIN_TIME_DIFF секунд.
+
+Длинное видео делится на диапазоны кадров, которые обрабатываются в
+отдельных процессах (каждый со своим cv2.VideoCapture, перемотанным к
+началу диапазона; внутри демонического процесса - в потоках). Первый кадр
+диапазона процесс всегда сохраняет, поэтому после обработки
+merge_slide_ranges сверяет его с последним слайдом предыдущего диапазона и
+отбрасывает повторы на стыках.
+
+Повторы по всему видео (возврат к прежнему слайду, переключение на камеру
+докладчика и обратно) отсекает SlideIndex: у каждого слайда есть dHash
+(64 бита), по частям которого кандидаты в повторы находятся поиском в словаре,
+а окончательно повтор подтверждается сравнением маленьких копий кадров.
+
+Модуль не зависит от Django: процессы пула запускаются через spawn и
+импортируют только его.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Параметры детекции
+SLIDE_PIXEL_THRESHOLD = 30  # Порог изменения пикселя (0-255)
+SLIDE_SCREEN_THRESHOLD = 0.05  # Порог изменения экрана (5%)
+SLIDE_MIN_TIME_DIFF = 2.0  # Минимальное время между слайдами (сек)
+SLIDE_CHECK_INTERVAL = 0.5  # Интервал проверки кадров (сек)
+SLIDE_ANALYSIS_WIDTH = 640  # Ширина кадра для сравнения (px)
+SLIDE_JPEG_QUALITY = 90
+# Уменьшенные копии слайда для страниц просмотра: миниатюра (JPEG) и WebP
+SLIDE_THUMBNAIL_WIDTH = 320
+SLIDE_THUMBNAIL_QUALITY = 80
+SLIDE_WEBP_MAX_WIDTH = 1280
+SLIDE_WEBP_QUALITY = 75
+SLIDE_HASH_MAX_DISTANCE = 7  # Различающихся бит dHash у кандидатов в повторы
+SLIDE_FINGERPRINT_WIDTH = 160  # Ширина копии кадра для подтверждения повтора (px)
+SLIDE_DUPLICATE_THRESHOLD = 0.01  # Доля изменившихся пикселей копии, при которой слайд - повтор
+SLIDE_ENCODE_THREADS = 2  # Потоков кодирования JPEG на один диапазон
+
+
+def video_info(video_path):
+    """
+    Returns:
+        tuple: (кадров в секунду, число кадров)
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise Exception(f"Не удалось открыть видео файл: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0:
+            fps = 30  # Fallback
+        return fps, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def frame_step_for(fps):
+    """Шаг между анализируемыми кадрами"""
+    return max(1, int(fps * SLIDE_CHECK_INTERVAL))
+
+
+def plan_slide_ranges(total_frames, fps, parts):
+    """
+    Разбить видео на parts диапазонов кадров [start, end), границы кратны шагу анализа
+
+    Если число кадров неизвестно, видео читается одним диапазоном до конца (end=None).
+    """
+    if total_frames <= 0:
+        return [(0, None)]
+    step = frame_step_for(fps)
+    parts = max(1, min(parts, total_frames // step or 1))
+    size = -(-total_frames // parts)  # Округление вверх
+    size = -(-size // step) * step
+    return [(start, min(start + size, total_frames)) for start in range(0, total_frames, size)]
+
+
+def prepare_frame(frame):
+    """Уменьшенный ч/б кадр для сравнения"""
+    import cv2
+
+    height, width = frame.shape[:2]
+    scale = SLIDE_ANALYSIS_WIDTH / width if width > SLIDE_ANALYSIS_WIDTH else 1
+    if scale < 1:
+        # Уменьшаем до перевода в ч/б - конвертируется уже уменьшенный кадр
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def blur_frame(gray):
+    """Размытие для уменьшения шума"""
+    import cv2
+
+    return cv2.GaussianBlur(gray, (21, 21), 0)
+
+
+def frame_unchanged(previous_small, small):
+    """
+    Кадр заведомо не отличается от образца (без размытия)
+
+    Размытие усредняет разницу соседних пикселей, поэтому если ни один
+    пиксель не изменился больше чем на SLIDE_PIXEL_THRESHOLD (с запасом на
+    округление), то и после размытия изменившихся пикселей нет. Смена текста
+    на слайде того же шаблона меняет пиксели букв сильнее порога и здесь не
+    теряется, в отличие от сравнения гистограмм яркости.
+    """
+    import cv2
+
+    return cv2.norm(previous_small, small, cv2.NORM_INF) < SLIDE_PIXEL_THRESHOLD - 1
+
+
+def slide_fingerprint(gray):
+    """
+    Отпечаток слайда для поиска повторов (по неразмытому кадру)
+
+    Returns:
+        tuple: (dHash - 64-битное целое, маленькая копия кадра для подтверждения)
+    """
+    import cv2
+    import numpy as np
+
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    image_hash = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    height, width = gray.shape[:2]
+    size = (SLIDE_FINGERPRINT_WIDTH, max(1, round(height * SLIDE_FINGERPRINT_WIDTH / width)))
+    return image_hash, cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+class SlideIndex:
+    """
+    Уже сохраненные слайды для поиска повторов
+
+    dHash делится на SLIDE_HASH_MAX_DISTANCE + 1 частей: у хешей, различающихся
+    не больше чем в SLIDE_HASH_MAX_DISTANCE битах, хотя бы одна часть совпадает
+    целиком, поэтому кандидаты находятся поиском по словарям частей, без
+    перебора всех слайдов. Кандидат считается повтором, если его копия кадра
+    отличается от нового слайда меньше чем на SLIDE_DUPLICATE_THRESHOLD -
+    строже, чем порог смены слайда, чтобы не потерять слайд с похожим текстом.
+    """
+
+    def __init__(self):
+        self.bands = SLIDE_HASH_MAX_DISTANCE + 1
+        self.band_bits = -(-64 // self.bands)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.fingerprints = []
+
+    def _keys(self, image_hash):
+        mask = (1 << self.band_bits) - 1
+        return [(image_hash >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def find(self, image_hash, fingerprint):
+        """Индекс ранее сохраненного слайда, повтором которого является новый (или None)"""
+        seen = set()
+        for bucket, key in zip(self.buckets, self._keys(image_hash)):
+            for index in bucket.get(key, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                known_hash, known_fingerprint = self.fingerprints[index]
+                if (bin(known_hash ^ image_hash).count('1') <= SLIDE_HASH_MAX_DISTANCE
+                        and frame_difference(known_fingerprint, fingerprint) <= SLIDE_DUPLICATE_THRESHOLD):
+                    return index
+        return None
+
+    def add(self, image_hash, fingerprint):
+        index = len(self.fingerprints)
+        self.fingerprints.append((image_hash, fingerprint))
+        for bucket, key in zip(self.buckets, self._keys(image_hash)):
+            bucket.setdefault(key, []).append(index)
+        return index
+
+
+def frame_difference(previous_gray, gray):
+    """Доля заметно изменившихся пикселей"""
+    import cv2
+    import numpy as np
+
+    frame_diff = cv2.absdiff(previous_gray, gray)
+    _, thresh = cv2.threshold(frame_diff, SLIDE_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)
+    return np.count_nonzero(thresh) / thresh.size
+
+
+def detect_slides_in_range(video_path, start_frame, end_frame, fps, output_dir, name_prefix, max_slides=1000):
+    """
+    Найти слайды в диапазоне кадров [start_frame, end_frame) и сохранить их в JPEG
+
+    end_frame=None - до конца видео. Кадры кодируются (JPEG, миниатюра и WebP)
+    и пишутся на диск в пуле потоков (cv2.imwrite отпускает GIL), поэтому цикл
+    анализа не ждет диск; слайды, которые не удалось записать, отбрасываются в конце.
+
+    Кадр, ни один пиксель которого заметно не изменился по сравнению с
+    последним слайдом, пропускается без размытия. Повторы ранее сохраненных
+    слайдов диапазона не сохраняются.
+
+    Returns:
+        list: Слайды - словари frame, timestamp, path, renditions (пути
+        уменьшенных копий: thumbnail, webp), diff, hash (dHash),
+        fingerprint (копия кадра для поиска повторов) и gray (уменьшенный
+        кадр для сверки стыков)
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"Не удалось открыть видео файл: {video_path}")
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    frame_step = frame_step_for(fps)
+    slides = []
+    writes = []
+    index = SlideIndex()
+    last_gray = None
+    last_small = None
+    last_time = None
+    frame_idx = start_frame
+    encoder = ThreadPoolExecutor(max_workers=SLIDE_ENCODE_THREADS, thread_name_prefix='slide-jpeg')
+    try:
+        while end_frame is None or frame_idx < end_frame:
+            # grab() только продвигает поток на кадр; преобразование в BGR и копирование
+            # кадра (retrieve) выполняются лишь для анализируемых кадров
+            if not cap.grab():
+                break
+            if frame_idx % frame_step != 0:
+                frame_idx += 1
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                frame_idx += 1
+                continue
+
+            timestamp = frame_idx / fps
+            small = prepare_frame(frame)
+            if last_small is not None and frame_unchanged(last_small, small):
+                # Кадр тот же (все пиксели в пределах порога) - размытие и сравнение не нужны
+                frame_idx += 1
+                continue
+            gray = blur_frame(small)
+            if last_gray is None:
+                # Первый кадр диапазона сохраняем всегда (стыки сверяет merge_slide_ranges)
+                diff = None
+            else:
+                diff = frame_difference(last_gray, gray)
+                # Интервал от первого кадра диапазона не проверяется: он может оказаться
+                # повтором предыдущего слайда - интервалы на стыках проверяет merge_slide_ranges
+                if diff <= SLIDE_SCREEN_THRESHOLD or (last_time is not None and timestamp - last_time < SLIDE_MIN_TIME_DIFF):
+                    frame_idx += 1
+                    continue
+
+            image_hash, fingerprint = slide_fingerprint(small)
+            duplicate = index.find(image_hash, fingerprint)
+            last_gray, last_small = gray, small
+            if duplicate is not None:
+                # На экране снова уже сохраненный слайд: он становится образцом для сравнения,
+                # но повторно не сохраняется
+                logger.info(f"Повтор слайда {duplicate + 1} на {timestamp:.2f}с, не сохраняется")
+                frame_idx += 1
+                continue
+            if diff is not None:
+                logger.info(f"Обнаружен новый слайд на {timestamp:.2f}с (изменение: {diff:.2%})")
+
+            path = os.path.join(output_dir, f"{name_prefix}_{len(slides):04d}.jpg")
+            # Сохраняем оригинальный кадр (не уменьшенный); retrieve() возвращает новый массив,
+            # поэтому кадр можно отдать потоку кодирования без копирования
+            writes.append(encoder.submit(_write_slide, path, frame))
+            index.add(image_hash, fingerprint)
+            slides.append({
+                'frame': frame_idx, 'timestamp': timestamp, 'path': path, 'diff': diff, 'gray': gray,
+                'hash': image_hash, 'fingerprint': fingerprint,
+            })
+            last_time = timestamp if diff is not None else None
+            if len(slides) >= max_slides:
+                break
+            frame_idx += 1
+    finally:
+        cap.release()
+        encoder.shutdown(wait=True)
+
+    for slide, write in zip(slides, writes):
+        slide['renditions'] = write.result()
+    return [slide for slide in slides if slide['renditions'] is not None]
+
+
+def _write_slide(path, frame):
+    """
+    Записать кадр в JPEG и его уменьшенные копии рядом с ним
+
+    Returns:
+        dict: Пути копий (thumbnail, webp; копия, которую не удалось записать,
+        пропускается) или None, если не записан сам кадр
+    """
+    import cv2
+
+    base = os.path.splitext(path)[0]
+    height, width = frame.shape[:2]
+    renditions = {}
+    try:
+        cv2.imwrite(path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), SLIDE_JPEG_QUALITY])
+        if not (os.path.exists(path) and os.path.getsize(path) > 0):
+            return None
+        for name, suffix, max_width, params in (
+            ('thumbnail', '_thumb.jpg', SLIDE_THUMBNAIL_WIDTH, [int(cv2.IMWRITE_JPEG_QUALITY), SLIDE_THUMBNAIL_QUALITY]),
+            ('webp', '.webp', SLIDE_WEBP_MAX_WIDTH, [int(cv2.IMWRITE_WEBP_QUALITY), SLIDE_WEBP_QUALITY]),
+        ):
+            image = frame
+            if width > max_width:
+                image = cv2.resize(frame, (max_width, round(height * max_width / width)), interpolation=cv2.INTER_AREA)
+            rendition_path = base + suffix
+            if cv2.imwrite(rendition_path, image, params):
+                renditions[name] = rendition_path
+    except cv2.error as e:
+        logger.error(f"Не удалось сохранить слайд {path}: {e}")
+        if not os.path.exists(path):
+            return None
+    return renditions
+
+
+def detect_slide_ranges(tasks):
+    """
+    Найти слайды во всех диапазонах
+
+    Диапазоны обрабатываются в отдельных процессах (spawn). Демоническому
+    процессу (процессу пула multiprocessing) создавать дочерние процессы
+    нельзя - тогда диапазоны обрабатываются потоками: OpenCV отпускает GIL
+    при декодировании и сравнении кадров.
+
+    Args:
+        tasks: Аргументы detect_slides_in_range для каждого диапазона
+
+    Returns:
+        list: Слайды каждого диапазона по порядку диапазонов
+    """
+    if len(tasks) == 1:
+        return [detect_slides_in_range(*tasks[0])]
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if multiprocessing.current_process().daemon:
+        pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='slides-range')
+    else:
+        # Каждый процесс открывает видео сам и перематывает к своему диапазону
+        pool = ProcessPoolExecutor(max_workers=len(tasks), mp_context=multiprocessing.get_context('spawn'))
+    with pool:
+        futures = [pool.submit(detect_slides_in_range, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def merge_slide_ranges(range_slides):
+    """
+    Склеить слайды диапазонов по порядку
+
+    Первый слайд каждого диапазона, кроме первого, остается, только если он
+    отличается от последнего принятого слайда; для всех слайдов проверяется
+    минимальный интервал от последнего принятого и повторы слайдов других
+    диапазонов. Файлы отброшенных слайдов удаляются.
+
+    Returns:
+        list: Принятые слайды по времени
+    """
+    merged = []
+    last = None
+    index = SlideIndex()
+    for slides in range_slides:
+        for position, slide in enumerate(slides):
+            if merged and slide['timestamp'] - merged[-1]['timestamp'] < SLIDE_MIN_TIME_DIFF:
+                _remove_slide(slide)
+                continue
+            if position == 0 and last is not None:
+                diff = frame_difference(last['gray'], slide['gray'])
+                if diff <= SLIDE_SCREEN_THRESHOLD:
+                    _remove_slide(slide)
+                    continue
+                slide['diff'] = diff
+            if index.find(slide['hash'], slide['fingerprint']) is not None:
+                _remove_slide(slide)
+                continue
+            index.add(slide['hash'], slide['fingerprint'])
+            merged.append(slide)
+        if merged:
+            # Образец для следующего стыка - последний принятый слайд, даже если конец
+            # диапазона отброшен (слайд любого диапазона может оказаться последним принятым)
+            last = merged[-1]
+    return merged
+
+
+def _remove_slide(slide):
+    for path in [slide['path'], *slide.get('renditions', {}).values()]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,119 @@
+"""
+Тесты для пакетной транскрибации коротких записей
+"""
+import threading
+import numpy as np
+import pytest
+from transcribe.batching import InferenceBatcher, split_clips
+
+SECOND = 16000
+
+
+class FakePipeline:
+    """BatchedInferencePipeline для тестов: по сегменту на каждый клип"""
+
+    calls = []
+    options = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, language=None, clip_timestamps=None, **kwargs):
+        from types import SimpleNamespace
+        from faster_whisper.transcribe import Segment
+
+        FakePipeline.calls.append(clip_timestamps)
+        FakePipeline.options.append(kwargs)
+        segments = [
+            Segment(0, 0, clip['start'], clip['end'], f' клип {index}', [], -0.1, 1.0, 0.01, None, 0.0)
+            for index, clip in enumerate(clip_timestamps)
+        ]
+        return iter(segments), SimpleNamespace(language=language, language_probability=1.0, duration=len(audio) / SECOND)
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    FakePipeline.calls = []
+    FakePipeline.options = []
+
+
+class TestInferenceBatcher:
+    """Тесты объединения задач в пакеты"""
+
+    def test_split_clips_to_whisper_window(self):
+        """Длинный участок речи делится на клипы по 30 секунд"""
+        clips = split_clips([{'start': 0, 'end': 70 * SECOND}])
+        assert clips == [
+            {'start': 0, 'end': 30 * SECOND},
+            {'start': 30 * SECOND, 'end': 60 * SECOND},
+            {'start': 60 * SECOND, 'end': 70 * SECOND},
+        ]
+
+    def test_concurrent_jobs_share_one_call(self):
+        """Одновременные задачи декодируются одним вызовом с исходным временем сегментов"""
+        batcher = InferenceBatcher(max_batch_size=4, max_wait=1, pipeline_factory=FakePipeline)
+        audio = np.zeros(10 * SECOND, dtype=np.float32)
+        results = {}
+
+        def job(name, chunks):
+            results[name] = batcher.transcribe('base', object(), audio, chunks, language='ru', beam_size=5)
+
+        threads = [
+            threading.Thread(target=job, args=('a', [{'start': 2 * SECOND, 'end': 4 * SECOND}])),
+            threading.Thread(target=job, args=('b', [{'start': 5 * SECOND, 'end': 6 * SECOND},
+                                                     {'start': 8 * SECOND, 'end': 9 * SECOND}])),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(FakePipeline.calls) == 1
+        segments_a, _, jobs_a = results['a']
+        segments_b, info_b, jobs_b = results['b']
+        assert jobs_a == jobs_b == 2
+        assert [(s.start, s.end) for s in segments_a] == [pytest.approx((2.0, 4.0))]
+        assert [(s.start, s.end) for s in segments_b] == [pytest.approx((5.0, 6.0)), pytest.approx((8.0, 9.0))]
+        assert [s.id for s in segments_b] == [1, 2]
+        assert batcher.stats()['batched_jobs'] == 2
+
+    def test_different_language_not_batched(self):
+        """Задачи с разными языками не попадают в один пакет"""
+        batcher = InferenceBatcher(max_batch_size=4, max_wait=0.05, pipeline_factory=FakePipeline)
+        audio = np.zeros(2 * SECOND, dtype=np.float32)
+        chunks = [{'start': 0, 'end': SECOND}]
+        batcher.transcribe('base', object(), audio, chunks, language='ru')
+        batcher.transcribe('base', object(), audio, chunks, language='en')
+        assert len(FakePipeline.calls) == 2
+
+    def test_different_options_not_batched(self):
+        """Одновременные задачи с разными параметрами декодирования декодируются каждая со своими"""
+        batcher = InferenceBatcher(max_batch_size=4, max_wait=0.3, pipeline_factory=FakePipeline)
+        audio = np.zeros(2 * SECOND, dtype=np.float32)
+        chunks = [{'start': 0, 'end': SECOND}]
+
+        threads = [
+            threading.Thread(target=batcher.transcribe, args=('base', object(), audio, chunks),
+                             kwargs={'language': 'ru', 'beam_size': beam_size})
+            for beam_size in (1, 5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert sorted(options['beam_size'] for options in FakePipeline.options) == [1, 5]
+
+    def test_pipeline_error_reaches_all_jobs(self):
+        """Ошибка пакета передается задаче"""
+        class BrokenPipeline:
+            def __init__(self, model):
+                pass
+
+            def transcribe(self, *args, **kwargs):
+                raise RuntimeError('boom')
+
+        batcher = InferenceBatcher(max_wait=0, pipeline_factory=BrokenPipeline)
+        with pytest.raises(RuntimeError):
+            batcher.transcribe('base', object(), np.zeros(SECOND, dtype=np.float32),
+                               [{'start': 0, 'end': SECOND}], language='ru')
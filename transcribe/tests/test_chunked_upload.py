@@ -0,0 +1,121 @@
+"""
+Тесты возобновляемой загрузки по частям
+"""
+import hashlib
+import json
+import pytest
+from transcribe import blob_store, csv_logger, chunked_upload, views
+from transcribe.models import ChunkedUpload, Transcription
+
+USER_UUID = '00000000-0000-0000-0000-000000000002'
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'blobs'
+    monkeypatch.setattr(blob_store, 'BLOB_STORE_DIR', str(path))
+    # Журнал загрузок пишется во временный каталог, а не в корень проекта
+    monkeypatch.setattr(csv_logger, 'CSV_FILE_PATH', str(tmp_path / 'uploads_log.csv'))
+    monkeypatch.setattr(chunked_upload, 'PARTS_DIR', str(path / 'parts'))
+    monkeypatch.setattr(views, 'enqueue_transcription', lambda *args: None)
+    return path
+
+
+def init_upload(client, content):
+    response = client.post('/upload/chunked/', json.dumps({
+        'filename': 'lecture.mp4', 'size': len(content), 'user_uuid': USER_UUID, 'whisper_model': 'small',
+    }), content_type='application/json')
+    assert response.status_code == 200
+    return response.json()['upload_id']
+
+
+def put_chunk(client, upload_id, offset, data, **headers):
+    return client.put(f'/upload/chunked/{upload_id}/?offset={offset}', data,
+                      content_type='application/octet-stream', **headers)
+
+
+@pytest.mark.django_db
+class TestChunkedUpload:
+    """Тесты протокола загрузки по частям"""
+
+    def test_resume_after_interruption(self, client, blob_dir):
+        """Загрузка продолжается с принятой позиции и завершается постановкой в очередь"""
+        content = bytes(range(256)) * 40
+        upload_id = init_upload(client, content)
+
+        assert put_chunk(client, upload_id, 0, content[:4000]).json()['received'] == 4000
+        # Обрыв: клиент узнает принятый объем и продолжает с него
+        assert client.get(f'/upload/chunked/{upload_id}/').json()['received'] == 4000
+        # Часть с дырой отклоняется
+        assert put_chunk(client, upload_id, 8000, content[8000:]).status_code == 409
+        response = put_chunk(client, upload_id, 4000, content[4000:],
+                             HTTP_X_CHUNK_SHA256=hashlib.sha256(content[4000:]).hexdigest())
+        assert response.json()['received'] == len(content)
+
+        response = client.post(f'/upload/chunked/{upload_id}/complete/')
+        assert response.status_code == 200
+        transcription = Transcription.objects.get(id=response.json()['transcription_ids'][0])
+        digest = hashlib.sha256(content).hexdigest()
+        assert transcription.content_hash == digest
+        assert transcription.whisper_model == 'small'
+        with open(transcription.original_file_path, 'rb') as f:
+            assert f.read() == content
+        assert list((blob_dir / 'parts').iterdir()) == []
+
+        # Повторное завершение возвращает ту же транскрипцию
+        again = client.post(f'/upload/chunked/{upload_id}/complete/').json()
+        assert again['transcription_ids'] == [transcription.id]
+
+    def test_bad_checksum_and_incomplete_file_rejected(self, client, blob_dir):
+        """Часть с неверной контрольной суммой не записывается, неполный файл не завершается"""
+        content = b'lecture' * 100
+        upload_id = init_upload(client, content)
+
+        response = put_chunk(client, upload_id, 0, content[:300], HTTP_X_CHUNK_SHA256='0' * 64)
+        assert response.status_code == 400
+        assert ChunkedUpload.objects.get(upload_id=upload_id).received == 0
+
+        put_chunk(client, upload_id, 0, content[:300])
+        assert client.post(f'/upload/chunked/{upload_id}/complete/').status_code == 409
+        assert not Transcription.objects.exists()
+
+    def test_parallel_uploads_rechecked_at_complete(self, client, blob_dir):
+        """Загрузки, начатые одновременно, не обходят оплату: она проверяется и при завершении"""
+        Transcription.objects.create(filename='first.mp3', ip_address='127.0.0.1', file_size=1)
+        content = b'lecture' * 10
+        first = init_upload(client, content)
+        second = init_upload(client, content)
+        put_chunk(client, first, 0, content)
+        put_chunk(client, second, 0, content)
+
+        assert client.post(f'/upload/chunked/{first}/complete/').status_code == 200
+        response = client.post(f'/upload/chunked/{second}/complete/')
+        assert response.status_code == 402
+        assert response.json()['requires_payment'] is True
+        assert Transcription.objects.count() == 2
+        # Принятый файл не потерян - после оплаты загрузку можно завершить
+        assert ChunkedUpload.objects.get(upload_id=second).transcription is None
+        assert client.get(f'/upload/chunked/{second}/').json()['received'] == len(content)
+
+    def test_failed_complete_leaves_no_orphaned_blob(self, client, blob_dir, monkeypatch):
+        """Откат транзакции при завершении не оставляет файл в хранилище, загрузку можно завершить снова"""
+        content = b'lecture' * 50
+        upload_id = init_upload(client, content)
+        put_chunk(client, upload_id, 0, content)
+        digest = hashlib.sha256(content).hexdigest()
+
+        def failing_token(self):
+            raise RuntimeError('сбой при создании транскрипции')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(Transcription, 'generate_public_token', failing_token)
+            with pytest.raises(RuntimeError):
+                client.post(f'/upload/chunked/{upload_id}/complete/')
+
+        assert not Transcription.objects.exists()
+        assert not (blob_dir / digest[:2]).exists()
+        assert len(list((blob_dir / 'parts').iterdir())) == 1
+
+        response = client.post(f'/upload/chunked/{upload_id}/complete/')
+        assert response.status_code == 200
+        assert (blob_dir / digest[:2] / f'{digest}.mp4').exists()
@@ -0,0 +1,274 @@
+"""
+Тесты для очереди задач транскрибации
+"""
+from datetime import timedelta
+import pytest
+from django.utils import timezone
+from transcribe import job_queue
+from transcribe.models import Transcription, TranscriptionJob, TranscriptionWorker
+
+
+def create_transcription(**kwargs):
+    defaults = {
+        'filename': 'test.mp3',
+        'ip_address': '127.0.0.1',
+        'file_size': 1024,
+        'status': 'pending',
+    }
+    defaults.update(kwargs)
+    return Transcription.objects.create(**defaults)
+
+
+@pytest.mark.django_db
+class TestJobQueue:
+    """Тесты очереди задач в БД"""
+
+    def test_enqueue_fifo_positions(self):
+        """Задачи получают позиции в порядке постановки"""
+        first = create_transcription()
+        second = create_transcription()
+
+        assert job_queue.enqueue_transcription(first.id, '/tmp/1') == 1
+        assert job_queue.enqueue_transcription(second.id, '/tmp/2') == 2
+        # Повторная постановка не дублирует задачу
+        assert job_queue.enqueue_transcription(second.id, '/tmp/2') == 2
+        assert TranscriptionJob.objects.filter(transcription=second).count() == 1
+
+    def test_claim_order_and_position(self):
+        """Обработчик берет самую старую задачу, она получает позицию 0"""
+        first = create_transcription()
+        second = create_transcription()
+        job_queue.enqueue_transcription(first.id, '/tmp/1')
+        job_queue.enqueue_transcription(second.id, '/tmp/2')
+
+        job = job_queue.claim_next_job('worker-a')
+        assert job.transcription_id == first.id
+        assert job.state == 'running'
+        assert job.attempts == 1
+        assert job.worker_id == 'worker-a'
+        assert job_queue.get_queue_position(first.id) == 0
+        assert job_queue.get_queue_position(second.id) == 1
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу умершего обработчика подхватывает другой"""
+        transcription = create_transcription()
+        job_queue.enqueue_transcription(transcription.id, '/tmp/1')
+        job = job_queue.claim_next_job('worker-a')
+        assert job_queue.claim_next_job('worker-b') is None
+
+        TranscriptionJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = job_queue.claim_next_job('worker-b')
+        assert reclaimed.id == job.id
+        assert reclaimed.worker_id == 'worker-b'
+        assert reclaimed.attempts == 2
+
+    def test_max_attempts_marks_error(self):
+        """После исчерпания попыток задача и транскрипция помечаются ошибкой"""
+        transcription = create_transcription(status='processing')
+        TranscriptionJob.objects.create(
+            transcription=transcription,
+            file_path='/tmp/1',
+            state='running',
+            attempts=job_queue.TRANSCRIBE_JOB_MAX_ATTEMPTS,
+            worker_id='dead-worker',
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        assert job_queue.claim_next_job('worker-a') is None
+        transcription.refresh_from_db()
+        assert transcription.status == 'error'
+        assert TranscriptionJob.objects.get(transcription=transcription).state == 'failed'
+
+    def test_recover_orphaned_jobs(self):
+        """Прерванные задачи возвращаются в очередь при старте"""
+        transcription = create_transcription(status='processing')
+        TranscriptionJob.objects.create(
+            transcription=transcription,
+            file_path='/tmp/1',
+            state='running',
+            attempts=1,
+            worker_id='dead-worker',
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        assert job_queue.recover_orphaned_jobs() == 1
+        assert job_queue.get_queue_position(transcription.id) == 1
+
+    def test_run_once_records_result(self):
+        """Итоговое состояние задачи берется из статуса транскрипции"""
+        ok = create_transcription()
+        broken = create_transcription()
+        job_queue.enqueue_transcription(ok.id, '/tmp/ok')
+        job_queue.enqueue_transcription(broken.id, '/tmp/broken')
+
+        def target(transcription_id, file_path):
+            status = 'completed' if file_path == '/tmp/ok' else 'error'
+            Transcription.objects.filter(id=transcription_id).update(status=status, error_message='boom')
+
+        executor = job_queue.TranscriptionExecutor(max_workers=1, target=target, worker_id='worker-a')
+        assert executor.run_once() is True
+        assert executor.run_once() is True
+        assert executor.run_once() is False
+
+        assert TranscriptionJob.objects.get(transcription=ok).state == 'done'
+        failed = TranscriptionJob.objects.get(transcription=broken)
+        assert failed.state == 'failed'
+        assert failed.last_error == 'boom'
+        assert job_queue.get_queue_position(ok.id) is None
+
+    def test_stop_requeues_only_stopped_jobs(self):
+        """Задача, поток которой не остановился, не возвращается в очередь до истечения аренды"""
+        import threading
+        stuck = create_transcription()
+        idle = create_transcription()
+        job_queue.enqueue_transcription(stuck.id, '/tmp/stuck')
+        job_queue.enqueue_transcription(idle.id, '/tmp/idle')
+        executor = job_queue.TranscriptionExecutor(max_workers=1, worker_id='worker-a')
+        stuck_job = job_queue.claim_next_job('worker-a')
+        idle_job = job_queue.claim_next_job('worker-a')
+
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait, daemon=True)
+        thread.start()
+        executor._threads = [thread]
+        executor._running = {stuck_job.id: stuck.id}
+        try:
+            executor.stop(timeout=0.1)
+        finally:
+            release.set()
+
+        stuck_job.refresh_from_db()
+        idle_job.refresh_from_db()
+        assert stuck_job.state == 'running'
+        assert stuck_job.worker_id == 'worker-a'
+        assert idle_job.state == 'queued'
+        assert job_queue.claim_next_job('worker-b').id == idle_job.id
+
+    def test_once_mode_renews_leases(self, monkeypatch):
+        """transcribe_worker --once продлевает аренду выполняющихся задач"""
+        import threading
+        from django.core.management import call_command
+
+        transcription = create_transcription()
+        job_queue.enqueue_transcription(transcription.id, '/tmp/1')
+        heartbeats = []
+
+        def fake_run_job(job, target=None):
+            heartbeats.append([t.name for t in threading.enumerate() if t.name == 'transcribe-heartbeat'])
+            job_queue.finish_job(job, 'done')
+
+        monkeypatch.setattr(job_queue, 'run_job', fake_run_job)
+        monkeypatch.setattr(job_queue, '_executor', None)
+        call_command('transcribe_worker', '--once', '--threads', '1')
+
+        assert heartbeats == [['transcribe-heartbeat']]
+        assert TranscriptionJob.objects.get(transcription=transcription).state == 'done'
+        assert not [t for t in threading.enumerate() if t.name == 'transcribe-heartbeat']
+
+    def test_concurrent_jobs_counts_started_workers(self):
+        """Пакетирование имеет смысл только при нескольких запущенных потоках обработчиков"""
+        executor = job_queue.TranscriptionExecutor(max_workers=3, worker_id='worker-a', preload_models=[])
+        assert executor.concurrent_jobs == 1  # Задачи выполняются через run_once по одной
+        executor._worker_threads = 3
+        assert executor.concurrent_jobs == 3
+        assert job_queue.TranscriptionExecutor(max_workers=1).concurrent_jobs == 1
+
+    def test_readiness_reports_hot_models(self):
+        """Готовность учитывает только живые обработчики с предзагруженными моделями"""
+        assert job_queue.get_readiness()['ready'] is False
+
+        job_queue.report_worker('worker-a', ready=False, hot_models=[])
+        job_queue.report_worker('worker-b', ready=True, hot_models=[{'name': 'base', 'warmed': True, 'in_use': 0}])
+        state = job_queue.get_readiness()
+        assert state['ready'] is True
+        assert state['models'] == {'base': 1}
+        assert len(state['workers']) == 2
+
+        # Обработчик без пульса считается умершим
+        TranscriptionWorker.objects.filter(worker_id='worker-b').update(
+            last_seen=timezone.now() - timedelta(seconds=job_queue.TRANSCRIBE_JOB_LEASE_SECONDS + 1)
+        )
+        assert job_queue.get_readiness()['ready'] is False
+
+    def test_readiness_endpoint(self, client):
+        """Эндпоинт готовности отвечает 503 пока нет готовых обработчиков"""
+        assert client.get('/ready/').status_code == 503
+        job_queue.report_worker('worker-a', ready=True, hot_models=[{'name': 'base', 'warmed': True, 'in_use': 0}])
+        response = client.get('/ready/')
+        assert response.status_code == 200
+        assert response.json()['models'] == {'base': 1}
+
+
+class TestWorkerProcesses:
+    """Тесты распределения ядер между процессами-обработчиками"""
+
+    def test_plan_cpu_sets_even_split(self):
+        from transcribe.worker_processes import plan_cpu_sets
+        assert plan_cpu_sets(2, cpus=[0, 1, 2, 3]) == [[0, 1], [2, 3]]
+        assert plan_cpu_sets(3, cpus=list(range(8))) == [[0, 1], [2, 3], [4, 5]]
+
+    def test_plan_cpu_sets_more_processes_than_cpus(self):
+        from transcribe.worker_processes import plan_cpu_sets
+        assert plan_cpu_sets(3, cpus=[0, 1]) == [[0], [1], [0]]
+        assert plan_cpu_sets(0, cpus=[0, 1]) == []
+
+    def test_plan_cpu_sets_fixed_size(self):
+        from transcribe.worker_processes import plan_cpu_sets
+        assert plan_cpu_sets(2, cpus_per_process=3, cpus=list(range(8))) == [[0, 1, 2], [3, 4, 5]]
+
+    def test_worker_processes_are_not_daemonic(self, monkeypatch):
+        """Процессы-обработчики могут запускать свои процессы и останавливаются через stop()"""
+        from transcribe.worker_processes import WorkerProcessPool
+
+        class FakeProcess:
+            def __init__(self, **kwargs):
+                self.daemon = kwargs['daemon']
+                self.name = kwargs['name']
+                self.pid = 1
+                self.alive = False
+                self.calls = []
+
+            def start(self):
+                self.alive = True
+
+            def is_alive(self):
+                return self.alive
+
+            def terminate(self):
+                self.calls.append('terminate')
+                self.alive = False
+
+            def join(self, timeout=None):
+                self.calls.append('join')
+
+        pool = WorkerProcessPool(2, cpus_per_process=1)
+        monkeypatch.setattr(pool._context, 'Process', FakeProcess)
+        pool.start()
+        children = list(pool._children.values())
+        assert [child.daemon for child in children] == [False, False]
+
+        pool.stop(timeout=1)
+        assert [child.calls for child in children] == [['terminate', 'join'], ['terminate', 'join']]
+
+
+class TestWebWorkers:
+    """Тесты запуска обработчиков из веб-сервера"""
+
+    def test_only_one_web_process_starts_workers(self, monkeypatch, tmp_path):
+        """Обработчики запускает только веб-процесс, захвативший блокировку"""
+        fcntl = pytest.importorskip('fcntl')
+        lock_path = str(tmp_path / 'workers.lock')
+        monkeypatch.setattr(job_queue, '_web_workers_lock', None)
+
+        # Блокировку держит другой веб-процесс
+        with open(lock_path, 'a') as other:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            assert job_queue.acquire_web_workers_lock(lock_path) is False
+            assert job_queue._web_workers_lock is None
+
+        assert job_queue.acquire_web_workers_lock(lock_path) is True
+        job_queue._web_workers_lock.close()
+
+    def test_disabled_by_setting(self, monkeypatch):
+        """TRANSCRIBE_WEB_WORKERS=False - веб-сервер не запускает обработчики"""
+        monkeypatch.setattr(job_queue, 'TRANSCRIBE_WEB_WORKERS', False)
+        monkeypatch.setattr(job_queue, 'acquire_web_workers_lock', lambda path=None: pytest.fail('lock taken'))
+        assert job_queue.start_inprocess_workers() is None
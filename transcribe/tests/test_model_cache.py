@@ -0,0 +1,133 @@
+"""
+Тесты для кэша моделей Whisper
+"""
+import pytest
+from transcribe.model_cache import WhisperModelCache
+
+
+SIZES = {'tiny': 100, 'base': 200, 'small': 500}
+
+
+def make_cache(budget_mb, loaded=None):
+    loaded = loaded if loaded is not None else []
+
+    def loader(model_name):
+        loaded.append(model_name)
+        return object()
+
+    return WhisperModelCache(budget_mb=budget_mb, loader=loader, size_estimates=SIZES)
+
+
+def use(cache, model_name):
+    """Захватить модель и сразу освободить (как короткая транскрибация)"""
+    with cache.acquire(model_name) as model:
+        return model
+
+
+class TestWhisperModelCache:
+    """Тесты LRU кэша моделей"""
+
+    def test_hits_and_misses(self):
+        """Повторный запрос модели не загружает ее заново"""
+        loaded = []
+        cache = make_cache(1000, loaded)
+        first = use(cache, 'base')
+        assert use(cache, 'base') is first
+        assert loaded == ['base']
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['used_mb'] == 200
+
+    def test_lru_eviction_over_budget(self):
+        """При нехватке бюджета выгружается давно не использованная модель"""
+        cache = make_cache(700)
+        use(cache, 'tiny')
+        use(cache, 'base')
+        use(cache, 'tiny')  # base теперь самая старая
+        use(cache, 'small')
+        assert cache.loaded_models() == ['tiny', 'small']
+        assert cache.stats()['evictions'] == 1
+
+    def test_in_use_model_is_not_evicted(self):
+        """Захваченная модель остается в кэше даже сверх бюджета"""
+        cache = make_cache(600)
+        handle = cache.acquire('base')
+        small = cache.acquire('small')
+        assert cache.loaded_models() == ['base', 'small']
+        assert cache.used_mb() == 700
+
+        # После освобождения кэш возвращается в бюджет за счет давно использованной модели
+        handle.release()
+        assert cache.loaded_models() == ['small']
+        handle.release()  # Повторное освобождение безопасно
+        small.release()
+        assert cache.stats()['models'][0]['in_use'] == 0
+
+    def test_handle_context_manager(self):
+        """Handle освобождает модель при выходе из блока with"""
+        cache = make_cache(1000)
+        with cache.acquire('tiny') as model:
+            assert model is not None
+            assert cache.evict('tiny') is False
+        assert cache.evict('tiny') is True
+        assert cache.loaded_models() == []
+
+    def test_load_error_is_counted(self):
+        """Ошибка загрузки не оставляет запись в кэше"""
+        def loader(model_name):
+            raise RuntimeError('no model')
+
+        cache = WhisperModelCache(budget_mb=1000, loader=loader, size_estimates=SIZES)
+        with pytest.raises(RuntimeError):
+            cache.acquire('base')
+        assert cache.loaded_models() == []
+        assert cache.stats()['load_errors'] == 1
+
+    def test_slow_load_does_not_block_other_models(self):
+        """Загрузка одной модели не блокирует получение другой"""
+        import threading
+
+        release_small = threading.Event()
+        started_small = threading.Event()
+
+        def loader(model_name):
+            if model_name == 'small':
+                started_small.set()
+                release_small.wait(5)
+            return object()
+
+        cache = WhisperModelCache(budget_mb=1000, loader=loader, size_estimates=SIZES)
+        use(cache, 'tiny')
+        thread = threading.Thread(target=use, args=(cache, 'small'))
+        thread.start()
+        assert started_small.wait(5)
+
+        # tiny уже в кэше, base загружается независимо от small
+        use(cache, 'tiny')
+        use(cache, 'base')
+        release_small.set()
+        thread.join(5)
+        assert set(cache.loaded_models()) == {'tiny', 'base', 'small'}
+
+    def test_preload_warms_up_models(self):
+        """Предзагрузка прогревает модели и пропускает недоступные"""
+        class FakeModel:
+            calls = 0
+
+            def transcribe(self, audio, **kwargs):
+                FakeModel.calls += 1
+                return iter([]), None
+
+        def loader(model_name):
+            if model_name == 'small':
+                raise RuntimeError('no model')
+            return FakeModel()
+
+        cache = WhisperModelCache(budget_mb=1000, loader=loader, size_estimates=SIZES)
+        assert cache.preload(['tiny', 'small', 'base']) == ['tiny', 'base']
+        assert FakeModel.calls == 2
+        assert cache.hot_models() == [
+            {'name': 'tiny', 'warmed': True, 'in_use': 0},
+            {'name': 'base', 'warmed': True, 'in_use': 0},
+        ]
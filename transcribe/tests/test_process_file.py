@@ -0,0 +1,473 @@
+"""
+Тесты конвейера обработки файла (process_file)
+"""
+import pytest
+from transcribe import views
+from transcribe.models import Transcription
+
+
+class FakeModel:
+    """Модель Whisper для тестов: определяет заданный язык"""
+
+    def __init__(self, language):
+        self.language = language
+
+    def detect_language(self, audio=None, **kwargs):
+        return self.language, 0.97, [(self.language, 0.97)]
+
+
+class FakeHandle:
+    def __init__(self, model, name='base'):
+        self.model = model
+        self.name = name
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self.model
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    """Стерео WAV 44.1 кГц, 3 секунды тона 440 Гц"""
+    import wave
+    import numpy as np
+
+    rate = 44100
+    tone = (np.sin(2 * np.pi * 440 * np.arange(rate * 3) / rate) * 10000).astype('<i2')
+    path = tmp_path / 'tone.wav'
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.repeat(tone, 2).tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def media_file(tmp_path):
+    path = tmp_path / 'lecture.mp4'
+    path.write_bytes(b'fake video data')
+    return str(path)
+
+
+class TestAudioDecoding:
+    """Тесты декодирования аудио в память"""
+
+    def test_decode_matches_faster_whisper(self, wav_file):
+        """Потоковое декодирование совпадает с faster_whisper.decode_audio"""
+        import numpy as np
+        from faster_whisper import decode_audio
+        from transcribe.audio import decode_media_audio, probe_duration
+
+        audio = decode_media_audio(wav_file)
+        assert audio.dtype == np.float32
+        assert len(audio) == 3 * 16000
+        assert np.array_equal(audio, decode_audio(wav_file))
+        assert probe_duration(wav_file) == pytest.approx(3.0)
+
+    def test_decode_prefix_stops_early(self, wav_file):
+        """Для определения языка декодируется только начало записи"""
+        from transcribe.audio import decode_audio_prefix
+
+        assert len(decode_audio_prefix(wav_file, seconds=1)) == 16000
+
+    def test_decode_reports_progress(self, wav_file):
+        """Прогресс декодирования передается в процентах от длительности"""
+        from transcribe.audio import ProgressReporter, decode_media_audio
+
+        reported = []
+        decode_media_audio(wav_file, duration=3.0, progress_callback=ProgressReporter(3.0, reported.append, interval=0))
+        assert reported[0] == 0
+        assert reported == sorted(reported)
+        assert 90 <= reported[-1] <= 99
+
+    def test_ffmpeg_progress_and_stall(self, tmp_path):
+        """Прогресс ffmpeg читается из -progress, зависший процесс останавливается"""
+        import subprocess
+        from transcribe.audio import run_ffmpeg_with_progress
+
+        script = tmp_path / 'fake_ffmpeg.sh'
+        script.write_text('#!/bin/sh\necho out_time_us=1500000\necho progress=continue\necho out_time_us=3000000\necho progress=end\n')
+        script.chmod(0o755)
+        positions = []
+        returncode, _ = run_ffmpeg_with_progress([str(script), '-i', 'x'], progress_callback=positions.append)
+        assert returncode == 0
+        assert positions == [1.5, 3.0]
+
+        hanging = tmp_path / 'hanging_ffmpeg.sh'
+        hanging.write_text('#!/bin/sh\nexec sleep 30\n')
+        hanging.chmod(0o755)
+        with pytest.raises(subprocess.TimeoutExpired):
+            run_ffmpeg_with_progress([str(hanging)], stall_timeout=1)
+
+    def test_extraction_deadline_scales_with_duration(self):
+        """Лимит времени извлечения растет с длиной записи"""
+        from transcribe.audio import EXTRACT_AUDIO_MIN_TIMEOUT, extraction_deadline
+
+        assert extraction_deadline(None) is None
+        assert extraction_deadline(60) == EXTRACT_AUDIO_MIN_TIMEOUT
+        assert extraction_deadline(4 * 3600) > extraction_deadline(3600) > EXTRACT_AUDIO_MIN_TIMEOUT
+
+
+@pytest.mark.django_db
+class TestLanguageDetectionStage:
+    """Тесты быстрого определения языка"""
+
+    def test_non_russian_pauses_before_heavy_work(self, monkeypatch, media_file):
+        """Не-русский язык приостанавливает обработку до слайдов и извлечения аудио"""
+        import numpy as np
+
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=15, extract_screenshots=True
+        )
+        monkeypatch.setattr(views, 'decode_audio_prefix', lambda path: np.zeros(16000, dtype=np.float32))
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(FakeModel('en'), name))
+
+        def fail(*args, **kwargs):
+            raise AssertionError('тяжелый этап не должен запускаться')
+
+        monkeypatch.setattr(views, 'extract_audio', fail)
+        monkeypatch.setattr(views, 'extract_screenshots_from_video', fail)
+
+        views.process_file(transcription.id, media_file)
+
+        transcription.refresh_from_db()
+        assert transcription.status == 'pending'
+        assert transcription.detected_language == 'en'
+        assert transcription.language_confirmed is False
+        assert 'Требуется подтверждение' in transcription.transcription_logs
+
+    def test_detection_failure_falls_through(self, monkeypatch, media_file):
+        """Ошибка определения языка не останавливает обработку"""
+        transcription = Transcription.objects.create(filename='lecture.mp4', ip_address='127.0.0.1', file_size=15)
+
+        def broken_decode(path):
+            raise Exception('ffmpeg не найден')
+
+        def stop_at_audio(input_path, output_path, **kwargs):
+            raise Exception('дошли до извлечения аудио')
+
+        monkeypatch.setattr(views, 'decode_audio_prefix', broken_decode)
+        monkeypatch.setattr(views, 'extract_audio', stop_at_audio)
+
+        views.process_file(transcription.id, media_file)
+
+        transcription.refresh_from_db()
+        assert transcription.status == 'error'
+        assert 'дошли до извлечения аудио' in transcription.error_message
+        assert transcription.detected_language is None
+
+
+class SegmentModel:
+    """Модель Whisper для тестов: возвращает один сегмент в начале переданного аудио"""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        from types import SimpleNamespace
+        from faster_whisper.transcribe import Segment
+
+        self.calls.append(len(audio))
+        segment = Segment(0, 0, 0.0, 1.0, ' Привет', [], -0.1, 1.0, 0.01, None, 0.0)
+        info = SimpleNamespace(language='ru', language_probability=0.99, duration=len(audio) / 16000)
+        return iter([segment]), info
+
+
+class TestSpeechStrategy:
+    """Тесты анализа речи перед декодированием"""
+
+    def test_speech_only_restores_timestamps(self):
+        """Декодируются только участки речи, время возвращается к исходной шкале"""
+        import numpy as np
+        from transcribe.audio import transcribe_speech
+
+        audio = np.zeros(16000 * 10, dtype=np.float32)
+        model = SegmentModel()
+        segments, info = transcribe_speech(model, audio, [{'start': 16000 * 6, 'end': 16000 * 8}], beam_size=5)
+        segments = list(segments)
+
+        assert model.calls == [16000 * 2]
+        assert segments[0].start == pytest.approx(6.0)
+        assert segments[0].end == pytest.approx(7.0)
+
+    def test_plan_chunks_splits_at_pauses(self):
+        """Части собираются из целых участков речи"""
+        from transcribe.audio import plan_chunks
+
+        second = 16000
+        chunks = [{'start': i * 10 * second, 'end': (i * 10 + 4) * second} for i in range(5)]
+        windows = plan_chunks(chunks, chunk_seconds=8)
+        assert [len(window) for window in windows] == [2, 2, 1]
+        assert windows[1][0] == chunks[2]
+
+    def test_parallel_chunks_keep_global_timestamps(self):
+        """Сегменты частей склеиваются по порядку с глобальным временем"""
+        import numpy as np
+        from transcribe.audio import transcribe_chunks_parallel
+
+        second = 16000
+        audio = np.zeros(second * 60, dtype=np.float32)
+        windows = [
+            [{'start': 0, 'end': 5 * second}],
+            [{'start': 20 * second, 'end': 25 * second}],
+            [{'start': 40 * second, 'end': 45 * second}],
+        ]
+        segments, info = transcribe_chunks_parallel(SegmentModel(), audio, windows, workers=3, beam_size=5)
+        segments = list(segments)
+
+        assert [segment.start for segment in segments] == pytest.approx([0.0, 20.0, 40.0])
+        assert [segment.id for segment in segments] == [1, 2, 3]
+        assert info.language == 'ru'
+
+    def test_parallel_chunks_stream_in_order(self):
+        """Сегменты первой части отдаются, не дожидаясь следующих частей"""
+        import threading
+        import numpy as np
+        from transcribe.audio import transcribe_chunks_parallel
+
+        second = 16000
+        audio = np.zeros(second * 60, dtype=np.float32)
+        windows = [[{'start': 0, 'end': 5 * second}], [{'start': 20 * second, 'end': 25 * second}]]
+        first_read = threading.Event()
+
+        class SlowTailModel(SegmentModel):
+            def transcribe(self, audio, **kwargs):
+                segments, info = super().transcribe(audio, **kwargs)
+                if len(self.calls) == 1:
+                    return segments, info
+
+                def slow():
+                    assert first_read.wait(5)
+                    yield from segments
+                return slow(), info
+
+        segments, info = transcribe_chunks_parallel(SlowTailModel(), audio, windows, workers=2)
+        assert next(segments).start == pytest.approx(0.0)
+        first_read.set()
+        assert [segment.start for segment in segments] == pytest.approx([20.0])
+
+
+@pytest.mark.django_db
+class TestSilentFile:
+    """Тесты обработки файла без речи"""
+
+    def test_silence_skips_decoding(self, monkeypatch, media_file):
+        """Запись без речи завершается без вызова декодера"""
+        import numpy as np
+
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=15, selected_language='ru'
+        )
+        model = SegmentModel()
+
+        monkeypatch.setattr(views, 'decode_media_audio', lambda path, **kwargs: np.zeros(16000 * 5, dtype=np.float32))
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(model, name))
+
+        views.process_file(transcription.id, media_file)
+
+        transcription.refresh_from_db()
+        assert transcription.status == 'completed'
+        assert transcription.transcribed_text == ''
+        assert model.calls == []
+        assert 'речь не найдена' in transcription.transcription_logs
+
+
+@pytest.mark.django_db
+class TestSegmentWriter:
+    """Тесты пачечного сохранения сегментов"""
+
+    def test_partial_text_is_flushed_in_batches(self):
+        """Частичный текст и позиция сохраняются каждые batch_size сегментов"""
+        from types import SimpleNamespace
+        from transcribe.segments import SegmentWriter
+
+        transcription = Transcription.objects.create(filename='a.mp3', ip_address='127.0.0.1', file_size=1)
+        writer = SegmentWriter(transcription.id, batch_size=2, interval=3600)
+
+        writer.add(SimpleNamespace(start=0.0, end=1.5, text=' Первый'))
+        transcription.refresh_from_db()
+        assert transcription.transcribed_text in (None, '')
+
+        writer.add(SimpleNamespace(start=1.5, end=3.0, text='  '))
+        transcription.refresh_from_db()
+        assert transcription.transcribed_text == 'Первый'
+        assert transcription.progress_seconds == 3.0
+
+        writer.add(SimpleNamespace(start=3.0, end=4.0, text=' второй'))
+        writer.flush()
+        transcription.refresh_from_db()
+        assert transcription.transcribed_text == 'Первый второй'
+        assert writer.count == 2
+
+    def test_status_exposes_partial_text(self, client):
+        """Статус отдает частичный текст и процент обработки"""
+        transcription = Transcription.objects.create(
+            filename='a.mp3', ip_address='127.0.0.1', file_size=1, status='processing',
+            transcribed_text='Начало лекции', progress_seconds=30.0, media_duration=120.0
+        )
+        data = client.get(f'/transcription/{transcription.id}/status/').json()
+        assert data['partial_text'] == 'Начало лекции'
+        assert data['progress_percent'] == 25
+        assert data['text'] is None
+
+    def test_segments_stored_with_timestamps(self):
+        """Непустые сегменты сохраняются строками таблицы с временными метками"""
+        from types import SimpleNamespace
+        from transcribe.segments import SegmentWriter
+
+        transcription = Transcription.objects.create(filename='a.mp3', ip_address='127.0.0.1', file_size=1)
+        writer = SegmentWriter(transcription.id, batch_size=10, interval=3600)
+        writer.add(SimpleNamespace(start=0.0, end=2.0, text=' Первый', avg_logprob=-0.2, words=None))
+        writer.add(SimpleNamespace(start=2.0, end=3.0, text=' '))
+        assert transcription.segments.count() == 0
+        writer.flush()
+
+        rows = list(transcription.segments.values_list('start', 'end', 'text', 'avg_logprob'))
+        assert rows == [(0.0, 2.0, 'Первый', -0.2)]
+
+        resumed = SegmentWriter(transcription.id)
+        assert resumed.resume() == 2.0
+        assert resumed.text == 'Первый'
+
+    def test_text_aligned_to_slides_by_time(self, client):
+        """Текст слайда - сегменты между его временной меткой и следующей"""
+        from transcribe.models import Screenshot, Segment
+
+        transcription = Transcription.objects.create(
+            filename='a.mp4', ip_address='127.0.0.1', file_size=1, status='completed',
+            transcribed_text='Вступление. Первый слайд. Второй слайд.'
+        )
+        for order, timestamp in enumerate([10.0, 60.0]):
+            Screenshot.objects.create(transcription=transcription, timestamp=timestamp, image_path=f's{order}.jpg', order=order)
+        Segment.objects.bulk_create([
+            Segment(transcription=transcription, start=start, end=start + 5, text=text)
+            for start, text in [(0.0, 'Вступление.'), (15.0, 'Первый слайд.'), (70.0, 'Второй слайд.')]
+        ])
+
+        slides = client.get(f'/transcription/{transcription.id}/').context['slides']
+        assert [slide['text'] for slide in slides] == ['Вступление. Первый слайд.', 'Второй слайд.']
+
+        response = client.get(f'/transcription/{transcription.id}/download-text/?format=srt')
+        assert response['Content-Disposition'].endswith('.srt"')
+        assert response.content.decode().startswith('1\n00:00:00,000 --> 00:00:05,000\nВступление.\n')
+
+
+@pytest.mark.django_db
+class TestCheckpointResume:
+    """Тесты продолжения прерванной транскрибации"""
+
+    def test_resume_decodes_only_remaining_audio(self, monkeypatch, media_file):
+        """Повторный запуск декодирует запись с конца последнего сохраненного сегмента"""
+        import numpy as np
+        from transcribe.models import Segment
+
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=15, selected_language='ru'
+        )
+        Segment.objects.create(transcription=transcription, start=0.0, end=4.0, text='Начало.')
+        model = SegmentModel()
+        analyzed = []
+
+        def fake_analyze(audio):
+            analyzed.append(len(audio))
+            return {
+                'strategy': 'speech_only', 'speech_chunks': [{'start': 0, 'end': 2 * 16000}],
+                'speech_seconds': 2.0, 'total_seconds': len(audio) / 16000, 'windows': [],
+            }
+
+        monkeypatch.setattr(views, 'decode_media_audio', lambda path, **kwargs: np.zeros(16000 * 10, dtype=np.float32))
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(model, name))
+        monkeypatch.setattr(views, 'analyze_speech', fake_analyze)
+        monkeypatch.setattr(views, 'TRANSCRIBE_BATCHING', False)
+
+        views.process_file(transcription.id, media_file)
+
+        transcription.refresh_from_db()
+        assert transcription.status == 'completed'
+        assert analyzed == [16000 * 6]
+        assert transcription.transcribed_text == 'Начало. Привет'
+        assert list(transcription.segments.values_list('start', 'end')) == [(0.0, 4.0), (4.0, 5.0)]
+        assert 'контрольной точки' in transcription.transcription_logs
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentScreenshots:
+    """Тесты параллельного извлечения слайдов"""
+
+    def test_screenshots_run_alongside_audio(self, monkeypatch, tmp_path):
+        """Слайды извлекаются одновременно с декодированием аудио, задача ждет оба этапа"""
+        import threading
+        import numpy as np
+        from transcribe.models import Screenshot
+
+        video = tmp_path / 'lecture.mp4'
+        video.write_bytes(b'fake video data')
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=15,
+            selected_language='ru', extract_screenshots=True
+        )
+        screenshots_started = threading.Event()
+        audio_decoded = threading.Event()
+        overlapped = []
+
+        def fake_screenshots(video_path, transcription_id, output_dir):
+            screenshots_started.set()
+            overlapped.append(audio_decoded.wait(5))
+            Screenshot.objects.create(transcription_id=transcription_id, timestamp=0.0, image_path='s.jpg')
+
+        def fake_decode(path, **kwargs):
+            screenshots_started.wait(5)
+            audio_decoded.set()
+            return np.zeros(16000 * 5, dtype=np.float32)
+
+        monkeypatch.setattr(views, 'extract_screenshots_from_video', fake_screenshots)
+        monkeypatch.setattr(views, 'decode_media_audio', fake_decode)
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(SegmentModel(), name))
+
+        views.process_file(transcription.id, str(video))
+
+        transcription.refresh_from_db()
+        assert overlapped == [True]
+        assert transcription.status == 'completed'
+        assert transcription.screenshot_status == 'completed'
+        assert transcription.screenshots.count() == 1
+
+    def test_rerun_does_not_duplicate_screenshots(self, monkeypatch, tmp_path):
+        """Повторный запуск задачи не дублирует слайды: недоизвлеченные удаляются, готовые остаются"""
+        import numpy as np
+        from transcribe.models import Screenshot
+
+        video = tmp_path / 'lecture.mp4'
+        video.write_bytes(b'fake video data')
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=15,
+            selected_language='ru', extract_screenshots=True, screenshot_status='processing'
+        )
+        # Слайд прерванного запуска
+        Screenshot.objects.create(transcription=transcription, timestamp=0.0, image_path='old.jpg')
+        extractions = []
+
+        def fake_screenshots(video_path, transcription_id, output_dir):
+            extractions.append(transcription_id)
+            Screenshot.objects.create(transcription_id=transcription_id, timestamp=0.0, image_path='s.jpg')
+
+        monkeypatch.setattr(views, 'extract_screenshots_from_video', fake_screenshots)
+        monkeypatch.setattr(views, 'decode_media_audio', lambda path, **kwargs: np.zeros(16000 * 5, dtype=np.float32))
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(SegmentModel(), name))
+
+        views.process_file(transcription.id, str(video))
+        assert list(transcription.screenshots.values_list('image_path', flat=True)) == ['s.jpg']
+
+        # Задачу подхватил другой обработчик после завершения извлечения слайдов
+        views.process_file(transcription.id, str(video))
+        transcription.refresh_from_db()
+        assert transcription.status == 'completed'
+        assert transcription.screenshot_status == 'completed'
+        assert transcription.screenshots.count() == 1
+        assert len(extractions) == 1
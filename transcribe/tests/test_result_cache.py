@@ -0,0 +1,132 @@
+"""
+Тесты хранилища по содержимому и повторного использования результатов
+"""
+import pytest
+from transcribe import blob_store, csv_logger, views
+from transcribe.models import Segment, Transcription
+from transcribe.result_cache import result_key
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'blobs'
+    monkeypatch.setattr(blob_store, 'BLOB_STORE_DIR', str(path))
+    # Журнал загрузок пишется во временный каталог, а не в корень проекта
+    monkeypatch.setattr(csv_logger, 'CSV_FILE_PATH', str(tmp_path / 'uploads_log.csv'))
+    return path
+
+
+class TestBlobStore:
+    """Тесты хранилища загруженных файлов"""
+
+    def test_identical_content_stored_once(self, blob_dir, tmp_path):
+        """Одинаковое содержимое сохраняется в один файл по хешу"""
+        import hashlib
+
+        path, digest, size, created = blob_store.store_chunks([b'lecture ', b'audio'], '.MP3')
+        assert digest == hashlib.sha256(b'lecture audio').hexdigest()
+        assert size == 13 and created
+        assert path == str(blob_dir / digest[:2] / f'{digest}.mp3')
+
+        source = tmp_path / 'copy.mp3'
+        source.write_bytes(b'lecture audio')
+        same_path, same_digest, _, created = blob_store.store_file(str(source))
+        assert (same_path, same_digest, created) == (path, digest, False)
+        assert [p.name for p in blob_dir.iterdir()] == [digest[:2]]  # Временные файлы удалены
+        assert blob_store.is_blob(path) and not blob_store.is_blob(str(source))
+
+
+@pytest.mark.django_db
+class TestResultCache:
+    """Тесты повторного использования результатов"""
+
+    def test_identical_job_copies_segments(self, monkeypatch, tmp_path):
+        """Задача с тем же файлом, моделью и языком завершается копированием сегментов"""
+        media = tmp_path / 'lecture.mp3'
+        media.write_bytes(b'same lecture')
+        key = result_key('abc', 'base', 'ru')
+        source = Transcription.objects.create(
+            filename='lecture.mp3', ip_address='127.0.0.1', file_size=12, status='completed',
+            transcribed_text='Привет мир', detected_language='ru', result_key=key, content_hash='abc'
+        )
+        Segment.objects.create(transcription=source, start=0.0, end=1.0, text='Привет')
+        Segment.objects.create(transcription=source, start=1.0, end=2.0, text='мир')
+        target = Transcription.objects.create(
+            filename='copy.mp3', ip_address='127.0.0.2', file_size=12, content_hash='abc', selected_language='ru'
+        )
+
+        def fail(*args, **kwargs):
+            raise AssertionError('декодирование не должно запускаться')
+
+        monkeypatch.setattr(views, 'decode_media_audio', fail)
+        monkeypatch.setattr(views, 'acquire_whisper_model', fail)
+
+        views.process_file(target.id, str(media))
+
+        target.refresh_from_db()
+        assert target.status == 'completed'
+        assert target.transcribed_text == 'Привет мир'
+        assert target.result_key == key
+        assert list(target.segments.values_list('start', 'text')) == [(0.0, 'Привет'), (1.0, 'мир')]
+        assert source.segments.count() == 2
+
+    def test_fallback_model_result_keyed_by_used_model(self, monkeypatch, tmp_path):
+        """Если выбранная модель не загрузилась, результат сохраняется под ключом fallback-модели"""
+        import numpy as np
+        from transcribe.tests.test_process_file import FakeHandle, SegmentModel
+
+        media = tmp_path / 'lecture.mp3'
+        media.write_bytes(b'lecture')
+        transcription = Transcription.objects.create(
+            filename='lecture.mp3', ip_address='127.0.0.1', file_size=7, content_hash='abc',
+            selected_language='ru', whisper_model='large-v3'
+        )
+        monkeypatch.setattr(views, 'decode_media_audio', lambda path, **kwargs: np.zeros(16000, dtype=np.float32))
+        monkeypatch.setattr(views, 'acquire_whisper_model', lambda name: FakeHandle(SegmentModel(), 'base'))
+
+        views.process_file(transcription.id, str(media))
+
+        transcription.refresh_from_db()
+        assert transcription.status == 'completed'
+        assert transcription.result_key == result_key('abc', 'base', 'ru')
+
+    def test_key_depends_on_model_and_language(self):
+        """Другая модель или язык - другой ключ; автоопределение отличается от явного языка"""
+        base = result_key('abc', 'base', 'ru')
+        assert base == result_key('abc', 'base', 'ru')
+        assert base != result_key('abc', 'small', 'ru')
+        assert base != result_key('abc', 'base', None)
+        assert base != result_key('abd', 'base', 'ru')
+
+
+@pytest.mark.django_db
+class TestBlobUpload:
+    """Тесты приема больших файлов сразу в хранилище"""
+
+    def test_large_upload_moved_without_copy(self, client, settings, blob_dir, monkeypatch):
+        """Большой файл хешируется при приеме и переименовывается, а не перечитывается"""
+        import hashlib
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 1024
+        content = b'x' * 5000
+
+        def fail(*args, **kwargs):
+            raise AssertionError('файл не должен перечитываться')
+
+        monkeypatch.setattr(views, 'store_chunks', fail)
+        monkeypatch.setattr(views, 'enqueue_transcription', lambda *args: None)
+
+        response = client.post('/upload/', {
+            'file': SimpleUploadedFile('lecture.mp4', content, content_type='video/mp4'),
+            'user_uuid': '00000000-0000-0000-0000-000000000001',
+        })
+
+        assert response.status_code == 200
+        transcription = Transcription.objects.get(id=response.json()['transcription_ids'][0])
+        digest = hashlib.sha256(content).hexdigest()
+        assert transcription.content_hash == digest
+        assert transcription.original_file_path == str(blob_dir / digest[:2] / f'{digest}.mp4')
+        with open(transcription.original_file_path, 'rb') as f:
+            assert f.read() == content
+        assert [p.name for p in blob_dir.iterdir()] == [digest[:2]]  # Временный файл не остался
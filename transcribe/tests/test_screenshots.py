@@ -0,0 +1,329 @@
+"""
+Тесты извлечения слайдов из видео
+"""
+import os
+import pytest
+from transcribe import views
+from transcribe.models import Transcription
+
+
+def write_video(path, frames, fourcc='MJPG'):
+    """Видео 10 кадров/с 960x540: каждый кадр показывается 3 секунды"""
+    import cv2
+
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), 10, (960, 540))
+    for frame in frames:
+        for _ in range(30):
+            writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def write_slides_video(path, brightnesses):
+    """Видео 10 кадров/с: по слайду заданной яркости на каждые 3 секунды"""
+    import numpy as np
+
+    return write_video(path, [np.full((540, 960, 3), brightness, dtype=np.uint8) for brightness in brightnesses])
+
+
+def text_slide(lines):
+    """Слайд общего шаблона (белый фон, шапка) с текстом"""
+    import cv2
+    import numpy as np
+
+    frame = np.full((540, 960, 3), 255, dtype=np.uint8)
+    frame[:60] = (120, 60, 20)
+    for index, text in enumerate(lines):
+        cv2.putText(frame, text, (40, 140 + index * 80), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 0, 0), 6)
+    return frame
+
+
+def detect_in_ranges(video_path, output_dir, parts):
+    """Найти слайды по диапазонам и склеить (выполняется в процессе пула)"""
+    from transcribe.slides import detect_slide_ranges, merge_slide_ranges, plan_slide_ranges, video_info
+
+    os.makedirs(output_dir, exist_ok=True)
+    fps, total_frames = video_info(video_path)
+    tasks = [
+        (video_path, start, end, fps, output_dir, f"range_{index:02d}")
+        for index, (start, end) in enumerate(plan_slide_ranges(total_frames, fps, parts))
+    ]
+    return [slide['timestamp'] for slide in merge_slide_ranges(detect_slide_ranges(tasks))]
+
+
+@pytest.fixture
+def slides_video(tmp_path):
+    """Три разных слайда по 3 секунды"""
+    return write_slides_video(tmp_path / 'slides.avi', (30, 200, 100))
+
+
+@pytest.mark.django_db
+class TestSlideDetection:
+    """Тесты детекции смены слайдов"""
+
+    def test_slides_detected_with_sampling(self, slides_video, tmp_path, monkeypatch):
+        """Смены слайдов находятся, а в BGR преобразуются только анализируемые кадры"""
+        import cv2
+
+        transcription = Transcription.objects.create(filename='slides.avi', ip_address='127.0.0.1', file_size=1)
+        retrieved = []
+
+        video_capture = cv2.VideoCapture
+
+        class CountingCapture:
+            # Обертка, а не подкласс: подклассы типов cv2 падают при сборке мусора
+            def __init__(self, *args):
+                self.capture = video_capture(*args)
+
+            def __getattr__(self, name):
+                return getattr(self.capture, name)
+
+            def retrieve(self, *args):
+                retrieved.append(1)
+                return self.capture.retrieve(*args)
+
+        monkeypatch.setattr(cv2, 'VideoCapture', CountingCapture)
+
+        screenshots = views.extract_screenshots_from_video(slides_video, transcription.id, str(tmp_path / 'out'))
+
+        assert [s.timestamp for s in screenshots] == pytest.approx([0.0, 3.0, 6.0])
+        assert len(retrieved) == 18  # Каждый 5-й кадр из 90 (шаг 0.5 с)
+
+    def test_slides_encoded_off_thread_and_saved_in_bulk(self, slides_video, tmp_path, monkeypatch):
+        """JPEG кодируется вне потока анализа, строки Screenshot пишутся одним запросом"""
+        import threading
+        import cv2
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        transcription = Transcription.objects.create(filename='slides.avi', ip_address='127.0.0.1', file_size=1)
+        writer_threads = []
+        imwrite = cv2.imwrite
+
+        def recording_imwrite(*args):
+            writer_threads.append(threading.current_thread())
+            return imwrite(*args)
+
+        monkeypatch.setattr(cv2, 'imwrite', recording_imwrite)
+
+        with CaptureQueriesContext(connection) as queries:
+            screenshots = views.extract_screenshots_from_video(slides_video, transcription.id, str(tmp_path / 'out'))
+
+        assert len(screenshots) == 3 and transcription.screenshots.count() == 3
+        assert writer_threads and threading.current_thread() not in writer_threads
+        assert len([q for q in queries.captured_queries if q['sql'].startswith('INSERT')]) == 1
+
+    def test_parallel_ranges_do_not_duplicate_slides(self, slides_video, tmp_path, monkeypatch):
+        """Видео, разбитое на диапазоны внутри слайдов, дает те же слайды без повторов на стыках"""
+        transcription = Transcription.objects.create(filename='slides.avi', ip_address='127.0.0.1', file_size=1)
+        monkeypatch.setattr(views, 'SCREENSHOT_PARALLEL_RANGES', 4)
+        monkeypatch.setattr(views, 'SCREENSHOT_RANGE_MIN_SECONDS', 1)
+        output_dir = tmp_path / 'out'
+
+        screenshots = views.extract_screenshots_from_video(slides_video, transcription.id, str(output_dir))
+
+        assert [s.timestamp for s in screenshots] == pytest.approx([0.0, 3.0, 6.0])
+        assert sorted(p.name for p in output_dir.glob('*.jpg') if not p.name.endswith('_thumb.jpg')) == [
+            f'screenshot_{i:04d}.jpg' for i in range(3)
+        ]
+        assert len(list(output_dir.iterdir())) == 9  # Отброшенные на стыках слайды удалены вместе с копиями
+
+    def test_parallel_ranges_inside_daemonic_worker(self, slides_video, tmp_path):
+        """В процессе пула (демоническом) диапазоны обрабатываются потоками, слайды не теряются"""
+        import multiprocessing
+
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            pytest.skip('нужен fork')
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            timestamps = pool.apply(detect_in_ranges, (slides_video, str(tmp_path / 'out'), 3))
+
+        assert timestamps == pytest.approx([0.0, 3.0, 6.0])
+
+    def test_merge_compares_seams_with_last_accepted_slide(self, tmp_path):
+        """Оба стыка повторяют предыдущий слайд, хотя последний слайд второго диапазона отброшен"""
+        import numpy as np
+        from transcribe.slides import merge_slide_ranges
+
+        def slide(timestamp, brightness, image_hash):
+            # Разные хеши: повторы на стыках отсекает только сверка кадров, а не SlideIndex
+            gray = np.full((36, 64), brightness, dtype=np.uint8)
+            path = tmp_path / f'slide_{timestamp:g}.jpg'
+            path.write_bytes(b'jpeg')
+            return {
+                'timestamp': timestamp, 'path': str(path), 'renditions': {}, 'diff': None,
+                'gray': gray, 'hash': image_hash, 'fingerprint': gray,
+            }
+
+        merged = merge_slide_ranges([
+            [slide(0, 30, 0), slide(3, 200, 0x5555555555555555)],
+            # Повтор слайда 200 на стыке, новый слайд 100 и кадр через 1 с после него
+            [slide(6, 200, 0xAAAAAAAAAAAAAAAA), slide(9, 100, 0xFFFFFFFFFFFFFFFF), slide(10, 120, 0x3333333333333333)],
+            # Повтор слайда 100 на стыке
+            [slide(12, 100, 0xCCCCCCCCCCCCCCCC)],
+        ])
+
+        assert [s['timestamp'] for s in merged] == [0, 3, 9]
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['slide_0.jpg', 'slide_3.jpg', 'slide_9.jpg']
+
+    def test_returning_to_earlier_slide_is_not_saved_again(self, tmp_path, monkeypatch):
+        """Возврат к прежнему слайду не дает повтора, неизменные кадры не размываются"""
+        from transcribe import slides
+
+        video = write_slides_video(tmp_path / 'return.avi', (30, 200, 30, 100))
+        transcription = Transcription.objects.create(filename='return.avi', ip_address='127.0.0.1', file_size=1)
+        blurred = []
+        blur_frame = slides.blur_frame
+
+        def counting_blur(gray):
+            blurred.append(1)
+            return blur_frame(gray)
+
+        monkeypatch.setattr(slides, 'blur_frame', counting_blur)
+
+        screenshots = views.extract_screenshots_from_video(video, transcription.id, str(tmp_path / 'out'))
+
+        assert [s.timestamp for s in screenshots] == pytest.approx([0.0, 3.0, 9.0])
+        assert len(blurred) == 4  # Только кадры со сменой картинки из 24 анализируемых
+        assert all(len(s.image_hash) == 16 for s in transcription.screenshots.all())
+
+    def test_text_slides_with_same_template(self, tmp_path):
+        """Слайды одного шаблона с переставленными строками различаются, хотя гистограммы яркости совпадают"""
+        lines = ['Regression', 'Gradient descent', 'Loss', 'Regularization terms', 'Validation']
+        # Без потерь (как запись экрана): шум сжатия не меняет гистограмму
+        video = write_video(tmp_path / 'template.avi', [text_slide(lines), text_slide(lines[::-1])], fourcc='FFV1')
+        transcription = Transcription.objects.create(filename='template.avi', ip_address='127.0.0.1', file_size=1)
+
+        screenshots = views.extract_screenshots_from_video(video, transcription.id, str(tmp_path / 'out'))
+
+        assert [s.timestamp for s in screenshots] == pytest.approx([0.0, 3.0])
+
+    def test_thumbnail_and_webp_saved_with_slide(self, slides_video, tmp_path, settings):
+        """Рядом с оригиналом сохраняются миниатюра и WebP, пути записаны в Screenshot"""
+        import cv2
+
+        settings.MEDIA_ROOT = str(tmp_path)
+        transcription = Transcription.objects.create(filename='slides.avi', ip_address='127.0.0.1', file_size=1)
+        output_dir = tmp_path / 'out'
+
+        views.extract_screenshots_from_video(slides_video, transcription.id, str(output_dir))
+
+        first = transcription.screenshots.first()
+        assert first.thumbnail_path.endswith('screenshot_0000_thumb.jpg')
+        assert first.webp_path.endswith('screenshot_0000.webp')
+        assert first.preview_path == first.thumbnail_path
+        media = lambda path: os.path.join(settings.MEDIA_ROOT, path)
+        assert cv2.imread(media(first.image_path)).shape[1] == 960
+        assert cv2.imread(media(first.thumbnail_path)).shape[1] == 320
+        assert len(list(output_dir.iterdir())) == 9  # Три слайда по три файла
+
+
+@pytest.mark.django_db
+class TestSlidePages:
+    """Тесты показа слайдов на страницах"""
+
+    @pytest.mark.parametrize('page', ['', 'view/'])
+    def test_pages_show_renditions_and_link_original(self, client, settings, page):
+        """На странице - WebP и миниатюра, оригинал только по ссылке"""
+        from transcribe.models import Screenshot
+
+        transcription = Transcription.objects.create(
+            filename='slides.avi', ip_address='127.0.0.1', file_size=1, status='completed', transcribed_text='Текст'
+        )
+        Screenshot.objects.create(
+            transcription=transcription, timestamp=0.0, order=0, image_path='screenshots/1/s.jpg',
+            thumbnail_path='screenshots/1/s_thumb.jpg', webp_path='screenshots/1/s.webp'
+        )
+
+        content = client.get(f'/transcription/{transcription.id}/{page}').content.decode()
+
+        media = settings.MEDIA_URL
+        assert f'href="{media}screenshots/1/s.jpg"' in content
+        assert f'srcset="{media}screenshots/1/s.webp"' in content
+        assert f'src="{media}screenshots/1/s_thumb.jpg"' in content
+        assert f'src="{media}screenshots/1/s.jpg"' not in content
+
+
+@pytest.mark.django_db
+class TestScreenshotDownload:
+    """Тесты скачивания архива скриншотов"""
+
+    def test_archive_streamed_without_compression(self, client, settings, tmp_path):
+        """Архив отдается потоком, записи хранятся без сжатия"""
+        import io
+        import zipfile
+        from transcribe.models import Screenshot
+
+        settings.MEDIA_ROOT = str(tmp_path)
+        transcription = Transcription.objects.create(filename='lecture.mp4', ip_address='127.0.0.1', file_size=1)
+        for order, content in enumerate([b'first slide', b'second slide' * 100000]):
+            (tmp_path / f'{order}.jpg').write_bytes(content)
+            Screenshot.objects.create(transcription=transcription, timestamp=order * 3, image_path=f'{order}.jpg', order=order)
+        Screenshot.objects.create(transcription=transcription, timestamp=9, image_path='missing.jpg', order=2)
+
+        response = client.get(f'/transcription/{transcription.id}/download-screenshots/')
+
+        assert response.status_code == 200 and response.streaming
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        assert archive.namelist() == ['screenshot_0000_0s.jpg', 'screenshot_0001_3s.jpg']
+        assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+        assert archive.read('screenshot_0001_3s.jpg') == b'second slide' * 100000
+        assert archive.testzip() is None
+
+    def test_prebuilt_archive_served_with_etag_and_range(self, client, settings, tmp_path, monkeypatch):
+        """Собранный при завершении архив отдается с ETag и по диапазонам, перетранскрибация его удаляет"""
+        from transcribe import artifacts
+        from transcribe.models import Screenshot
+
+        settings.MEDIA_ROOT = str(tmp_path)
+        monkeypatch.setattr(artifacts, 'ARTIFACTS_DIR', str(tmp_path / 'artifacts'))
+        transcription = Transcription.objects.create(
+            filename='lecture.mp4', ip_address='127.0.0.1', file_size=1, status='completed'
+        )
+        (tmp_path / 'slide.jpg').write_bytes(b'slide')
+        Screenshot.objects.create(transcription=transcription, timestamp=0, image_path='slide.jpg')
+
+        artifacts.build_completion_artifacts(transcription)
+        with open(artifacts.screenshots_archive_path(transcription), 'rb') as f:
+            archive = f.read()
+        url = f'/transcription/{transcription.id}/download-screenshots/'
+
+        response = client.get(url)
+        assert response.status_code == 200 and response['Accept-Ranges'] == 'bytes'
+        assert b''.join(response.streaming_content) == archive
+        etag = response['ETag']
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        partial = client.get(url, HTTP_RANGE='bytes=10-19')
+        assert partial.status_code == 206
+        assert partial['Content-Range'] == f'bytes 10-19/{len(archive)}'
+        assert b''.join(partial.streaming_content) == archive[10:20]
+        assert client.get(url, HTTP_RANGE=f'bytes={len(archive)}-').status_code == 416
+
+        artifacts.invalidate_artifacts(transcription)
+        assert not os.path.exists(artifacts.screenshots_archive_path(transcription))
+        assert client.get(url).status_code == 200  # Без готового архива собирается при скачивании
+
+    def test_session_text_built_after_last_transcription(self, client, tmp_path, monkeypatch):
+        """Общий текст сессии собирается, когда завершена последняя транскрипция сессии"""
+        from transcribe import artifacts
+
+        monkeypatch.setattr(artifacts, 'ARTIFACTS_DIR', str(tmp_path / 'artifacts'))
+        first = Transcription.objects.create(
+            filename='a.mp3', ip_address='127.0.0.1', file_size=1, upload_session='s1',
+            status='completed', transcribed_text='Первый'
+        )
+        second = Transcription.objects.create(
+            filename='b.mp3', ip_address='127.0.0.1', file_size=1, upload_session='s1', status='processing'
+        )
+        path = artifacts.session_text_path('s1')
+
+        artifacts.build_completion_artifacts(first)
+        assert not os.path.exists(path)
+
+        Transcription.objects.filter(id=second.id).update(status='completed', transcribed_text='Второй')
+        second.refresh_from_db()
+        artifacts.build_completion_artifacts(second)
+
+        response = client.get('/session/s1/download-text/')
+        assert response.status_code == 200 and response.has_header('ETag')
+        assert b''.join(response.streaming_content).decode() == '=== a.mp3 ===\nПервый\n\n\n=== b.mp3 ===\nВторой\n\n'
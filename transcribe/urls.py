@@ -6,6 +6,9 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('upload/', views.upload_file, name='upload_file'),
     path('upload-url/', views.upload_from_url, name='upload_from_url'),
+    path('upload/chunked/', views.chunked_upload_init, name='chunked_upload_init'),
+    path('upload/chunked/<str:upload_id>/', views.chunked_upload_chunk, name='chunked_upload_chunk'),
+    path('upload/chunked/<str:upload_id>/complete/', views.chunked_upload_complete, name='chunked_upload_complete'),
     path('login/', views.login_with_phrase, name='login_phrase'),
     path('logout/', views.logout_phrase, name='logout_phrase'),
     path('transcription/<int:transcription_id>/', views.transcription_detail, name='transcription_detail'),
@@ -23,6 +26,7 @@ urlpatterns = [
     path('transcription/<int:transcription_id>/retranscribe/', views.retranscribe, name='retranscribe'),
     path('clear-disk/', views.clear_disk, name='clear_disk'),
     path('check-balance/', views.check_balance, name='check_balance'),
+    path('ready/', views.readiness, name='readiness'),
     # Секретная страница тестирования
     path('secret-test/', views_test.secret_test_page, name='secret_test'),
     path('secret-test/run-scenarios/', views_test.run_scenarios_tests, name='run_scenarios'),
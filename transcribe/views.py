@@ -4,15 +4,36 @@ import subprocess
 import logging
 import uuid
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
 from django.views.decorators.csrf import csrf_protect
-from .models import Transcription, IPUploadCount, UUIDUploadCount
+from .models import Transcription, IPUploadCount, UUIDUploadCount, ChunkedUpload
 from .csv_logger import log_upload
 from .utils import get_client_ip, validate_file_size, validate_whisper_model
-from faster_whisper import WhisperModel
+from .job_queue import enqueue_transcription, get_executor, get_queue_position, get_readiness
+from .model_cache import get_model_cache
+from .segments import SegmentWriter, format_srt, offset_segments, segments_by_slides
+from .blob_store import is_blob, store_chunks, store_file, store_uploaded_file
+from .result_cache import copy_result, find_cached_result, result_key
+from .zip_stream import iter_zip
+from .artifacts import (
+    ARTIFACTS_DIR, build_completion_artifacts, invalidate_artifacts, screenshot_archive_entries,
+    screenshots_archive_path, serve_artifact, session_text, session_text_path,
+)
+from .chunked_upload import (
+    CHUNKED_UPLOAD_CHUNK_SIZE, CHUNKED_UPLOAD_MAX_CHUNK_SIZE, CHUNKED_UPLOAD_THRESHOLD,
+    ChunkError, finish_upload, purge_expired_uploads, verify_upload, write_chunk,
+)
+from .batching import TRANSCRIBE_BATCH_MAX_SECONDS, TRANSCRIBE_BATCHING, get_batcher
+from .audio import (
+    LANGUAGE_DETECTION_MODEL, LANGUAGE_DETECTION_SECONDS, SAMPLING_RATE, TRANSCRIBE_CHUNK_SECONDS, TRANSCRIBE_PARALLEL_CHUNKS,
+    ProgressReporter, analyze_speech, decode_audio_prefix, decode_media_audio, detect_language,
+    extraction_deadline, find_ffmpeg, load_audio, probe_duration, run_ffmpeg_with_progress,
+    transcribe_chunks_parallel, transcribe_speech,
+)
 import tempfile
 import shutil
 
@@ -33,45 +54,30 @@ except ImportError:
         pass  # Заглушка если модуль не доступен
 
 
-# Кэш моделей Whisper (загружаются по требованию)
-whisper_models_cache = {}
-model_lock = threading.Lock()
+# Кэш моделей Whisper (загружаются по требованию, вытесняются по LRU при нехватке памяти)
+def acquire_whisper_model(model_name='base'):
+    """
+    Захватить модель Whisper из кэша
 
-
-def get_whisper_model(model_name='base'):
-    """Получить модель Whisper (загружается по требованию, кэшируется)"""
+    Возвращает handle: модель доступна как handle.model и не будет выгружена
+    из кэша, пока не вызван handle.release().
+    """
     import logging
     logger = logging.getLogger(__name__)
-    
-    global whisper_models_cache
-    
-    if model_name not in whisper_models_cache:
-        with model_lock:
-            if model_name not in whisper_models_cache:
-                logger.info(f"Загрузка модели Whisper: {model_name}...")
-                try:
-                    # Модели загружаются автоматически при первом использовании
-                    # Они кэшируются в ~/.cache/huggingface/hub/
-                    whisper_models_cache[model_name] = WhisperModel(
-                        model_name, 
-                        device="cpu", 
-                        compute_type="int8",
-                        download_root=None  # Использует стандартный кэш
-                    )
-                    logger.info(f"Модель Whisper {model_name} успешно загружена и кэширована")
-                except Exception as e:
-                    logger.error(f"Ошибка загрузки модели {model_name}: {e}", exc_info=True)
-                    # Fallback на base если модель не загрузилась
-                    if model_name != 'base':
-                        logger.info("Используем модель base как fallback")
-                        try:
-                            whisper_models_cache[model_name] = get_whisper_model('base')
-                        except:
-                            raise Exception(f"Не удалось загрузить модель {model_name} и fallback base также не работает")
-                    else:
-                        raise Exception(f"Критическая ошибка: не удалось загрузить базовую модель Whisper: {e}")
-    
-    return whisper_models_cache[model_name]
+
+    cache = get_model_cache()
+    try:
+        return cache.acquire(model_name)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки модели {model_name}: {e}", exc_info=True)
+        # Fallback на base если модель не загрузилась
+        if model_name != 'base':
+            logger.info("Используем модель base как fallback")
+            try:
+                return cache.acquire('base')
+            except Exception:
+                raise Exception(f"Не удалось загрузить модель {model_name} и fallback base также не работает")
+        raise Exception(f"Критическая ошибка: не удалось загрузить базовую модель Whisper: {e}")
 
 
 def index(request):
@@ -121,7 +127,8 @@ def index(request):
         'is_logged_in': active_password_phrase is not None,
         'active_phrase': active_password_phrase if active_password_phrase else '',
         'disk_info': disk_info,
-        'balance': balance
+        'balance': balance,
+        'chunked_upload_threshold': CHUNKED_UPLOAD_THRESHOLD
     })
 
 
@@ -146,35 +153,12 @@ def upload_file(request):
     if not user_uuid:
         return JsonResponse({'error': 'UUID не передан'}, status=400)
     
-    # Проверяем количество загрузок по IP за месяц
+    # Проверяем количество загрузок по IP и UUID за месяц и баланс
     ip_counter = IPUploadCount.get_or_create_for_ip(ip_address)
-    ip_monthly_count = ip_counter.get_monthly_count()
-    
-    # Проверяем количество загрузок по UUID за месяц
     uuid_counter = UUIDUploadCount.get_or_create_for_uuid(user_uuid)
-    uuid_monthly_count = uuid_counter.get_monthly_count()
-    
-    # Проверяем баланс - если баланс 0, требуется оплата
-    ip_balance = ip_counter.balance if ip_counter else 0
-    uuid_balance = uuid_counter.balance if uuid_counter else 0
-    has_balance = ip_balance > 0 or uuid_balance > 0
-    
-    # Если требуется оплата (после 2-й загрузки за месяц по IP или UUID) И баланс 0
-    requires_payment = False
-    if ip_monthly_count >= 2 and not ip_counter.is_paid and not has_balance:
-        requires_payment = True
-    elif uuid_monthly_count >= 2 and not uuid_counter.is_paid and not has_balance:
-        requires_payment = True
-    
-    if requires_payment:
-        return JsonResponse({
-            'error': 'Для продолжения использования сервиса требуется оплата 12 рублей. Пожалуйста, произведите оплату.',
-            'requires_payment': True,
-            'ip_count': ip_monthly_count,
-            'uuid_count': uuid_monthly_count,
-            'ip_balance': ip_balance,
-            'uuid_balance': uuid_balance
-        }, status=402)  # 402 Payment Required
+    payment = upload_payment_required(ip_counter, uuid_counter)
+    if payment:
+        return JsonResponse(payment, status=402)  # 402 Payment Required
     
     # Если баланс 0, но оплата не требуется (первые 2 загрузки), разрешаем загрузку
     
@@ -204,50 +188,27 @@ def upload_file(request):
         if uploaded_file.size == 0:
             return JsonResponse({'error': f'Файл {uploaded_file.name} пустой'}, status=400)
         
-        # Сохраняем файл в постоянное хранилище для возможности перетранскрибации
-        # Создаем директорию для файла
-        uploads_base_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-        os.makedirs(uploads_base_dir, exist_ok=True)
-        
-        # Создаем уникальную директорию для этого файла
-        file_uuid = str(uuid.uuid4())
-        uploads_dir = os.path.join(uploads_base_dir, file_uuid)
-        os.makedirs(uploads_dir, exist_ok=True)
-        
-        # Сохраняем оригинальный файл
+        # Сохраняем файл в постоянное хранилище для возможности перетранскрибации.
+        # Хеш содержимого считается во время записи: одинаковые файлы хранятся один раз
         file_ext = os.path.splitext(uploaded_file.name)[1]
-        original_filename = f"original{file_ext}"
-        original_file_path = os.path.join(uploads_dir, original_filename)
-        
         try:
             # ВАЖНО: Django InMemoryUploadedFile может быть уже прочитан
-            # Сохраняем файл в постоянное хранилище
-            uploaded_file.seek(0)  # Сбрасываем позицию на начало
-            with open(original_file_path, 'wb') as f:
-                # Читаем файл порциями для больших файлов
-                for chunk in uploaded_file.chunks():
-                    f.write(chunk)
-            
-            # Проверяем, что файл действительно сохранен
-            if not os.path.exists(original_file_path):
-                raise Exception(f"Файл не был создан: {original_file_path}")
+            if getattr(uploaded_file, 'content_hash', None):
+                # Большой файл уже записан в хранилище при приеме - только переименовываем
+                original_file_path, content_hash, saved_size, created = store_uploaded_file(uploaded_file, file_ext)
+            else:
+                uploaded_file.seek(0)  # Сбрасываем позицию на начало
+                original_file_path, content_hash, saved_size, created = store_chunks(uploaded_file.chunks(), file_ext)
             
-            saved_size = os.path.getsize(original_file_path)
             if saved_size == 0:
                 raise Exception(f"Файл пустой после сохранения: {original_file_path}")
             
             if saved_size != uploaded_file.size:
                 logger.warning(f"Размер сохраненного файла ({saved_size}) не совпадает с оригинальным ({uploaded_file.size})")
             
-            logger.info(f"Оригинальный файл сохранен: {original_file_path}, размер: {saved_size} байт")
+            logger.info(f"Оригинальный файл {'сохранен' if created else 'уже был в хранилище'}: {original_file_path}, размер: {saved_size} байт")
         except Exception as e:
             logger.error(f"Ошибка при сохранении файла {uploaded_file.name}: {e}", exc_info=True)
-            # Удаляем директорию если файл не сохранился
-            try:
-                if os.path.exists(uploads_dir):
-                    shutil.rmtree(uploads_dir)
-            except:
-                pass
             return JsonResponse({'error': f'Ошибка при сохранении файла {uploaded_file.name}: {str(e)}'}, status=500)
         
         # Создаем запись в БД
@@ -262,7 +223,8 @@ def upload_file(request):
             upload_session=upload_session,
             whisper_model=whisper_model,
             status='pending',
-            original_file_path=original_file_path  # Сохраняем путь к оригинальному файлу
+            original_file_path=original_file_path,  # Сохраняем путь к оригинальному файлу
+            content_hash=content_hash
         )
         
         # Генерируем публичный токен сразу
@@ -289,10 +251,8 @@ def upload_file(request):
         
         transcription_ids.append(transcription.id)
         
-        # Запускаем обработку в отдельном потоке
-        thread = threading.Thread(target=process_file, args=(transcription.id, original_file_path))
-        thread.daemon = True
-        thread.start()
+        # Ставим в очередь на обработку
+        enqueue_transcription(transcription.id, original_file_path)
     
     # Собираем информацию о загруженных файлах для клиента
     files_info = []
@@ -312,7 +272,8 @@ def upload_file(request):
                 'size_mb': round(t.file_size / (1024 * 1024), 2),
                 'status': t.status,
                 'detected_language': t.detected_language,
-                'requires_language_confirmation': requires_language_confirmation
+                'requires_language_confirmation': requires_language_confirmation,
+                'queue_position': get_queue_position(t.id)
             })
         except:
             pass
@@ -327,24 +288,230 @@ def upload_file(request):
     })
 
 
-def extract_audio(input_path, output_path):
-    """Извлечь аудио дорожку из видео/аудио файла используя ffmpeg"""
+def upload_payment_required(ip_counter, uuid_counter):
+    """
+    Проверить, нужна ли оплата перед загрузкой (после 2-й загрузки за месяц при нулевом балансе)
+    
+    Returns:
+        dict: Тело ответа 402 или None, если загрузка разрешена
+    """
+    ip_monthly_count = ip_counter.get_monthly_count()
+    uuid_monthly_count = uuid_counter.get_monthly_count()
+    ip_balance = ip_counter.balance if ip_counter else 0
+    uuid_balance = uuid_counter.balance if uuid_counter else 0
+    has_balance = ip_balance > 0 or uuid_balance > 0
+    
+    requires_payment = (
+        (ip_monthly_count >= 2 and not ip_counter.is_paid and not has_balance) or
+        (uuid_monthly_count >= 2 and not uuid_counter.is_paid and not has_balance)
+    )
+    if not requires_payment:
+        return None
+    return {
+        'error': 'Для продолжения использования сервиса требуется оплата 12 рублей. Пожалуйста, произведите оплату.',
+        'requires_payment': True,
+        'ip_count': ip_monthly_count,
+        'uuid_count': uuid_monthly_count,
+        'ip_balance': ip_balance,
+        'uuid_balance': uuid_balance
+    }
+
+
+@require_http_methods(["POST"])
+def chunked_upload_init(request):
+    """Начать загрузку файла по частям (см. chunked_upload.py)"""
+    import json
+    
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Неверный формат запроса'}, status=400)
+    
+    filename = os.path.basename(str(body.get('filename', '')).strip())
+    try:
+        file_size = int(body.get('size', 0))
+    except (TypeError, ValueError):
+        file_size = 0
+    if not filename or file_size <= 0:
+        return JsonResponse({'error': 'Файл пустой'}, status=400)
+    
+    user_uuid = str(body.get('user_uuid', '')).strip()
+    if not user_uuid:
+        return JsonResponse({'error': 'UUID не передан'}, status=400)
+    
+    ip_address = get_client_ip(request)
+    ip_counter = IPUploadCount.get_or_create_for_ip(ip_address)
+    uuid_counter = UUIDUploadCount.get_or_create_for_uuid(user_uuid)
+    payment = upload_payment_required(ip_counter, uuid_counter)
+    if payment:
+        return JsonResponse(payment, status=402)  # 402 Payment Required
+    
+    # Заодно убираем брошенные загрузки
+    purge_expired_uploads()
+    
+    password_phrase = str(body.get('password_phrase', '')).strip()
+    whisper_model, _ = validate_whisper_model(body.get('whisper_model', 'base'))
+    upload = ChunkedUpload.objects.create(
+        upload_id=str(uuid.uuid4()),
+        filename=filename,
+        file_size=file_size,
+        ip_address=ip_address,
+        user_uuid=user_uuid,
+        signature=str(body.get('signature', '')).strip() or None,
+        password_phrase_hash=Transcription.hash_password_phrase(password_phrase) if password_phrase else None,
+        extract_screenshots=bool(body.get('extract_screenshots', False)),
+        whisper_model=whisper_model,
+    )
+    logger.info(f"Начата загрузка по частям: {upload.upload_id}, {filename}, {file_size} байт")
+    
+    return JsonResponse({
+        'success': True,
+        'upload_id': upload.upload_id,
+        'chunk_size': CHUNKED_UPLOAD_CHUNK_SIZE,
+        'received': 0,
+    })
+
+
+@require_http_methods(["GET", "PUT"])
+def chunked_upload_chunk(request, upload_id):
+    """Принять часть файла (PUT ?offset=N) или узнать, сколько байт уже принято (GET)"""
+    try:
+        upload = ChunkedUpload.objects.get(upload_id=upload_id)
+    except ChunkedUpload.DoesNotExist:
+        return JsonResponse({'error': 'Загрузка не найдена'}, status=404)
+    
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Не указана позиция части'}, status=400)
+        if int(request.META.get('CONTENT_LENGTH') or 0) > CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            return JsonResponse({'error': 'Слишком большая часть'}, status=413)
+        
+        try:
+            write_chunk(upload, offset, request.body, checksum=request.headers.get('X-Chunk-SHA256'))
+        except ChunkError as e:
+            return JsonResponse({'error': str(e), 'received': upload.received}, status=e.status)
+    
+    return JsonResponse({
+        'upload_id': upload.upload_id,
+        'received': upload.received,
+        'size': upload.file_size,
+        'chunk_size': CHUNKED_UPLOAD_CHUNK_SIZE,
+        'completed': upload.transcription_id is not None,
+    })
+
+
+@require_http_methods(["POST"])
+def chunked_upload_complete(request, upload_id):
+    """Завершить загрузку по частям: перенести файл в хранилище и поставить в очередь"""
+    import json
+    
+    try:
+        upload = ChunkedUpload.objects.get(upload_id=upload_id)
+    except ChunkedUpload.DoesNotExist:
+        return JsonResponse({'error': 'Загрузка не найдена'}, status=404)
+    
+    # Повторное завершение (ответ потерялся) - отдаем ту же транскрипцию
+    transcription = upload.transcription
+    if transcription is None:
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            body = {}
+        
+        # Хеш считается до транзакции, а файл переносится в хранилище только после
+        # ее фиксации: при откате или отказе в оплате файл части остается на месте
+        try:
+            original_file_path, content_hash, file_size = verify_upload(upload, checksum=body.get('sha256'))
+        except ChunkError as e:
+            return JsonResponse({'error': str(e), 'received': upload.received}, status=e.status)
+        
+        # Оплата проверяется повторно: параллельно начатые загрузки прошли проверку
+        # при начале все сразу. На PostgreSQL строки счетчиков блокируются до создания
+        # транскрипции, и одновременные завершения проверяются по очереди. SQLite
+        # select_for_update не поддерживает: записи там сериализует блокировка всей
+        # базы, а проверку оплаты одновременные завершения могут пройти оба
+        with transaction.atomic():
+            ip_counter = IPUploadCount.objects.select_for_update().get(
+                pk=IPUploadCount.get_or_create_for_ip(upload.ip_address).pk
+            )
+            uuid_counter = UUIDUploadCount.objects.select_for_update().get(
+                pk=UUIDUploadCount.get_or_create_for_uuid(upload.user_uuid).pk
+            )
+            payment = upload_payment_required(ip_counter, uuid_counter)
+            if payment:
+                # Принятый файл остается: после оплаты загрузку можно завершить повторно
+                return JsonResponse(payment, status=402)  # 402 Payment Required
+            
+            transcription = Transcription.objects.create(
+                filename=upload.filename,
+                ip_address=upload.ip_address,
+                user_uuid=upload.user_uuid,
+                signature=upload.signature,
+                password_phrase_hash=upload.password_phrase_hash,
+                file_size=file_size,
+                extract_screenshots=upload.extract_screenshots,
+                upload_session=str(uuid.uuid4()),
+                whisper_model=upload.whisper_model,
+                status='pending',
+                original_file_path=original_file_path,
+                content_hash=content_hash
+            )
+            transcription.generate_public_token()
+            upload.transcription = transcription
+            upload.save(update_fields=['transcription'])
+            
+            ip_counter.increment_upload()
+            uuid_counter.increment_upload()
+        finish_upload(upload, content_hash)
+        log_upload(upload.ip_address, upload.user_uuid, upload.filename, file_size)
+        log_to_elasticsearch('file_upload', {
+            'transcription_id': transcription.id,
+            'filename': upload.filename,
+            'file_size': file_size,
+            'ip_address': upload.ip_address,
+            'user_uuid': upload.user_uuid,
+            'whisper_model': upload.whisper_model,
+            'has_password': bool(upload.password_phrase_hash),
+            'extract_screenshots': upload.extract_screenshots,
+            'chunked': True
+        })
+        logger.info(f"Загрузка по частям завершена: {upload.upload_id}, файл {original_file_path}")
+        
+        enqueue_transcription(transcription.id, original_file_path)
+    
+    return JsonResponse({
+        'success': True,
+        'transcription_ids': [transcription.id],
+        'upload_session': transcription.upload_session,
+        'count': 1,
+        'files': [{
+            'id': transcription.id,
+            'filename': transcription.filename,
+            'size_mb': round(transcription.file_size / (1024 * 1024), 2),
+            'status': transcription.status,
+            'detected_language': transcription.detected_language,
+            'requires_language_confirmation': False,
+            'queue_position': get_queue_position(transcription.id)
+        }],
+        'message': 'Файл загружен. Обработка началась.'
+    })
+
+
+def extract_audio(input_path, output_path, duration=None, progress_callback=None):
+    """
+    Извлечь аудио дорожку из видео/аудио файла используя ffmpeg
+
+    Время работы ограничено пропорционально длительности записи, а зависший
+    ffmpeg (без прогресса) останавливается. progress_callback получает
+    позицию обработки в секундах.
+    """
     import logging
     logger = logging.getLogger(__name__)
     
     try:
-        # Проверяем наличие ffmpeg
-        ffmpeg_path = shutil.which('ffmpeg')
-        if not ffmpeg_path:
-            # Пробуем стандартные пути
-            possible_paths = ['/usr/bin/ffmpeg', '/usr/local/bin/ffmpeg', '/bin/ffmpeg']
-            for path in possible_paths:
-                if os.path.exists(path):
-                    ffmpeg_path = path
-                    break
-        
-        if not ffmpeg_path:
-            raise Exception("ffmpeg не найден. Убедитесь, что ffmpeg установлен.")
+        ffmpeg_path = find_ffmpeg()
         
         # Используем ffmpeg для извлечения только аудио дорожки
         # -i: входной файл
@@ -366,17 +533,13 @@ def extract_audio(input_path, output_path):
             output_path
         ]
         
-        logger.info(f"Извлечение аудио: {input_path} -> {output_path}")
+        deadline = extraction_deadline(duration)
+        logger.info(f"Извлечение аудио: {input_path} -> {output_path} (лимит времени: {f'{deadline:.0f} с' if deadline else 'по зависанию'})")
         
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=300  # 5 минут максимум
-        )
+        returncode, stderr = run_ffmpeg_with_progress(cmd, progress_callback=progress_callback, deadline=deadline)
         
-        if result.returncode != 0:
-            error_msg = result.stderr.decode('utf-8', errors='ignore')
+        if returncode != 0:
+            error_msg = stderr.decode('utf-8', errors='ignore')
             logger.error(f"Ошибка ffmpeg: {error_msg}")
             raise Exception(f"Ошибка при извлечении аудио: {error_msg[:200]}")
         
@@ -385,138 +548,88 @@ def extract_audio(input_path, output_path):
         
         logger.info(f"Аудио успешно извлечено: {os.path.getsize(output_path)} байт")
         return True
-    except subprocess.TimeoutExpired:
-        raise Exception("Превышено время ожидания при извлечении аудио")
+    except subprocess.TimeoutExpired as e:
+        raise Exception(f"Превышено время ожидания при извлечении аудио ({e.output})")
     except FileNotFoundError:
         raise Exception("ffmpeg не найден. Убедитесь, что ffmpeg установлен.")
 
 
+# Длинное видео делится на диапазоны, слайды в которых ищутся в отдельных процессах
+SCREENSHOT_PARALLEL_RANGES = getattr(settings, 'SCREENSHOT_PARALLEL_RANGES', min(4, os.cpu_count() or 1))
+SCREENSHOT_RANGE_MIN_SECONDS = getattr(settings, 'SCREENSHOT_RANGE_MIN_SECONDS', 300)  # Минимальная длина диапазона
+SCREENSHOT_BULK_BATCH = 200  # Строк Screenshot в одном INSERT
+
+
 def extract_screenshots_from_video(video_path, transcription_id, output_dir):
     """Извлекает скриншоты из видео используя умную детекцию слайдов через OpenCV"""
     import logging
-    import cv2
-    import numpy as np
     
     logger = logging.getLogger(__name__)
     
     try:
+        from .slides import detect_slide_ranges, merge_slide_ranges, plan_slide_ranges, video_info
+        
         # Создаем директорию для скриншотов
         os.makedirs(output_dir, exist_ok=True)
         
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise Exception(f"Не удалось открыть видео файл: {video_path}")
-            
         # Получаем параметры видео
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0: fps = 30  # Fallback
-        
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps, total_frames = video_info(video_path)
         duration = total_frames / fps
-        
-        logger.info(f"Начало анализа видео: {video_path}, FPS: {fps}, Длительность: {duration:.2f}с")
-        
-        screenshots = []
-        order = 0
         max_screenshots = 1000
         
-        # Параметры детекции
-        threshold_pixel_diff = 30  # Порог изменения пикселя (0-255)
-        threshold_screen_diff = 0.05  # Порог изменения экрана (5%)
-        min_time_diff = 2.0  # Минимальное время между слайдами (сек)
-        check_interval = 0.5  # Интервал проверки кадров (сек)
-        
-        last_frame_gray = None
-        last_screenshot_time = -min_time_diff  # Чтобы первый кадр тоже мог быть сохранен
+        parts = min(SCREENSHOT_PARALLEL_RANGES, int(duration // SCREENSHOT_RANGE_MIN_SECONDS) or 1)
+        ranges = plan_slide_ranges(total_frames, fps, parts)
+        logger.info(f"Начало анализа видео: {video_path}, FPS: {fps}, Длительность: {duration:.2f}с, диапазонов: {len(ranges)}")
         
-        frame_step = int(fps * check_interval)
-        if frame_step < 1: frame_step = 1
-        
-        current_frame_idx = 0
-        
-        while True:
-            # Читаем кадр
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Пропускаем кадры для ускорения
-            if current_frame_idx % frame_step != 0:
-                current_frame_idx += 1
-                continue
-                
-            timestamp = current_frame_idx / fps
-            
-            # Конвертируем в ч/б для сравнения
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            # Уменьшаем разрешение для ускорения обработки (например до 640px по ширине)
-            height, width = gray.shape
-            scale = 640 / width if width > 640 else 1
-            if scale < 1:
-                gray = cv2.resize(gray, (int(width * scale), int(height * scale)))
-            
-            # Размытие для уменьшения шума
-            gray = cv2.GaussianBlur(gray, (21, 21), 0)
-            
-            is_new_slide = False
-            
-            if last_frame_gray is None:
-                # Всегда сохраняем первый кадр
-                is_new_slide = True
+        tasks = [
+            (video_path, start, end, fps, output_dir, f"range_{index:02d}", max_screenshots)
+            for index, (start, end) in enumerate(ranges)
+        ]
+        range_slides = detect_slide_ranges(tasks)
+        
+        # Повторы на стыках диапазонов отбрасываются
+        slides = merge_slide_ranges(range_slides)
+        if len(slides) > max_screenshots:
+            logger.warning(f"Достигнут лимит скриншотов ({max_screenshots})")
+            for slide in slides[max_screenshots:]:
+                os.remove(slide['path'])
+            slides = slides[:max_screenshots]
+        
+        from .models import Screenshot
+        
+        def media_relative(path):
+            # Формируем относительный путь
+            if path.startswith(str(settings.MEDIA_ROOT)):
+                relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
             else:
-                # Вычисляем разницу
-                frame_diff = cv2.absdiff(last_frame_gray, gray)
-                
-                # Бинаризация разницы
-                _, thresh = cv2.threshold(frame_diff, threshold_pixel_diff, 255, cv2.THRESH_BINARY)
-                
-                # Считаем количество изменившихся пикселей
-                changed_pixels = np.count_nonzero(thresh)
-                total_pixels = thresh.size
-                diff_ratio = changed_pixels / total_pixels
-                
-                # Если изменение значительно и прошло достаточно времени
-                if diff_ratio > threshold_screen_diff and (timestamp - last_screenshot_time) >= min_time_diff:
-                    is_new_slide = True
-                    logger.info(f"Обнаружен новый слайд на {timestamp:.2f}с (изменение: {diff_ratio:.2%})")
-            
-            if is_new_slide:
-                screenshot_path = os.path.join(output_dir, f"screenshot_{order:04d}.jpg")
-                
-                # Сохраняем оригинальный кадр (не уменьшенный)
-                cv2.imwrite(screenshot_path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
-                
-                # Проверяем размер файла
-                if os.path.exists(screenshot_path) and os.path.getsize(screenshot_path) > 0:
-                    # Формируем относительный путь
-                    if screenshot_path.startswith(str(settings.MEDIA_ROOT)):
-                        relative_path = os.path.relpath(screenshot_path, settings.MEDIA_ROOT)
-                    else:
-                        relative_path = screenshot_path.replace(str(settings.MEDIA_ROOT) + '/', '').replace('/root/media/', '').replace('/var/www/media/', '')
-                    
-                    relative_path = relative_path.lstrip('/')
-                    
-                    # Сохраняем в БД
-                    from .models import Screenshot
-                    screenshot = Screenshot.objects.create(
-                        transcription_id=transcription_id,
-                        timestamp=timestamp,
-                        image_path=relative_path,
-                        order=order
-                    )
-                    screenshots.append(screenshot)
-                    
-                    last_frame_gray = gray
-                    last_screenshot_time = timestamp
-                    order += 1
-                    
-                    if order >= max_screenshots:
-                        logger.warning(f"Достигнут лимит скриншотов ({max_screenshots})")
-                        break
+                relative_path = path.replace(str(settings.MEDIA_ROOT) + '/', '').replace('/root/media/', '').replace('/var/www/media/', '')
+            return relative_path.lstrip('/')
+        
+        screenshots = []
+        for order, slide in enumerate(slides):
+            screenshot_path = os.path.join(output_dir, f"screenshot_{order:04d}.jpg")
+            os.replace(slide['path'], screenshot_path)
             
-            current_frame_idx += 1
+            # Уменьшенные копии лежат рядом с оригиналом под тем же номером
+            renditions = {}
+            for name, source in slide['renditions'].items():
+                target = screenshot_path[:-len('.jpg')] + source[len(os.path.splitext(slide['path'])[0]):]
+                os.replace(source, target)
+                renditions[name] = media_relative(target)
             
-        cap.release()
+            screenshots.append(Screenshot(
+                transcription_id=transcription_id,
+                timestamp=slide['timestamp'],
+                image_path=media_relative(screenshot_path),
+                thumbnail_path=renditions.get('thumbnail', ''),
+                webp_path=renditions.get('webp', ''),
+                order=order,
+                image_hash=f"{slide['hash']:016x}"
+            ))
+        
+        # Сохраняем в БД пачками
+        screenshots = Screenshot.objects.bulk_create(screenshots, batch_size=SCREENSHOT_BULK_BATCH)
+        
         logger.info(f"Извлечено {len(screenshots)} слайдов из видео")
         return screenshots
         
@@ -559,7 +672,8 @@ def process_file(transcription_id, temp_file_path):
     })
     
     audio_file_path = None
-    screenshots_dir = None
+    model_handle = None
+    screenshot_thread = None
     
     try:
         # Проверяем, что файл существует и не пустой
@@ -570,41 +684,6 @@ def process_file(transcription_id, temp_file_path):
         if file_size == 0:
             raise Exception("Загруженный файл пустой")
         
-        # Если нужно извлечь скриншоты и это видео файл
-        if transcription.extract_screenshots:
-            file_ext = os.path.splitext(temp_file_path)[1].lower()
-            video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv']
-            if file_ext in video_extensions:
-                try:
-                    # Устанавливаем статус "в процессе"
-                    transcription.screenshot_status = 'processing'
-                    transcription.save(update_fields=['screenshot_status'])
-                    
-                    screenshots_dir = os.path.join(settings.MEDIA_ROOT, 'screenshots', str(transcription_id))
-                    extract_screenshots_from_video(temp_file_path, transcription_id, screenshots_dir)
-                    
-                    # Проверяем результат
-                    screenshot_count = transcription.screenshots.count()
-                    if screenshot_count > 0:
-                        transcription.screenshot_status = 'completed'
-                        logger.info(f"Screenshot extraction completed: {screenshot_count} slides extracted")
-                    else:
-                        transcription.screenshot_status = 'completed'  # Completed but no slides found
-                        logger.warning("Screenshot extraction completed but no slides were detected")
-                    transcription.save(update_fields=['screenshot_status'])
-                except Exception as e:
-                    logger.error(f"Error extracting screenshots: {e}", exc_info=True)
-                    transcription.screenshot_status = 'error'
-                    transcription.save(update_fields=['screenshot_status'])
-            else:
-                # Not a video file
-                transcription.screenshot_status = 'skipped'
-                transcription.save(update_fields=['screenshot_status'])
-        else:
-            # Screenshot extraction not requested
-            transcription.screenshot_status = 'skipped'
-            transcription.save(update_fields=['screenshot_status'])
-        
         # Собираем логи транскрибации
         transcription_logs = []
         from datetime import datetime
@@ -620,27 +699,144 @@ def process_file(transcription_id, temp_file_path):
             else:
                 logger.info(message)
         
-        # Извлекаем аудио дорожку в отдельный файл
-        # Это гарантирует, что мы транскрибируем именно аудио, а не субтитры
-        audio_file_path = temp_file_path + "_audio.wav"
+        model_name = transcription.whisper_model or 'base'
+        
+        # Тот же файл уже транскрибирован той же моделью с тем же языком и VAD -
+        # результат копируется без декодирования (ключ сохраняется при завершении)
+        cache_key = None
+        cached_result = None
+        if transcription.content_hash:
+            cache_language = transcription.selected_language or (
+                transcription.detected_language if transcription.language_confirmed else None
+            )
+            cache_key = result_key(transcription.content_hash, model_name, cache_language)
+            cached_result = find_cached_result(cache_key, exclude_id=transcription_id)
+            if cached_result is not None:
+                add_log(f"Найден готовый результат для этого файла (транскрипция #{cached_result.id}), декодирование не требуется")
+        
+        # Быстрое определение языка по началу записи - до извлечения слайдов и аудио,
+        # чтобы пауза на подтверждение языка не стоила полного прохода по файлу
+        prefix_language = None
+        if not transcription.selected_language and not transcription.language_confirmed and cached_result is None:
+            detection_model_name = LANGUAGE_DETECTION_MODEL or model_name
+            add_log(f"Определение языка по первым {LANGUAGE_DETECTION_SECONDS} с записи (модель {detection_model_name})")
+            try:
+                prefix_audio = decode_audio_prefix(temp_file_path)
+                if len(prefix_audio) == 0:
+                    add_log("В начале файла нет аудио, язык будет определен при транскрибации", "WARNING")
+                else:
+                    with acquire_whisper_model(detection_model_name) as detection_model:
+                        prefix_language, probability = detect_language(detection_model, prefix_audio)
+                    add_log(f"  - Определенный язык: {prefix_language}")
+                    add_log(f"  - Вероятность языка: {probability:.4f}")
+                    transcription.detected_language = prefix_language
+                    transcription.save(update_fields=['detected_language'])
+            except Exception as e:
+                add_log(f"Не удалось определить язык по началу записи: {e}. Язык будет определен при транскрибации", "WARNING")
+            
+            # Если язык не русский, останавливаемся до тяжелой обработки
+            if prefix_language and prefix_language != 'ru':
+                add_log(f"Обнаружен не-русский язык ({prefix_language}). Требуется подтверждение пользователя.", "WARNING")
+                transcription.status = 'pending'
+                transcription.transcription_logs = "\n".join(transcription_logs)
+                transcription.save(update_fields=['status', 'transcription_logs'])
+                logger.info(f"Транскрибация приостановлена для подтверждения языка: {prefix_language}")
+                return  # Продолжится после confirm_language
+        
+        # Слайды извлекаются в отдельном потоке одновременно с извлечением аудио и
+        # транскрибацией: время обработки видео - максимум из двух этапов, а не сумма
+        if transcription.extract_screenshots:
+            file_ext = os.path.splitext(temp_file_path)[1].lower()
+            video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv']
+            if transcription.screenshot_status == 'completed':
+                # Продолжение после сбоя, подтверждения языка или перетранскрибация:
+                # слайды не зависят от модели и уже извлечены
+                add_log(f"Слайды уже извлечены ({transcription.screenshots.count()}), повторное извлечение пропущено")
+            elif file_ext in video_extensions:
+                transcription.screenshot_status = 'processing'
+                transcription.save(update_fields=['screenshot_status'])
+                screenshot_thread = threading.Thread(
+                    target=run_screenshot_stage, args=(transcription, temp_file_path),
+                    name=f'screenshots-{transcription_id}', daemon=True
+                )
+                screenshot_thread.start()
+                add_log("Извлечение слайдов запущено параллельно с транскрибацией")
+            else:
+                # Not a video file
+                transcription.screenshot_status = 'skipped'
+                transcription.save(update_fields=['screenshot_status'])
+        else:
+            # Screenshot extraction not requested
+            transcription.screenshot_status = 'skipped'
+            transcription.save(update_fields=['screenshot_status'])
+        
+        if cached_result is not None:
+            copy_result(cached_result, transcription)
+            add_log(f"Результат скопирован: {transcription.segments.count()} сегментов, {len(transcription.transcribed_text or '')} символов")
+            transcription.transcription_logs = "\n".join(transcription_logs)
+            transcription.result_key = cache_key
+            transcription.status = 'completed'
+            wait_screenshot_stage(screenshot_thread)
+            transcription.save()
+            build_completion_artifacts(transcription)
+            ip_counter, uuid_counter = charge_completed_transcription(transcription)
+            log_to_elasticsearch('transcription_complete', {
+                'transcription_id': transcription_id,
+                'filename': transcription.filename,
+                'text_length': len(transcription.transcribed_text or ''),
+                'detected_language': transcription.detected_language,
+                'cached_from': cached_result.id,
+                'ip_balance_after': ip_counter.balance if ip_counter else None,
+                'uuid_balance_after': uuid_counter.balance if uuid_counter else None
+            })
+            return
+        
+        # Декодируем аудио дорожку прямо в память (PyAV): без временного WAV и запуска ffmpeg.
+        # Берется только аудио дорожка - субтитры и видео не попадают в транскрибацию
         add_log(f"Начало обработки файла: {transcription.filename}")
         add_log(f"Размер исходного файла: {transcription.file_size} байт ({transcription.file_size / 1024 / 1024:.2f} МБ)")
-        add_log(f"Извлечение аудио из файла: {temp_file_path}")
-        extract_audio(temp_file_path, audio_file_path)
+        media_duration = probe_duration(temp_file_path)
+        transcription.media_duration = media_duration
+        transcription.extraction_progress = 0
+        transcription.progress_seconds = None
+        transcription.save(update_fields=['media_duration', 'extraction_progress', 'progress_seconds'])
+        if media_duration:
+            add_log(f"Длительность записи: {media_duration:.2f} секунд")
+        
+        def save_extraction_progress(percent):
+            Transcription.objects.filter(id=transcription_id).update(extraction_progress=percent)
+        
+        extraction_progress = ProgressReporter(media_duration, save_extraction_progress)
+        add_log(f"Декодирование аудио из файла: {temp_file_path}")
+        try:
+            audio = decode_media_audio(temp_file_path, duration=media_duration, progress_callback=extraction_progress)
+            add_log(f"Аудио декодировано в память: {len(audio) / 16000:.2f} секунд ({audio.nbytes / 1024 / 1024:.2f} МБ)")
+        except Exception as e:
+            # Запасной путь: ffmpeg понимает больше форматов и поврежденных файлов
+            add_log(f"Не удалось декодировать аудио через PyAV ({e}), извлекаем через ffmpeg", "WARNING")
+            audio_file_path = temp_file_path + "_audio.wav"
+            extract_audio(temp_file_path, audio_file_path, duration=media_duration, progress_callback=extraction_progress)
+            
+            if not os.path.exists(audio_file_path) or os.path.getsize(audio_file_path) == 0:
+                add_log("ОШИБКА: Не удалось извлечь аудио дорожку из файла", "ERROR")
+                raise Exception("Не удалось извлечь аудио дорожку из файла")
+            
+            audio_size = os.path.getsize(audio_file_path)
+            add_log(f"Аудио файл успешно создан: {audio_file_path}")
+            add_log(f"Размер аудио файла: {audio_size} байт ({audio_size / 1024 / 1024:.2f} МБ)")
+            audio = load_audio(audio_file_path)
         
-        if not os.path.exists(audio_file_path) or os.path.getsize(audio_file_path) == 0:
+        if len(audio) == 0:
             add_log("ОШИБКА: Не удалось извлечь аудио дорожку из файла", "ERROR")
             raise Exception("Не удалось извлечь аудио дорожку из файла")
-        
-        audio_size = os.path.getsize(audio_file_path)
-        add_log(f"Аудио файл успешно создан: {audio_file_path}")
-        add_log(f"Размер аудио файла: {audio_size} байт ({audio_size / 1024 / 1024:.2f} МБ)")
+        transcription.extraction_progress = 100
+        transcription.save(update_fields=['extraction_progress'])
         
         # Транскрибируем файл используя выбранную модель
-        model_name = transcription.whisper_model or 'base'
         add_log(f"Загрузка модели Whisper: {model_name}")
-        model = get_whisper_model(model_name)
-        add_log(f"Модель {model_name} успешно загружена")
+        model_handle = acquire_whisper_model(model_name)
+        model = model_handle.model
+        add_log(f"Модель {model_handle.name} успешно загружена")
         
         # Используем более точные параметры для транскрибации
         add_log(f"Начинаем транскрибацию файла {transcription.filename} моделью {model_name}")
@@ -659,66 +855,67 @@ def process_file(transcription_id, temp_file_path):
                 # Язык определен автоматически и подтвержден
                 target_language = transcription.detected_language
                 add_log(f"Используется автоматически определенный язык: {target_language}")
+            elif prefix_language:
+                # Язык определен по началу записи - повторное определение не нужно
+                target_language = prefix_language
+                add_log(f"Используется язык, определенный по началу записи: {target_language}")
             else:
                 # Мультиязыно - автоопределение (Whisper сам определит язык)
                 target_language = None
                 add_log(f"Используется мультиязыно (автоопределение)")
             
-            # Пробуем сначала БЕЗ VAD фильтра (он может быть слишком агрессивным)
-            add_log("Попытка транскрибации БЕЗ VAD фильтра")
-            segments, info = model.transcribe(
-                audio_file_path,
+            # Контрольная точка: сегменты, сохраненные прерванным запуском, остаются,
+            # декодируем только оставшуюся часть записи
+            writer = SegmentWriter(transcription_id)
+            checkpoint = writer.resume()
+            if checkpoint:
+                audio = audio[int(checkpoint * SAMPLING_RATE):]
+                add_log(f"Продолжаем с контрольной точки {checkpoint:.2f} с: уже распознано сегментов {writer.count}")
+            
+            # Анализ речи (Silero VAD) выполняется один раз: тишина пропускается
+            # сразу, а декодер получает только участки речи - без повторного прохода
+            speech = analyze_speech(audio)
+            strategy = speech['strategy']
+            add_log(f"Анализ речи (VAD): речь {speech['speech_seconds']:.2f} с из {speech['total_seconds']:.2f} с, участков: {len(speech['speech_chunks'])}")
+            
+            transcribe_options = dict(
                 beam_size=5,
                 language=target_language,  # Используем определенный язык или автоопределение
                 task="transcribe",
-                vad_filter=False,  # Отключаем VAD для начала
             )
+            if (strategy in ('full', 'speech_only') and TRANSCRIBE_BATCHING and target_language
+                    and speech['speech_seconds'] <= TRANSCRIBE_BATCH_MAX_SECONDS
+                    and get_executor().concurrent_jobs > 1):
+                # Короткая запись с известным языком - декодируем в общем пакете с соседними задачами.
+                # Если процесс выполняет задачи по одной, попутчиков нет - ожидание пакета было бы впустую
+                strategy = 'batched'
             
-            add_log(f"Информация о транскрибации (без VAD):")
-            add_log(f"  - Определенный язык: {info.language}")
-            add_log(f"  - Вероятность языка: {info.language_probability:.4f}")
-            add_log(f"  - Длительность аудио: {info.duration:.2f} секунд")
-            
-            # Сохраняем определенный язык (если еще не сохранен)
-            if not transcription.detected_language:
-                transcription.detected_language = info.language
-                transcription.save(update_fields=['detected_language'])
-            
-            # Если язык не русский и не подтвержден, останавливаем транскрибацию
-            if info.language and info.language != 'ru' and not transcription.language_confirmed:
-                add_log(f"Обнаружен не-русский язык ({info.language}). Требуется подтверждение пользователя.", "WARNING")
-                # Сохраняем определенный язык, если еще не сохранен
-                if not transcription.detected_language:
-                    transcription.detected_language = info.language
-                transcription.status = 'pending'
-                transcription.save(update_fields=['detected_language', 'status'])
-                logger.info(f"Транскрибация приостановлена для подтверждения языка: {info.language}")
-                return  # Прерываем транскрибацию до подтверждения
-            
-            # Проверяем, есть ли сегменты
-            # ВАЖНО: segments - это итератор, его можно использовать только один раз!
-            # Поэтому сразу конвертируем в список
-            segment_list = list(segments)
-            add_log(f"Найдено сегментов (без VAD): {len(segment_list)}")
-            
-            if not segment_list or len(segment_list) == 0:
-                # Если без VAD нет результатов, пробуем с VAD но с более мягкими параметрами
-                add_log("Не найдено сегментов без VAD, пробуем с VAD с мягкими параметрами", "WARNING")
-                segments_vad, info = model.transcribe(
-                    audio_file_path,
-                    beam_size=5,
-                    language=None,
-                    task="transcribe",
-                    vad_filter=True,
-                    vad_parameters=dict(
-                        min_silence_duration_ms=100,  # Более мягкий порог тишины
-                        threshold=0.3  # Более низкий порог для обнаружения речи
-                    ),
+            if strategy == 'silence':
+                add_log("Стратегия: речь не найдена, декодирование пропущено", "WARNING")
+                segments = iter([])
+            elif strategy == 'batched':
+                segments, info, batch_jobs = get_batcher().transcribe(
+                    model_handle.name, model, audio, speech['speech_chunks'], **transcribe_options
                 )
-                add_log(f"Информация о транскрибации (с VAD):")
+                add_log(f"Стратегия: короткая запись, декодирована в пакете из {batch_jobs} задач (BatchedInferencePipeline)")
+            elif strategy == 'parallel':
+                add_log(f"Стратегия: длинная запись, {len(speech['windows'])} частей по ~{TRANSCRIBE_CHUNK_SECONDS} с речи, декодируются параллельно ({TRANSCRIBE_PARALLEL_CHUNKS} потока)")
+                segments, info = transcribe_chunks_parallel(model, audio, speech['windows'], **transcribe_options)
+            elif strategy == 'full':
+                add_log("Стратегия: речь занимает почти всю запись, декодируем запись целиком")
+                segments, info = model.transcribe(audio, vad_filter=False, **transcribe_options)
+            else:
+                add_log("Стратегия: декодируем только участки речи")
+                segments, info = transcribe_speech(model, audio, speech['speech_chunks'], **transcribe_options)
+            if checkpoint:
+                segments = offset_segments(segments, checkpoint)
+            del audio  # Сегменты декодируются лениво из своих массивов, полную запись можно освободить
+            
+            if strategy != 'silence':
+                add_log(f"Информация о транскрибации:")
                 add_log(f"  - Определенный язык: {info.language}")
                 add_log(f"  - Вероятность языка: {info.language_probability:.4f}")
-                add_log(f"  - Длительность аудио: {info.duration:.2f} секунд")
+                add_log(f"  - Длительность декодируемого аудио: {info.duration:.2f} секунд")
                 
                 # Сохраняем определенный язык (если еще не сохранен)
                 if not transcription.detected_language:
@@ -726,39 +923,32 @@ def process_file(transcription_id, temp_file_path):
                     transcription.save(update_fields=['detected_language'])
                 
                 # Если язык не русский и не подтвержден, останавливаем транскрибацию
+                # (сюда попадаем, только если язык не удалось определить по началу записи)
                 if info.language and info.language != 'ru' and not transcription.language_confirmed:
                     add_log(f"Обнаружен не-русский язык ({info.language}). Требуется подтверждение пользователя.", "WARNING")
-                    # Сохраняем определенный язык, если еще не сохранен
-                    if not transcription.detected_language:
-                        transcription.detected_language = info.language
                     transcription.status = 'pending'
                     transcription.save(update_fields=['detected_language', 'status'])
                     logger.info(f"Транскрибация приостановлена для подтверждения языка: {info.language}")
                     return  # Прерываем транскрибацию до подтверждения
-                
-                segment_list = list(segments_vad)  # Конвертируем в список
-                add_log(f"Найдено сегментов (с VAD): {len(segment_list)}")
-            else:
-                add_log("Транскрибация без VAD успешна, используем эти результаты")
+            
+            # Сегменты декодируются лениво по мере чтения генератора - сохраняем их
+            # пачками сразу, не дожидаясь конца записи и не держа все в памяти
+            add_log("Обработка сегментов...")
+            idx = 0
+            for idx, segment in enumerate(segments, 1):
+                text = writer.add(segment)
+                if text:
+                    add_log(f"Сегмент {idx}: время {segment.start:.2f}-{segment.end:.2f}с, текст: {text[:100]}{'...' if len(text) > 100 else ''}")
+            writer.flush()
+            add_log(f"Найдено сегментов: {idx}")
                 
         except Exception as e:
             add_log(f"ОШИБКА при вызове model.transcribe: {str(e)}", "ERROR")
             logger.error(f"Ошибка при вызове model.transcribe: {e}", exc_info=True)
             raise Exception(f"Ошибка при транскрибации: {str(e)}")
         
-        # Собираем текст из сегментов
-        # ВАЖНО: используем segment_list, а не segments (который уже исчерпан)
-        text_parts = []
-        segment_count = 0
-        add_log("Обработка сегментов...")
-        for idx, segment in enumerate(segment_list, 1):
-            text = segment.text.strip()
-            if text:  # Пропускаем пустые сегменты
-                text_parts.append(text)
-                segment_count += 1
-                add_log(f"Сегмент {idx}: время {segment.start:.2f}-{segment.end:.2f}с, текст: {text[:100]}{'...' if len(text) > 100 else ''}")
-        
-        transcribed_text = " ".join(text_parts).strip()
+        segment_count = writer.count
+        transcribed_text = writer.text
         
         add_log(f"Транскрибация завершена успешно")
         add_log(f"Всего обработано сегментов: {segment_count}")
@@ -782,34 +972,25 @@ def process_file(transcription_id, temp_file_path):
         
         # Обновляем запись
         transcription.transcribed_text = transcribed_text
+        transcription.progress_seconds = writer.progress_seconds
+        if cache_key and model_handle.name != model_name:
+            # Выбранная модель не загрузилась и декодировала fallback-модель - результат
+            # сохраняется под ключом модели, которая его получила
+            cache_key = result_key(transcription.content_hash, model_handle.name, cache_language)
+        transcription.result_key = cache_key
         transcription.status = 'completed'
+        # Транскрипция завершается вместе со слайдами - страница результата показывает их сразу
+        wait_screenshot_stage(screenshot_thread)
         transcription.save()
+        # Архив скриншотов и текст сессии для скачивания
+        build_completion_artifacts(transcription)
         
         logger.info(f"Транскрибация завершена для файла {transcription.filename}. Сегментов: {segment_count}, Длина текста: {len(transcribed_text)}")
         
-        # Уменьшаем баланс на 1 при успешном завершении транскрибации
-        ip_counter = None
-        uuid_counter = None
-        try:
-            ip_counter = IPUploadCount.get_or_create_for_ip(transcription.ip_address)
-            if ip_counter.balance > 0:
-                ip_counter.balance -= 1
-                ip_counter.save()
-                logger.info(f"Баланс IP {transcription.ip_address} уменьшен на 1. Остаток: {ip_counter.balance}")
-            
-            if transcription.user_uuid:
-                uuid_counter = UUIDUploadCount.get_or_create_for_uuid(transcription.user_uuid)
-                if uuid_counter.balance > 0:
-                    uuid_counter.balance -= 1
-                    uuid_counter.save()
-                    logger.info(f"Баланс UUID {transcription.user_uuid} уменьшен на 1. Остаток: {uuid_counter.balance}")
-        except Exception as e:
-            logger.error(f"Ошибка при уменьшении баланса: {e}", exc_info=True)
+        ip_counter, uuid_counter = charge_completed_transcription(transcription)
         
         # Логируем завершение транскрибации
-        duration = None
-        if 'info' in locals():
-            duration = info.duration
+        duration = checkpoint + speech['total_seconds']
         log_to_elasticsearch('transcription_complete', {
             'transcription_id': transcription_id,
             'filename': transcription.filename,
@@ -818,6 +999,8 @@ def process_file(transcription_id, temp_file_path):
             'detected_language': transcription.detected_language,
             'language_confirmed': transcription.language_confirmed,
             'duration_seconds': duration,
+            'vad_strategy': strategy,
+            'speech_seconds': round(speech['speech_seconds'], 2),
             'ip_balance_after': ip_counter.balance if ip_counter else None,
             'uuid_balance_after': uuid_counter.balance if uuid_counter else None
         })
@@ -829,7 +1012,8 @@ def process_file(transcription_id, temp_file_path):
         error_msg = f"{type(e).__name__}: {str(e)}"
         transcription.status = 'error'
         transcription.error_message = error_msg
-        transcription.save()
+        # Только статус: уже сохраненный частичный текст не затираем
+        transcription.save(update_fields=['status', 'error_message'])
         logger.error(f"Ошибка при обработке файла {transcription.filename}: {error_msg}", exc_info=True)
         
         # Логируем ошибку в Elasticsearch
@@ -840,6 +1024,13 @@ def process_file(transcription_id, temp_file_path):
             'error_message': str(e)
         }, level='error')
     finally:
+        # Модель больше не используется этой задачей - ее можно вытеснить из кэша
+        if model_handle is not None:
+            model_handle.release()
+        
+        # Задача не освобождает слот очереди, пока не извлечены слайды
+        wait_screenshot_stage(screenshot_thread)
+        
         # Удаляем временные файлы (но не скриншоты)
         # Удаляем только audio_file_path (temp_file_path - это original_file_path, он должен сохраняться)
         for file_path in [audio_file_path]:
@@ -850,6 +1041,83 @@ def process_file(transcription_id, temp_file_path):
                     logger.error(f"Ошибка при удалении временного файла {file_path}: {e}")
 
 
+def run_screenshot_stage(transcription, video_path):
+    """
+    Извлечь слайды видео (выполняется в отдельном потоке параллельно с транскрибацией)
+    
+    Пишет только screenshot_status - остальные поля транскрипции сохраняет основной поток.
+    """
+    from django.db import connection
+    
+    transcription_id = transcription.id
+    try:
+        # Ограничиваем число одновременных извлечений слайдов
+        with get_executor().screenshot_slot():
+            # Слайды прерванного запуска извлекаются заново - без дублей
+            delete_screenshots(transcription)
+            screenshots_dir = os.path.join(settings.MEDIA_ROOT, 'screenshots', str(transcription_id))
+            extract_screenshots_from_video(video_path, transcription_id, screenshots_dir)
+        
+        # Проверяем результат
+        screenshot_count = transcription.screenshots.count()
+        if screenshot_count > 0:
+            logger.info(f"Screenshot extraction completed: {screenshot_count} slides extracted")
+        else:
+            logger.warning("Screenshot extraction completed but no slides were detected")
+        transcription.screenshot_status = 'completed'  # В том числе если слайды не найдены
+    except Exception as e:
+        logger.error(f"Error extracting screenshots: {e}", exc_info=True)
+        transcription.screenshot_status = 'error'
+    finally:
+        try:
+            transcription.save(update_fields=['screenshot_status'])
+        finally:
+            connection.close()  # Соединение с БД этого потока
+
+
+def delete_screenshots(transcription):
+    """Удалить скриншоты транскрипции: записи и файлы (вместе с миниатюрами и WebP)"""
+    import shutil
+    
+    transcription.screenshots.all().delete()
+    screenshots_dir = os.path.join(settings.MEDIA_ROOT, 'screenshots', str(transcription.id))
+    shutil.rmtree(screenshots_dir, ignore_errors=True)
+
+
+def wait_screenshot_stage(screenshot_thread):
+    """Дождаться извлечения слайдов, запущенного run_screenshot_stage"""
+    if screenshot_thread is not None and screenshot_thread.is_alive():
+        logger.info("Ожидание завершения извлечения слайдов")
+        screenshot_thread.join()
+
+
+def charge_completed_transcription(transcription):
+    """
+    Уменьшить баланс на 1 при успешном завершении транскрибации
+    
+    Returns:
+        tuple: (счетчик IP, счетчик UUID) - None, если получить не удалось
+    """
+    ip_counter = None
+    uuid_counter = None
+    try:
+        ip_counter = IPUploadCount.get_or_create_for_ip(transcription.ip_address)
+        if ip_counter.balance > 0:
+            ip_counter.balance -= 1
+            ip_counter.save()
+            logger.info(f"Баланс IP {transcription.ip_address} уменьшен на 1. Остаток: {ip_counter.balance}")
+        
+        if transcription.user_uuid:
+            uuid_counter = UUIDUploadCount.get_or_create_for_uuid(transcription.user_uuid)
+            if uuid_counter.balance > 0:
+                uuid_counter.balance -= 1
+                uuid_counter.save()
+                logger.info(f"Баланс UUID {transcription.user_uuid} уменьшен на 1. Остаток: {uuid_counter.balance}")
+    except Exception as e:
+        logger.error(f"Ошибка при уменьшении баланса: {e}", exc_info=True)
+    return ip_counter, uuid_counter
+
+
 def cleanup_old_files(current_transcription):
     """Удаляет старые файлы, сохраняя последние 2 загруженных файла (всегда, независимо от статуса)"""
     try:
@@ -863,11 +1131,20 @@ def cleanup_old_files(current_transcription):
         
         # Оставляем последние 2 файла, остальные удаляем
         transcriptions_to_delete = all_transcriptions[2:]
+        # Файлы из хранилища по содержимому могут быть общими с оставляемыми транскрипциями
+        kept_paths = {current_transcription.original_file_path}
+        kept_paths.update(t.original_file_path for t in all_transcriptions[:2])
         
         deleted_count = 0
         for transcription in transcriptions_to_delete:
             if transcription.original_file_path and os.path.exists(transcription.original_file_path):
                 try:
+                    if is_blob(transcription.original_file_path):
+                        if transcription.original_file_path not in kept_paths:
+                            os.remove(transcription.original_file_path)
+                            deleted_count += 1
+                            logger.info(f"Удален старый файл: {transcription.original_file_path}")
+                        continue
                     # Удаляем файл и его директорию
                     file_dir = os.path.dirname(transcription.original_file_path)
                     if os.path.exists(file_dir):
@@ -945,6 +1222,16 @@ def transcription_status(request, transcription_id):
             'requires_language_confirmation': requires_language_confirmation,
             'screenshot_status': transcription.screenshot_status if transcription.extract_screenshots else 'skipped',
             'screenshot_count': transcription.screenshots.count() if transcription.extract_screenshots else 0,
+            'queue_position': get_queue_position(transcription.id) if transcription.status == 'pending' else None,
+            'media_duration': transcription.media_duration,
+            'extraction_progress': transcription.extraction_progress if transcription.status == 'processing' else None,
+            'progress_seconds': transcription.progress_seconds,
+            'progress_percent': (
+                min(100, round(transcription.progress_seconds * 100 / transcription.media_duration))
+                if transcription.progress_seconds and transcription.media_duration else None
+            ),
+            # Частичный текст, распознанный к этому моменту
+            'partial_text': transcription.transcribed_text if transcription.status in ('processing', 'error') else None,
         })
     except Transcription.DoesNotExist:
         return JsonResponse({'error': 'Транскрипция не найдена'}, status=404)
@@ -1001,14 +1288,13 @@ def confirm_language(request, transcription_id):
         transcription.status = 'pending'  # Возвращаем в pending для продолжения обработки
         transcription.save(update_fields=['language_confirmed', 'status', 'selected_language'])
         
-        # Запускаем обработку заново
+        # Ставим обработку в очередь заново
         if transcription.original_file_path and os.path.exists(transcription.original_file_path):
-            thread = threading.Thread(target=process_file, args=(transcription.id, transcription.original_file_path))
-            thread.daemon = True
-            thread.start()
+            queue_position = enqueue_transcription(transcription.id, transcription.original_file_path)
             return JsonResponse({
                 'success': True,
-                'message': 'Язык подтвержден. Транскрибация продолжается.'
+                'message': 'Язык подтвержден. Транскрибация продолжается.',
+                'queue_position': queue_position
             })
         else:
             return JsonResponse({
@@ -1066,6 +1352,22 @@ def check_balance(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@require_http_methods(["GET"])
+def readiness(request):
+    """
+    Проверка готовности обработчиков очереди
+
+    200 - есть живой обработчик с предзагруженными моделями, 503 - нет.
+    В ответе перечислены загруженные («горячие») модели.
+    """
+    try:
+        state = get_readiness()
+    except Exception as e:
+        logger.error(f"Error checking readiness: {e}", exc_info=True)
+        return JsonResponse({'ready': False, 'error': str(e)}, status=503)
+    return JsonResponse(state, status=200 if state['ready'] else 503)
+
+
 @require_http_methods(["POST"])
 def logout_phrase(request):
     """Выход из режима фразы-пароля или смена фразы-пароля"""
@@ -1137,9 +1439,11 @@ def transcription_detail(request, transcription_id=None, public_token=None):
                 upload_session=transcription.upload_session
             ).exclude(id=transcription_id).order_by('uploaded_at')
         
-        # Разбиваем текст на части для комикса (по предложениям)
-        text_parts = []
-        if transcription.transcribed_text:
+        # Текст к слайдам берем по временным меткам сегментов; для старых
+        # транскрипций без сегментов - разбиваем текст на части по предложениям
+        screenshots = list(screenshots)
+        text_parts = segments_by_slides(transcription, [screenshot.timestamp for screenshot in screenshots]) or []
+        if not text_parts and transcription.transcribed_text:
             import re
             # Разбиваем по предложениям
             sentences = re.split(r'([.!?]+)', transcription.transcribed_text)
@@ -1234,6 +1538,14 @@ def download_text(request, transcription_id=None, public_token=None):
                 if not active_password_phrase or not transcription.check_password_phrase(active_password_phrase):
                     return HttpResponse("Доступ запрещен", status=403)
         
+        # Субтитры с временными метками (?format=srt) - для транскрипций с сегментами
+        if request.GET.get('format') == 'srt':
+            rows = transcription.segments.order_by('start', 'id').values_list('start', 'end', 'text')
+            if rows.exists():
+                response = HttpResponse(format_srt(rows), content_type='application/x-subrip; charset=utf-8')
+                response['Content-Disposition'] = f'attachment; filename="{transcription.filename}_transcription.srt"'
+                return response
+
         response = HttpResponse(transcription.transcribed_text or '', content_type='text/plain; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="{transcription.filename}_transcription.txt"'
         return response
@@ -1243,9 +1555,6 @@ def download_text(request, transcription_id=None, public_token=None):
 
 def download_screenshots(request, transcription_id=None, public_token=None):
     """Скачать все скриншоты как архив"""
-    import zipfile
-    import io
-    
     try:
         if public_token and public_token is not True:
             transcription = Transcription.objects.get(public_token=public_token)
@@ -1266,38 +1575,18 @@ def download_screenshots(request, transcription_id=None, public_token=None):
                 if not active_password_phrase or not transcription.check_password_phrase(active_password_phrase):
                     return HttpResponse("Доступ запрещен", status=403)
         
-        screenshots = transcription.screenshots.all().order_by('order', 'timestamp')
-        
-        if not screenshots:
+        if not transcription.screenshots.exists():
             return HttpResponse("Скриншоты не найдены", status=404)
         
-        # Создаем ZIP архив в памяти
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for screenshot in screenshots:
-                # Пробуем разные варианты путей
-                image_path = None
-                possible_paths = [
-                    os.path.join(settings.MEDIA_ROOT, screenshot.image_path),
-                    screenshot.image_path,  # Если путь уже абсолютный
-                    os.path.join(settings.MEDIA_ROOT, screenshot.image_path.lstrip('/')),
-                ]
-                
-                for path in possible_paths:
-                    if os.path.exists(path) and os.path.isfile(path):
-                        image_path = path
-                        break
-                
-                if image_path and os.path.exists(image_path):
-                    try:
-                        zip_file.write(image_path, f"screenshot_{screenshot.order:04d}_{screenshot.timestamp:.0f}s.jpg")
-                    except Exception as e:
-                        logger.warning(f"Не удалось добавить скриншот {image_path} в архив: {e}")
-                        continue
+        filename = f"{transcription.filename}_screenshots.zip"
+        # Архив, собранный при завершении транскрипции
+        response = serve_artifact(request, screenshots_archive_path(transcription), filename, 'application/zip')
+        if response is not None:
+            return response
         
-        zip_buffer.seek(0)
-        response = HttpResponse(zip_buffer.read(), content_type='application/zip')
-        response['Content-Disposition'] = f'attachment; filename="{transcription.filename}_screenshots.zip"'
+        # Архив собирается по мере отдачи, без сжатия (JPEG уже сжат)
+        response = StreamingHttpResponse(iter_zip(screenshot_archive_entries(transcription)), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
     except Transcription.DoesNotExist:
         return HttpResponse("Транскрипция не найдена", status=404)
@@ -1390,18 +1679,22 @@ def retranscribe(request, transcription_id):
         transcription.error_message = None
         transcription.transcription_logs = None  # Очищаем старые логи
         transcription.save()
+        transcription.segments.all().delete()  # Не продолжать с контрольной точки прошлого запуска
+        if transcription.screenshot_status != 'completed':
+            # Готовые слайды от модели не зависят и остаются, недоизвлеченные удаляем
+            delete_screenshots(transcription)
+        invalidate_artifacts(transcription)  # Архив и текст сессии соберутся заново по завершении
         
-        # Запускаем обработку в отдельном потоке
-        thread = threading.Thread(target=process_file, args=(transcription.id, original_file_path))
-        thread.daemon = True
-        thread.start()
+        # Ставим обработку в очередь
+        queue_position = enqueue_transcription(transcription.id, original_file_path)
         
         logger.info(f"Перетранскрибация запущена: ID={transcription_id}, модель={new_model}, файл={original_file_path}")
         
         return JsonResponse({
             'success': True,
             'message': f'Перетранскрибация запущена с моделью {new_model}',
-            'transcription_id': transcription.id
+            'transcription_id': transcription.id,
+            'queue_position': queue_position
         })
         
     except Transcription.DoesNotExist:
@@ -1522,16 +1815,15 @@ def download_session_text(request, upload_session):
                 if not active_password_phrase or not transcription.check_password_phrase(active_password_phrase):
                     return HttpResponse("Доступ запрещен", status=403)
         
-        # Объединяем все тексты
-        all_texts = []
-        for transcription in transcriptions:
-            if transcription.transcribed_text:
-                all_texts.append(f"=== {transcription.filename} ===\n{transcription.transcribed_text}\n\n")
+        filename = f"session_{upload_session[:8]}_all_transcriptions.txt"
+        # Текст, собранный при завершении последней транскрипции сессии
+        response = serve_artifact(request, session_text_path(upload_session), filename, 'text/plain; charset=utf-8')
+        if response is not None:
+            return response
         
-        combined_text = "\n".join(all_texts)
-        
-        response = HttpResponse(combined_text, content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="session_{upload_session[:8]}_all_transcriptions.txt"'
+        # Объединяем все тексты
+        response = HttpResponse(session_text(transcriptions), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
     except Exception as e:
         return HttpResponse(f"Ошибка: {str(e)}", status=500)
@@ -1595,6 +1887,9 @@ def clear_disk(request):
             except Exception as e:
                 logger.error(f"Ошибка при очистке директории скриншотов: {e}")
         
+        # Готовые архивы и тексты для скачивания
+        shutil.rmtree(ARTIFACTS_DIR, ignore_errors=True)
+        
         logger.info(f"Диск очищен: удалено транскрипций: {deleted_count}, скриншотов: {screenshots_deleted}")
         
         return JsonResponse({
@@ -1638,8 +1933,10 @@ def transcription_view(request, transcription_id=None, public_token=None):
         screenshots = list(transcription.screenshots.all().order_by('order', 'timestamp'))
         screenshot_count = len(screenshots)
         
-        text_blocks = []
-        if transcription.transcribed_text:
+        # Текст к скриншотам - по временным меткам сегментов, а для старых
+        # транскрипций без сегментов - равными порциями предложений
+        text_blocks = segments_by_slides(transcription, [screenshot.timestamp for screenshot in screenshots]) or []
+        if not text_blocks and transcription.transcribed_text:
             if screenshot_count > 0:
                 text = transcription.transcribed_text.strip()
                 sentences = re.split(r'([.!?]+(?:\s|$))', text)
@@ -1697,8 +1994,6 @@ def upload_from_url(request):
     from .upload_url import download_from_url
     from django.conf import settings
     import os
-    import threading
-    from .views import process_file
     import logging
     
     logger = logging.getLogger(__name__)
@@ -1780,16 +2075,11 @@ def upload_from_url(request):
                     os.unlink(temp_file_path)
                     continue
                 
-                uploads_base_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-                os.makedirs(uploads_base_dir, exist_ok=True)
-                file_uuid = str(uuid.uuid4())
-                uploads_dir = os.path.join(uploads_base_dir, file_uuid)
-                os.makedirs(uploads_dir, exist_ok=True)
                 file_ext = os.path.splitext(filename)[1]
-                original_filename = f"original{file_ext}"
-                original_file_path = os.path.join(uploads_dir, original_filename)
-                shutil.copy2(temp_file_path, original_file_path)
-                os.unlink(temp_file_path)
+                try:
+                    original_file_path, content_hash, _, _ = store_file(temp_file_path, file_ext)
+                finally:
+                    os.unlink(temp_file_path)
                 
                 transcription = Transcription.objects.create(
                     filename=filename,
@@ -1802,16 +2092,15 @@ def upload_from_url(request):
                     whisper_model=whisper_model,
                     status='pending',
                     upload_session=upload_session,
-                    original_file_path=original_file_path
+                    original_file_path=original_file_path,
+                    content_hash=content_hash
                 )
                 
                 transcription_ids.append(transcription.id)
                 ip_counter.increment_upload()
                 uuid_counter.increment_upload()
                 
-                thread = threading.Thread(target=process_file, args=(transcription.id, original_file_path))
-                thread.daemon = True
-                thread.start()
+                enqueue_transcription(transcription.id, original_file_path)
                 
             except Exception as e:
                 logger.error(f"Ошибка при обработке URL {url}: {e}", exc_info=True)
@@ -0,0 +1,178 @@
+"""
+Пул отдельных процессов-обработчиков очереди транскрибации
+
+Каждый процесс держит собственный кэш моделей Whisper, привязан к своему
+набору ядер CPU и забирает задачи из общей очереди в БД. Тяжелая работа
+(ffmpeg, OpenCV, декодирование) не конкурирует за GIL с веб-запросами.
+
+Модуль не импортирует Django-модели на верхнем уровне: дочерние процессы
+запускаются через spawn и вызывают django.setup() сами.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """Список ядер, доступных текущему процессу"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_cpu_sets(process_count, cpus_per_process=0, cpus=None):
+    """
+    Разбить доступные ядра между процессами
+
+    Args:
+        process_count: Количество процессов
+        cpus_per_process: Ядер на процесс (0 - поделить поровну)
+        cpus: Список ядер (по умолчанию - доступные процессу)
+
+    Returns:
+        list: Наборы ядер для каждого процесса
+    """
+    cpus = list(cpus if cpus is not None else available_cpus())
+    if process_count <= 0 or not cpus:
+        return []
+    per_process = cpus_per_process or max(1, len(cpus) // process_count)
+    cpu_sets = []
+    for index in range(process_count):
+        start = (index * per_process) % len(cpus)
+        cpu_set = [cpus[(start + offset) % len(cpus)] for offset in range(min(per_process, len(cpus)))]
+        cpu_sets.append(sorted(set(cpu_set)))
+    return cpu_sets
+
+
+def pin_to_cpus(cpu_set):
+    """Привязать текущий процесс к набору ядер (если ОС поддерживает)"""
+    if not cpu_set or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, cpu_set)
+        return True
+    except OSError as e:
+        logger.warning(f"Не удалось привязать процесс к ядрам {cpu_set}: {e}")
+        return False
+
+
+def worker_process_main(index, cpu_set, threads, screenshot_threads, preload_models=None):
+    """Точка входа дочернего процесса-обработчика"""
+    pinned = pin_to_cpus(cpu_set)
+    if cpu_set and 'WHISPER_CPU_THREADS' not in os.environ:
+        # CTranslate2 не должен запускать больше потоков, чем ядер у процесса
+        os.environ['WHISPER_CPU_THREADS'] = str(max(1, len(cpu_set) // max(1, threads)))
+
+    import django
+    django.setup()
+
+    from transcribe import job_queue
+
+    executor = job_queue.configure_executor(
+        max_workers=threads,
+        screenshot_workers=screenshot_threads,
+        worker_id=f"{job_queue.make_worker_id()}:p{index}",
+        preload_models=preload_models,
+    )
+
+    def shutdown(signum, frame):
+        executor.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает родитель
+
+    executor.start()
+    logger.info(
+        f"Процесс-обработчик {executor.worker_id} запущен, ядра: {cpu_set if pinned else 'все'}, "
+        f"потоков CTranslate2: {os.environ.get('WHISPER_CPU_THREADS', 'по умолчанию')}"
+    )
+    executor.wait()
+
+
+class WorkerProcessPool:
+    """
+    Запускает процессы-обработчики и перезапускает упавшие
+
+    Процессы не демонические: обработчику нужны свои дочерние процессы
+    (параллельный поиск слайдов), а демоническим процессам их создавать нельзя.
+    Поэтому пул всегда останавливается через stop() - из обработчика сигнала
+    команды transcribe_worker или при выходе веб-процесса (atexit).
+    """
+
+    def __init__(self, processes, threads_per_process=1, screenshot_threads=1, cpus_per_process=0,
+                 restart_delay=5, preload_models=None):
+        self.processes = max(1, int(processes))
+        self.threads_per_process = max(1, int(threads_per_process))
+        self.screenshot_threads = max(1, int(screenshot_threads))
+        self.cpu_sets = plan_cpu_sets(self.processes, cpus_per_process)
+        self.restart_delay = restart_delay
+        self.preload_models = preload_models  # None - из настроек WHISPER_PRELOAD_MODELS
+        self._context = multiprocessing.get_context('spawn')
+        self._children = {}
+        self._stop_event = threading.Event()
+
+    def _spawn(self, index):
+        cpu_set = self.cpu_sets[index] if index < len(self.cpu_sets) else []
+        process = self._context.Process(
+            target=worker_process_main,
+            args=(index, cpu_set, self.threads_per_process, self.screenshot_threads, self.preload_models),
+            name=f"transcribe-process-{index}",
+            daemon=False,
+        )
+        process.start()
+        self._children[index] = process
+        logger.info(f"Запущен процесс-обработчик {index} (PID {process.pid}), ядра: {cpu_set or 'все'}")
+
+    def start(self):
+        """Запустить все процессы"""
+        for index in range(self.processes):
+            self._spawn(index)
+
+    def supervise(self, interval=5):
+        """Следить за процессами и перезапускать упавшие (блокирует до stop())"""
+        while not self._stop_event.wait(interval):
+            for index, process in list(self._children.items()):
+                if not process.is_alive() and not self._stop_event.is_set():
+                    logger.error(f"Процесс-обработчик {index} завершился с кодом {process.exitcode}, перезапуск")
+                    if self._stop_event.wait(self.restart_delay):
+                        break
+                    self._spawn(index)
+
+    def start_background(self):
+        """Запустить процессы и наблюдение за ними в фоновом потоке (для веб-процесса)"""
+        # Выход веб-процесса ждет недемонические дочерние процессы - останавливаем их сами.
+        # atexit вызывает обработчики в обратном порядке, поэтому stop() выполнится
+        # раньше ожидания дочерних процессов в multiprocessing
+        atexit.register(self.stop)
+        self.start()
+        thread = threading.Thread(target=self.supervise, name="transcribe-process-supervisor", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self, timeout=None):
+        """
+        Остановить процессы: SIGTERM, ожидание, затем SIGKILL
+
+        По умолчанию ждем чуть дольше TRANSCRIBE_STOP_TIMEOUT - столько
+        процесс-обработчик ждет завершения своих текущих задач.
+        """
+        if timeout is None:
+            from django.conf import settings
+            timeout = getattr(settings, 'TRANSCRIBE_STOP_TIMEOUT', 30) + 10
+        self._stop_event.set()
+        for process in self._children.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._children.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Процесс-обработчик {process.name} (PID {process.pid}) не остановился, SIGKILL")
+                process.kill()
+                process.join()
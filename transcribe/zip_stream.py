@@ -0,0 +1,70 @@
+"""
+Потоковая сборка ZIP архива
+
+Архив отдается по частям по мере чтения файлов: записи пишутся без сжатия
+(ZIP_STORED - JPEG уже сжат), размеры и контрольные суммы записываются после
+данных каждой записи, поэтому архив не собирается целиком ни в памяти, ни на
+диске и скачивание начинается сразу.
+"""
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ZIP_STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class _StreamBuffer:
+    """Файлоподобный приемник без seek: накопленные байты забирает генератор"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Отдать накопленные байты (если есть)"""
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+def iter_zip(entries, chunk_size=ZIP_STREAM_CHUNK_SIZE):
+    """
+    Собрать ZIP архив из файлов на диске, отдавая его по частям
+
+    Args:
+        entries: Пары (путь к файлу, имя в архиве); файлы, которые не удалось
+                 открыть, пропускаются
+
+    Yields:
+        bytes: Очередная часть архива
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for path, arcname in entries:
+            try:
+                source = open(path, 'rb')
+            except OSError as e:
+                logger.warning(f"Не удалось добавить файл {path} в архив: {e}")
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_STORED
+                with zip_file.open(info, 'w', force_zip64=os.fstat(source.fileno()).st_size >= zipfile.ZIP64_LIMIT) as entry:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        yield from buffer.drain()
+            yield from buffer.drain()
+    # Центральный каталог записывается при закрытии архива
+    yield from buffer.drain()
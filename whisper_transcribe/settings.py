@@ -143,6 +143,77 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 МБ - файлы больше бу
 DATA_UPLOAD_MAX_MEMORY_SIZE = None  # Без ограничений
 DATA_UPLOAD_MAX_NUMBER_FIELDS = None  # Без ограничений
 FILE_UPLOAD_TEMP_DIR = '/tmp'  # Временная директория для больших файлов
+# Большие файлы пишутся сразу в хранилище загрузок (BLOB_STORE_DIR) с подсчетом хеша,
+# без промежуточной копии в FILE_UPLOAD_TEMP_DIR
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'transcribe.blob_store.BlobUploadHandler',
+]
+
+# Очередь транскрибации
+# faster-whisper по умолчанию использует 4 потока CPU на одну транскрибацию
+TRANSCRIBE_MAX_WORKERS = max(1, (os.cpu_count() or 1) // 4)  # Одновременных транскрибаций
+SCREENSHOT_MAX_WORKERS = 1  # Одновременных извлечений слайдов
+# Длинное видео делится на диапазоны (не короче SCREENSHOT_RANGE_MIN_SECONDS секунд),
+# слайды в которых ищутся в отдельных процессах
+SCREENSHOT_PARALLEL_RANGES = min(4, os.cpu_count() or 1)
+SCREENSHOT_RANGE_MIN_SECONDS = 300
+# thread - потоки внутри веб-процесса, process - отдельные процессы-обработчики,
+# external - только `manage.py transcribe_worker`
+TRANSCRIBE_EXECUTION_MODE = 'thread'
+# Запускать обработчики из веб-сервера (режимы thread и process). При нескольких веб-процессах
+# (gunicorn --workers N) их запускает только один - захвативший TRANSCRIBE_WEB_WORKERS_LOCK,
+# поэтому лимиты выше действуют на хост. False - обработчики только в `manage.py transcribe_worker`
+TRANSCRIBE_WEB_WORKERS = os.environ.get('TRANSCRIBE_WEB_WORKERS', '1') != '0'
+TRANSCRIBE_WORKER_PROCESSES = 2  # Процессов-обработчиков в режиме process
+TRANSCRIBE_CPUS_PER_PROCESS = 0  # Ядер на процесс (0 - поделить поровну)
+WHISPER_CPU_THREADS = int(os.environ.get('WHISPER_CPU_THREADS', 0))  # Потоков CTranslate2 (0 - по умолчанию)
+TRANSCRIBE_JOB_LEASE_SECONDS = 300  # Аренда задачи; продлевается пока обработчик жив
+TRANSCRIBE_JOB_MAX_ATTEMPTS = 3  # Сколько раз подхватывать задачу после сбоя обработчика
+TRANSCRIBE_POLL_INTERVAL = 5  # Интервал опроса очереди (сек)
+TRANSCRIBE_STOP_TIMEOUT = 30  # Ожидание текущих задач при остановке; незавершенные ждут истечения аренды
+
+# Кэш моделей Whisper: при превышении бюджета простаивающие модели выгружаются (LRU)
+WHISPER_MODEL_CACHE_MB = int(os.environ.get('WHISPER_MODEL_CACHE_MB', 4096))
+# Модели, загружаемые при старте обработчика (через запятую в переменной окружения)
+WHISPER_PRELOAD_MODELS = [name for name in os.environ.get('WHISPER_PRELOAD_MODELS', 'base').split(',') if name]
+WHISPER_WARMUP = True  # Прогреть предзагруженные модели коротким декодированием тишины
+# Извлечение аудио через ffmpeg (запасной путь): лимит времени пропорционален длине записи
+EXTRACT_AUDIO_MIN_TIMEOUT = 300  # Минимальный лимит (сек)
+EXTRACT_AUDIO_TIMEOUT_RATIO = 0.5  # Секунд на секунду записи
+EXTRACT_AUDIO_STALL_TIMEOUT = 120  # Остановить ffmpeg, если он столько секунд не сообщает о прогрессе
+# Определение языка по началу записи до тяжелой обработки
+LANGUAGE_DETECTION_SECONDS = 30
+LANGUAGE_DETECTION_MODEL = None  # None - модель транскрипции; 'tiny' - быстрее, но менее точно
+# Анализ речи (Silero VAD) перед декодированием: тишина пропускается, декодируются только участки речи
+TRANSCRIBE_VAD_PARAMETERS = {'threshold': 0.3, 'min_silence_duration_ms': 100, 'speech_pad_ms': 400}
+TRANSCRIBE_VAD_FULL_DECODE_RATIO = 0.9  # Доля речи, при которой запись декодируется целиком
+# Длинные записи делятся по паузам на части, которые декодируются одновременно.
+# Каждая часть использует WHISPER_CPU_THREADS потоков, веса модели общие
+TRANSCRIBE_PARALLEL_CHUNKS = int(os.environ.get('TRANSCRIBE_PARALLEL_CHUNKS', max(1, (os.cpu_count() or 1) // 8)))
+TRANSCRIBE_CHUNK_SECONDS = 300  # Секунд речи в одной части
+TRANSCRIBE_PARALLEL_MIN_SECONDS = 600  # Записи с меньшим объемом речи декодируются одним проходом
+# Частичный результат сохраняется каждые N сегментов или каждые N секунд
+SEGMENT_FLUSH_BATCH = 50
+SEGMENT_FLUSH_INTERVAL = 5
+# Короткие записи одновременных задач с одной моделью и языком декодируются общим пакетом
+TRANSCRIBE_BATCHING = True
+TRANSCRIBE_BATCH_MAX_SECONDS = 120  # Записи с большим объемом речи в пакет не попадают
+TRANSCRIBE_BATCH_MAX_SIZE = 16  # Участков (до 30 с) в одном пакете
+TRANSCRIBE_BATCH_MAX_WAIT = 0.5  # Сколько ждать попутчиков (сек)
+# Загруженные файлы хранятся по хешу содержимого: одинаковые файлы - один раз
+BLOB_STORE_DIR = os.path.join(MEDIA_ROOT, 'blobs')
+# Загрузка по частям: размер части, файлы больше порога интерфейс загружает частями,
+# брошенные загрузки удаляются через CHUNKED_UPLOAD_EXPIRE_HOURS часов
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_THRESHOLD = 100 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRE_HOURS = 24
+# Готовый результат для того же файла, модели, языка и VAD копируется без декодирования
+TRANSCRIBE_RESULT_CACHE = True
+# Архив скриншотов и текст сессии собираются при завершении транскрибации и отдаются с диска.
+# ARTIFACTS_ACCEL_REDIRECT - internal location nginx для ARTIFACTS_DIR (None - файлы отдает Django)
+ARTIFACTS_DIR = os.path.join(MEDIA_ROOT, 'artifacts')
+ARTIFACTS_ACCEL_REDIRECT = None
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'whisper_transcribe.settings')
 
 application = get_wsgi_application()
+
+# Обработчики очереди транскрибации внутри веб-процесса (TRANSCRIBE_EXECUTION_MODE = 'thread')
+from transcribe.job_queue import start_inprocess_workers  # noqa: E402
+
+start_inprocess_workers()